@@ -2,34 +2,147 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import errno
+import itertools
+import json
 import os
 import posixpath
+import Queue
 import re
+import select
+import socket
 import subprocess
+import tarfile
 import tempfile
+import threading
 import time
 import traceback
+from collections import deque, namedtuple
+
+from adb_client import ADBClient, ADBClientError
+
+
+def wait_for_process(proc, timeout, streams=()):
+    """Waits for the subprocess proc to exit, killing it if it has not
+    exited within timeout seconds.
+
+    A helper thread blocks in proc.wait() and signals the caller through
+    a pipe when the process exits so that the caller wakes as soon as
+    the process completes rather than polling the process.
+
+    :param proc: subprocess Process object.
+    :param timeout: The maximum time in seconds to wait.
+    :param streams: list of tuples (pipe, file_obj). Output read from
+        each of the process's pipes while waiting is written to the
+        corresponding file_obj. The pipes are closed on return.
+    :returns: tuple (exitcode, timedout).
+
+    """
+    pipes = dict((pipe.fileno(), file_obj) for pipe, file_obj in streams)
+    read_fd, write_fd = os.pipe()
+
+    def waiter():
+        try:
+            proc.wait()
+        finally:
+            os.write(write_fd, 'x')
+
+    thread = threading.Thread(target=waiter, name='wait-%d' % proc.pid)
+    thread.daemon = True
+    thread.start()
+    try:
+        deadline = time.time() + timeout
+        exited = False
+        timedout = False
+        while True:
+            if exited:
+                # Drain what the process wrote before exiting without
+                # waiting on pipes which may be held open by its children.
+                select_timeout = 0
+            elif timedout:
+                select_timeout = None
+            else:
+                select_timeout = max(0, deadline - time.time())
+            fds = pipes.keys()
+            if not exited:
+                fds.append(read_fd)
+            try:
+                readable = select.select(fds, [], [], select_timeout)[0]
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                continue
+            if not readable:
+                if exited:
+                    break
+                timedout = True
+                try:
+                    proc.kill()
+                except OSError:
+                    pass
+                continue
+            for fd in readable:
+                if fd == read_fd:
+                    exited = True
+                    continue
+                data = os.read(fd, 65536)
+                if data:
+                    pipes[fd].write(data)
+                else:
+                    del pipes[fd]
+            if exited and not pipes:
+                break
+        thread.join()
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+        for pipe, file_obj in streams:
+            pipe.close()
+    return proc.returncode, timedout
 
 
 class ADBProcess(object):
     """ADBProcess encapsulates the data related to executing the adb process.
 
+    The process's stdout and stderr are read from pipes into buffers
+    which are held in memory until they exceed output_buffer_size bytes
+    at which point they are spilled to temporary files.
+
     """
-    def __init__(self, args):
+    #: Default size in bytes of the in memory stdout and stderr buffers.
+    OUTPUT_BUFFER_SIZE = 1024*1024
+
+    def __init__(self, args, output_buffer_size=None):
+        if output_buffer_size is None:
+            output_buffer_size = self.OUTPUT_BUFFER_SIZE
         #: command argument argument list.
         self.args = args
-        #: Temporary file handle to be used for stdout.
-        self.stdout_file = tempfile.TemporaryFile()
-        #: Temporary file handle to be used for stderr.
-        self.stderr_file = tempfile.TemporaryFile()
+        #: Spooled temporary file handle to be used for stdout.
+        self.stdout_file = tempfile.SpooledTemporaryFile(
+            max_size=output_buffer_size)
+        #: Spooled temporary file handle to be used for stderr.
+        self.stderr_file = tempfile.SpooledTemporaryFile(
+            max_size=output_buffer_size)
         #: boolean indicating if the command timed out.
         self.timedout = None
         #: exitcode of the process.
         self.exitcode = None
         #: subprocess Process object used to execute the command.
         self.proc = subprocess.Popen(args,
-                                     stdout=self.stdout_file,
-                                     stderr=self.stderr_file)
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+
+    def wait(self, timeout):
+        """Waits for the process to exit while capturing its output.
+
+        :param timeout: The maximum time in seconds to wait before the
+            process is killed.
+        :returns: tuple (exitcode, timedout).
+
+        """
+        return wait_for_process(self.proc, timeout,
+                                streams=[(self.proc.stdout, self.stdout_file),
+                                         (self.proc.stderr, self.stderr_file)])
 
     @property
     def stdout(self):
@@ -55,6 +168,38 @@ class ADBProcess(object):
         return ('args: %s, exitcode: %s, stdout: %s, stderr: %s' % (
             ' '.join(self.args), self.exitcode, self.stdout, self.stderr))
 
+
+class ADBSessionProcess(ADBProcess):
+    """ADBSessionProcess provides the ADBProcess interface for a shell
+    command which was not executed in its own adb process but in a
+    persistent ADBShellSession or via the adb server socket.
+
+    """
+    def __init__(self, args, output='', exitcode=None, timedout=None):
+        #: command argument argument list.
+        self.args = args
+        #: Spooled temporary file handle containing the command's output.
+        self.stdout_file = tempfile.SpooledTemporaryFile(
+            max_size=self.OUTPUT_BUFFER_SIZE)
+        #: Spooled temporary file handle to be used for stderr.
+        self.stderr_file = tempfile.SpooledTemporaryFile(
+            max_size=self.OUTPUT_BUFFER_SIZE)
+        #: boolean indicating if the command timed out.
+        self.timedout = timedout
+        #: exitcode of the command.
+        self.exitcode = exitcode
+        #: There is no process associated with a session command.
+        self.proc = None
+        self.stdout_file.write(output)
+        self.stdout_file.seek(0, os.SEEK_SET)
+
+#: ADBShellResult is the result of one command executed by
+#: ADBDevice.shell_batch. exitcode is None if the command was not run.
+ADBShellResult = namedtuple("ADBShellResult",
+                            ["cmd",
+                             "output",
+                             "exitcode"])
+
 # ADBError, ADBRootError, and ADBTimeoutError are treated
 # differently in order that unhandled ADBRootErrors and
 # ADBTimeoutErrors can be handled distinctly from ADBErrors.
@@ -99,6 +244,230 @@ class ADBTimeoutError(Exception):
     pass
 
 
+class ADBShellSession(object):
+    """ADBShellSession maintains a long lived interactive adb shell on a
+    device in which shell commands can be executed without spawning a
+    new adb process for each command.
+
+    Each command is executed in a subshell and is framed by unique
+    begin and end markers which are echoed by the device. The end
+    marker carries the exit code of the command as rc=N. The markers
+    are split with empty quotes on the command line so that a terminal
+    echo of the command can not be mistaken for the markers.
+
+    """
+    MARKER = 'ADBSESSION'
+
+    def __init__(self, args):
+        #: command argument list used to start the adb shell.
+        self.args = args
+        #: subprocess Process object for the adb shell.
+        self.proc = None
+        #: boolean indicating if the last command was started by the shell.
+        self.started = False
+        #: pool generation in which the session was created.
+        self.generation = 0
+        self._sequence = 0
+
+    def is_alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        self.stop()
+        self.proc = subprocess.Popen(self.args,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT,
+                                     close_fds=True)
+
+    def stop(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.kill()
+        except OSError:
+            pass
+        self.proc.wait()
+        self.proc.stdin.close()
+        self.proc.stdout.close()
+        self.proc = None
+
+    def run(self, cmd, timeout):
+        """Executes cmd in the session.
+
+        :param str cmd: The shell command to be executed.
+        :param integer timeout: The maximum time in seconds to wait for
+            the command to complete.
+        :returns: tuple (output, exitcode) where exitcode is None if
+            the command timed out.
+        :raises: EOFError if the adb shell exited.
+
+        """
+        if not self.is_alive():
+            self.start()
+        self._sequence += 1
+        token = '%s-%d-%d' % (self.MARKER, self.proc.pid, self._sequence)
+        begin_re = re.compile(r'%s-BEGIN\r?\n' % token)
+        end_re = re.compile(r'%s-END rc=([0-9]+)\r?\n' % token)
+        marker = '%s""%s' % (token[:3], token[3:])
+        self.started = False
+        try:
+            self.proc.stdin.write('echo %s-BEGIN; ( %s ); echo %s-END rc=$?\n' %
+                                  (marker, cmd, marker))
+            self.proc.stdin.flush()
+        except (IOError, OSError):
+            raise EOFError('adb shell session exited: %s' % ' '.join(self.args))
+
+        fd = self.proc.stdout.fileno()
+        start_time = time.time()
+        output = ''
+        begin = None
+        search_pos = 0
+        while True:
+            if begin is None:
+                match = begin_re.search(output)
+                if match:
+                    begin = search_pos = match.end()
+                    self.started = True
+            if begin is not None:
+                match = end_re.search(output, search_pos)
+                if match:
+                    return output[begin:match.start()], int(match.group(1))
+                # Only rescan the tail which may contain a partial marker.
+                search_pos = max(begin, len(output) - len(token) - 16)
+            remaining = timeout - (time.time() - start_time)
+            if remaining <= 0:
+                return output[begin or 0:], None
+            readable = select.select([fd], [], [], remaining)[0]
+            if not readable:
+                continue
+            data = os.read(fd, 8192)
+            if not data:
+                raise EOFError('adb shell session exited: %s' %
+                               ' '.join(self.args))
+            output += data
+
+
+class ADBLogcatReader(object):
+    """ADBLogcatReader continuously reads the output of a long running
+    adb logcat in a background thread into a bounded ring buffer.
+
+    Each line is stripped, decoded as UTF-8 and assigned a
+    monotonically increasing sequence number starting at 0 so that
+    consumers can retrieve only the lines which arrived since their
+    last read without dumping and re-diffing the device's logcat.
+
+    ::
+
+       reader = ADBLogcatReader(['adb', '-s', serial, 'logcat', '-v', 'time'])
+       reader.start()
+       lines, seq, lost = reader.read(0)
+       ...
+       lines, seq, lost = reader.read(seq)
+       reader.stop()
+
+    Note that adb logcat without -d first outputs the existing contents
+    of the device's logcat buffer before following new output.
+
+    """
+    MAX_LINES = 100000
+
+    def __init__(self, args, max_lines=None):
+        #: command argument list used to start adb logcat.
+        self.args = args
+        #: subprocess Process object for adb logcat.
+        self.proc = None
+        self._lines = deque(maxlen=max_lines or self.MAX_LINES)
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._eof = True
+
+    def is_alive(self):
+        return not self._eof
+
+    def start(self):
+        self.stop()
+        self._eof = False
+        self.proc = subprocess.Popen(self.args,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT,
+                                     close_fds=True)
+        self._thread = threading.Thread(target=self._reader,
+                                        args=(self.proc,),
+                                        name='ADBLogcatReader')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.kill()
+        except OSError:
+            pass
+        self.proc.wait()
+        self._thread.join()
+        self.proc.stdout.close()
+        self.proc = None
+
+    def _reader(self, proc):
+        try:
+            for line in iter(proc.stdout.readline, ''):
+                line = unicode(line, 'UTF-8', errors='replace').strip()
+                if not line:
+                    continue
+                with self._condition:
+                    self._lines.append(line)
+                    self._sequence += 1
+                    self._condition.notify_all()
+        except (IOError, OSError, ValueError):
+            pass
+        finally:
+            with self._condition:
+                self._eof = True
+                self._condition.notify_all()
+
+    def wait(self, sequence, timeout):
+        """Waits until the line with sequence number sequence has been
+        read, the adb logcat exits or timeout seconds have elapsed.
+
+        :returns: boolean - True if the line is available.
+
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while self._sequence <= sequence and not self._eof:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return self._sequence > sequence
+
+    def read(self, sequence):
+        """Returns the lines whose sequence numbers are greater than or
+        equal to sequence.
+
+        :param integer sequence: sequence number of the first line to
+            be returned. This is the sequence number returned by the
+            previous call to read or 0.
+        :returns: tuple (lines, next_sequence, lost) where lines is the
+            list of new lines, next_sequence is the sequence number to
+            be used for the next read and lost is the number of lines
+            which were dropped from the ring buffer before they could
+            be read.
+
+        """
+        with self._condition:
+            first = self._sequence - len(self._lines)
+            lost = max(0, first - sequence)
+            count = self._sequence - max(sequence, first)
+            lines = list(itertools.islice(reversed(self._lines), count))
+            next_sequence = self._sequence
+        lines.reverse()
+        return lines, next_sequence, lost
+
+
 class ADBCommand(object):
     """ADBCommand provides a basic interface to adb commands
     which is used to provide the 'command' methods for the
@@ -126,7 +495,9 @@ class ADBCommand(object):
                  adb_port=None,
                  logger_name='adb',
                  timeout=300,
-                 verbose=False):
+                 verbose=False,
+                 use_socket=False,
+                 output_buffer_size=None):
         """Initializes the ADBCommand object.
 
         :param str adb: path to adb executable. Defaults to 'adb'.
@@ -135,6 +506,13 @@ class ADBCommand(object):
         :param adb_port: port of the adb server.
         :type adb_port: integer or None
         :param str logger_name: logging logger name. Defaults to 'adb'.
+        :param bool use_socket: Flag specifying if supported commands
+            should talk to the adb server directly over its socket
+            rather than spawning adb. Defaults to False.
+        :param output_buffer_size: size in bytes above which the
+            output of an adb process is spilled from memory to a
+            temporary file. Defaults to ADBProcess.OUTPUT_BUFFER_SIZE.
+        :type output_buffer_size: integer or None
 
         :raises: * ADBError
                  * ADBTimeoutError
@@ -149,7 +527,13 @@ class ADBCommand(object):
         self._adb_host = adb_host
         self._adb_port = adb_port
         self._timeout = timeout
-        self._polling_interval = 0.1
+        self._output_buffer_size = output_buffer_size
+        self._use_socket = use_socket
+        if use_socket:
+            self._client = ADBClient(adb_host=adb_host, adb_port=adb_port,
+                                     timeout=timeout)
+        else:
+            self._client = None
 
         self._logger.debug("%s: %s" % (self.__class__.__name__,
                                        self.__dict__))
@@ -162,6 +546,23 @@ class ADBCommand(object):
         except Exception, exc:
             raise ADBError('%s: %s is not executable.' % (exc, adb))
 
+    def _client_request(self, method, *args, **kwargs):
+        """Calls the ADBClient method returning a tuple (True, result)
+        or (False, None) if the request failed and the caller should
+        fall back to the adb executable.
+
+        :raises: ADBTimeoutError
+
+        """
+        try:
+            return True, method(*args, **kwargs)
+        except socket.timeout, e:
+            raise ADBTimeoutError('%s%s: %s' % (method.__name__, args, e))
+        except (socket.error, ADBClientError), e:
+            self._logger.debug('%s%s: falling back to adb: %s' % (
+                method.__name__, args, e))
+            return False, None
+
     def _get_logger(self, logger_name):
         logger = None
         try:
@@ -205,12 +606,14 @@ class ADBCommand(object):
         The caller provides a list containing commands, as well as a
         timeout period in seconds.
 
-        A subprocess is spawned to execute adb with stdout and stderr
-        directed to temporary files. If the process takes longer than
-        the specified timeout, the process is terminated.
+        A subprocess is spawned to execute adb. Its stdout and stderr
+        are read from pipes into spooled temporary files which are held
+        in memory until they exceed output_buffer_size bytes. A helper
+        thread waits for the process to exit. If the process takes
+        longer than the specified timeout, the process is killed.
 
         It is the caller's responsibilty to clean up by closing
-        the stdout and stderr temporary files.
+        the stdout and stderr spooled temporary files.
 
         """
         args = [self._adb_path]
@@ -222,21 +625,15 @@ class ADBCommand(object):
             args.extend(['-s', device_serial, 'wait-for-device'])
         args.extend(cmds)
 
-        adb_process = ADBProcess(args)
+        adb_process = ADBProcess(args,
+                                 output_buffer_size=self._output_buffer_size)
 
         if timeout is None:
             timeout = self._timeout
 
-        start_time = time.time()
-        adb_process.exitcode = adb_process.proc.poll()
-        while ((time.time() - start_time) <= timeout and
-               adb_process.exitcode == None):
-            time.sleep(self._polling_interval)
-            adb_process.exitcode = adb_process.proc.poll()
-        if adb_process.exitcode == None:
-            adb_process.proc.kill()
+        adb_process.exitcode, timedout = adb_process.wait(timeout)
+        if timedout:
             adb_process.timedout = True
-            adb_process.exitcode = adb_process.proc.poll()
 
         adb_process.stdout_file.seek(0, os.SEEK_SET)
         adb_process.stderr_file.seek(0, os.SEEK_SET)
@@ -291,7 +688,7 @@ class ADBCommand(object):
 
             return output
         finally:
-            if adb_process and isinstance(adb_process.stdout_file, file):
+            if adb_process:
                 adb_process.stdout_file.close()
                 adb_process.stderr_file.close()
 
@@ -314,7 +711,9 @@ class ADBHost(ADBCommand):
                  adb_port=None,
                  logger_name='adb',
                  timeout=300,
-                 verbose=False):
+                 verbose=False,
+                 use_socket=False,
+                 output_buffer_size=None):
         """Initializes the ADBHost object.
 
         :param str adb: path to adb executable. Defaults to 'adb'.
@@ -323,6 +722,12 @@ class ADBHost(ADBCommand):
         :param adb_port: port of the adb server.
         :type adb_port: integer or None
         :param str logger_name: logging logger name. Defaults to 'adb'.
+        :param bool use_socket: Flag specifying if devices() should
+            query the adb server directly over its socket.
+        :param output_buffer_size: size in bytes above which the
+            output of an adb process is spilled from memory to a
+            temporary file.
+        :type output_buffer_size: integer or None
 
         :raises: * ADBError
                  * ADBTimeoutError
@@ -330,7 +735,9 @@ class ADBHost(ADBCommand):
         """
         ADBCommand.__init__(self, adb=adb, adb_host=adb_host,
                             adb_port=adb_port, logger_name=logger_name,
-                            timeout=timeout, verbose=verbose)
+                            timeout=timeout, verbose=verbose,
+                            use_socket=use_socket,
+                            output_buffer_size=output_buffer_size)
 
     def command(self, cmds, timeout=None):
         """Executes an adb command on the host.
@@ -356,12 +763,14 @@ class ADBHost(ADBCommand):
         The caller provides a list containing commands, as well as a
         timeout period in seconds.
 
-        A subprocess is spawned to execute adb with stdout and stderr
-        directed to temporary files. If the process takes longer than
-        the specified timeout, the process is terminated.
+        A subprocess is spawned to execute adb. Its stdout and stderr
+        are read from pipes into spooled temporary files which are held
+        in memory until they exceed output_buffer_size bytes. A helper
+        thread waits for the process to exit. If the process takes
+        longer than the specified timeout, the process is killed.
 
         It is the caller's responsibilty to clean up by closing
-        the stdout and stderr temporary files.
+        the stdout and stderr spooled temporary files.
 
         """
         return ADBCommand.command(self, cmds, timeout=timeout)
@@ -463,7 +872,13 @@ class ADBHost(ADBCommand):
         # from Android system/core/adb/transport.c statename()
         re_device_info = re.compile(r'([^\s]+)\s+(offline|bootloader|device|host|recovery|sideload|no permissions|unauthorized|unknown)')
         devices = []
-        lines = self.command_output(["devices", "-l"], timeout=timeout).split('\n')
+        ok = False
+        if self._client:
+            ok, output = self._client_request(self._client.devices,
+                                              timeout=timeout)
+        if not ok:
+            output = self.command_output(["devices", "-l"], timeout=timeout)
+        lines = output.split('\n')
         for line in lines:
             if line == 'List of devices attached ':
                 continue
@@ -513,7 +928,14 @@ class ADBDevice(ADBCommand):
                  timeout=300,
                  verbose=False,
                  device_ready_retry_wait=20,
-                 device_ready_retry_attempts=3):
+                 device_ready_retry_attempts=3,
+                 shell_sessions=0,
+                 use_socket=False,
+                 output_buffer_size=None,
+                 capabilities_cache=None,
+                 props_ttl=60,
+                 push_tar=False,
+                 push_tar_compress=False):
         """Initializes the ADBDevice object.
 
         :param device: When a string is passed, it is interpreted as the
@@ -543,6 +965,30 @@ class ADBDevice(ADBCommand):
             reboot.
         :param integer device_ready_retry_attempts: number of attempts when
             checking if a device is ready.
+        :param integer shell_sessions: number of persistent adb shell
+            sessions used to execute shell commands. Defaults to 0 which
+            executes each shell command in a new adb process.
+        :param bool use_socket: Flag specifying if shell commands,
+            get_state, exists, push and pull should talk to the adb
+            server directly over its socket. The adb executable is used
+            if the socket request fails.
+        :param output_buffer_size: size in bytes above which the
+            output of an adb process is spilled from memory to a
+            temporary file.
+        :type output_buffer_size: integer or None
+        :param capabilities_cache: directory in which the results of
+            probing the device's capabilities such as su and ls are
+            saved. The saved capabilities are reused until the device's
+            build fingerprint changes or the device is rebooted.
+        :type capabilities_cache: str or None
+        :param integer props_ttl: number of seconds the properties read
+            by get_props are cached. Defaults to 60.
+        :param bool push_tar: Flag specifying if push should transfer
+            directories containing many files as a single tar file
+            which is extracted on the device if the device has tar or
+            busybox tar.
+        :param bool push_tar_compress: Flag specifying if the tar files
+            are to be gzip compressed if the device's tar supports it.
 
         :raises: * ADBError
                  * ADBTimeoutError
@@ -552,16 +998,50 @@ class ADBDevice(ADBCommand):
         """
         ADBCommand.__init__(self, adb=adb, adb_host=adb_host,
                             adb_port=adb_port, logger_name=logger_name,
-                            timeout=timeout, verbose=verbose)
+                            timeout=timeout, verbose=verbose,
+                            use_socket=use_socket,
+                            output_buffer_size=output_buffer_size)
         self._device_serial = self._get_device_serial(device)
         self._initial_test_root = test_root
         self._test_root = None
         self._device_ready_retry_wait = device_ready_retry_wait
         self._device_ready_retry_attempts = device_ready_retry_attempts
+        self._shell_sessions = shell_sessions
+        self._shell_session_lock = threading.Lock()
+        self._shell_session_pool = None
+        self._shell_session_pid = None
+        self._shell_session_generation = 0
+        self._capabilities_cache = capabilities_cache
+        self._device_identity = None
+        self._props_ttl = props_ttl
+        self._push_tar = push_tar
+        self._push_tar_compress = push_tar_compress
+        self._props = None
+        self._props_time = None
         self._have_root_shell = False
         self._have_su = False
         self._have_android_su = False
+        self._mkdir_p = None
+        # Commands used to operate on directory trees on the device are
+        # detected on first use by _detect_tree_commands.
+        self._chmod_R = None
+        self._cp_R = None
+        self._find = None
+        self._tar = None
+        self._tar_z = None
+
+        if not self._load_capabilities():
+            self._probe_capabilities()
+            self._save_capabilities()
 
+        self._logger.debug("ADBDevice: %s" % self.__dict__)
+
+    # Device capabilities which are detected by probing the device and
+    # which may be persisted in the capabilities cache.
+    CAPABILITIES = ('have_root_shell', 'have_su', 'have_android_su', 'ls',
+                    'mkdir_p', 'chmod_R', 'cp_R', 'find', 'tar', 'tar_z')
+
+    def _probe_capabilities(self):
         uid = 'uid=0'
         cmd_id = 'LD_LIBRARY_PATH=/vendor/lib:/system/lib id'
         # Is shell already running as root?
@@ -587,7 +1067,6 @@ class ADBDevice(ADBCommand):
         except ADBError:
             self._logger.debug("Check for Android su failed")
 
-        self._mkdir_p = None
         # Force the use of /system/bin/ls or /system/xbin/ls in case
         # there is /sbin/ls which embeds ansi escape codes to colorize
         # the output.  Detect if we are using busybox ls. We want each
@@ -604,12 +1083,95 @@ class ADBDevice(ADBCommand):
         except ADBError:
             self._ls += " -a"
 
-        self._logger.debug("ADBDevice: %s" % self.__dict__)
+    def _get_capabilities_path(self):
+        serial = re.sub(r'[^\w.-]', '_', str(self._device_serial))
+        return os.path.join(self._capabilities_cache, '%s.json' % serial)
+
+    def _get_device_identity(self):
+        """Returns a tuple (build fingerprint, boot id) which changes
+        whenever the device is upgraded or rebooted.
+
+        """
+        output = self.shell_output('getprop ro.build.fingerprint; '
+                                   'cat /proc/sys/kernel/random/boot_id || '
+                                   'true')
+        lines = output.splitlines() + ['', '']
+        return lines[0].strip(), lines[1].strip()
+
+    def _load_capabilities(self):
+        """Loads the device's capabilities from the capabilities cache.
+
+        :returns: boolean - True if the cache contained capabilities for
+            the device's current build fingerprint and boot. False if
+            either could not be read.
+
+        """
+        if not self._capabilities_cache:
+            return False
+        try:
+            self._device_identity = self._get_device_identity()
+        except ADBError:
+            self._logger.warning('Unable to get identity for %s\n%s' % (
+                self._device_serial, traceback.format_exc()))
+            return False
+        if not all(self._device_identity):
+            # Without the boot id a reboot can not be detected so the
+            # capabilities are neither loaded nor saved.
+            self._logger.debug('Unable to identify the build and boot of %s: '
+                               '%s' % (self._device_serial,
+                                       self._device_identity))
+            self._device_identity = None
+            return False
+        path = self._get_capabilities_path()
+        try:
+            with open(path) as f:
+                cache = json.load(f)
+        except (IOError, ValueError):
+            return False
+        if (cache.get('fingerprint') != self._device_identity[0] or
+            cache.get('boot_id') != self._device_identity[1]):
+            self._logger.debug('Capabilities cache %s is stale' % path)
+            return False
+        capabilities = cache.get('capabilities', {})
+        if 'ls' not in capabilities:
+            return False
+        for name in self.CAPABILITIES:
+            value = capabilities.get(name)
+            if isinstance(value, unicode):
+                value = str(value)
+            setattr(self, '_' + name, value)
+        self._logger.debug('Loaded capabilities from %s' % path)
+        return True
+
+    def _save_capabilities(self):
+        """Saves the device's capabilities to the capabilities cache. The
+        cache file is replaced atomically.
+
+        """
+        if not self._capabilities_cache or not self._device_identity:
+            return
+        path = self._get_capabilities_path()
+        try:
+            if not os.path.isdir(self._capabilities_cache):
+                os.makedirs(self._capabilities_cache)
+            cache = {
+                'fingerprint': self._device_identity[0],
+                'boot_id': self._device_identity[1],
+                'capabilities': dict((name, getattr(self, '_' + name))
+                                     for name in self.CAPABILITIES)}
+            with tempfile.NamedTemporaryFile(dir=self._capabilities_cache,
+                                             delete=False) as f:
+                json.dump(cache, f)
+            os.rename(f.name, path)
+        except (IOError, OSError):
+            self._logger.warning('Unable to save capabilities to %s\n%s' % (
+                path, traceback.format_exc()))
 
     def _get_device_serial(self, device):
         if device is None:
             devices = ADBHost(adb=self._adb_path, adb_host=self._adb_host,
-                              adb_port=self._adb_port).devices()
+                              adb_port=self._adb_port,
+                              use_socket=self._use_socket).devices()
             if len(devices) > 1:
                 raise ValueError("ADBDevice called with multiple devices "
                                  "attached and no device specified")
@@ -666,36 +1228,159 @@ class ADBDevice(ADBCommand):
     @staticmethod
     def _get_exitcode(file_obj):
         """Get the exitcode from the last line of the file_obj for shell
-        commands.
+        commands and remove the line from the file_obj. Only the tail of
+        the file_obj is read.
 
         """
         file_obj.seek(0, os.SEEK_END)
-
-        line = ''
         length = file_obj.tell()
-        offset = 1
-        while length - offset >= 0:
-            file_obj.seek(-offset, os.SEEK_END)
-            char = file_obj.read(1)
-            if not char:
-                break
-            if char != '\r' and char != '\n':
-                line = char + line
-            elif line:
-                # we have collected everything up to the beginning of the line
-                break
-            offset += 1
-
-        match = re.match(r'rc=([0-9]+)', line)
+        tail_offset = max(0, length - 1024)
+        file_obj.seek(tail_offset, os.SEEK_SET)
+        tail = file_obj.read().rstrip('\r\n')
+
+        line_start = max(tail.rfind('\r'), tail.rfind('\n'))
+        match = None
+        if line_start != -1 or tail_offset == 0:
+            match = re.match(r'rc=([0-9]+)', tail[line_start + 1:])
         if match:
             exitcode = int(match.group(1))
-            file_obj.seek(-1, os.SEEK_CUR)
+            file_obj.seek(tail_offset + max(line_start, 0), os.SEEK_SET)
             file_obj.truncate()
         else:
             exitcode = None
 
         return exitcode
 
+    def _get_shell_session(self):
+        """Returns an idle ADBShellSession from the pool, blocking until
+        one is available.
+
+        Sessions are owned by the process which created them. A pool
+        inherited from a parent process is discarded without stopping
+        the parent's sessions.
+
+        """
+        with self._shell_session_lock:
+            if self._shell_session_pid != os.getpid():
+                self._shell_session_pool = Queue.Queue()
+                for i in range(self._shell_sessions):
+                    self._shell_session_pool.put(None)
+                self._shell_session_pid = os.getpid()
+            pool = self._shell_session_pool
+        session = pool.get()
+        if session is None:
+            args = [self._adb_path]
+            if self._adb_host:
+                args.extend(['-H', self._adb_host])
+            if self._adb_port:
+                args.extend(['-P', str(self._adb_port)])
+            if self._device_serial:
+                args.extend(['-s', self._device_serial])
+            args.extend(['wait-for-device', 'shell'])
+            session = ADBShellSession(args)
+            session.generation = self._shell_session_generation
+        return session
+
+    def _put_shell_session(self, session):
+        if self._shell_session_pid != os.getpid():
+            return
+        if session.generation != self._shell_session_generation:
+            # The session was in use when the sessions were closed.
+            session.stop()
+            session = None
+        self._shell_session_pool.put(session)
+
+    def close_shell_sessions(self, timeout=10):
+        """Stops any persistent adb shell sessions. New sessions will be
+        started as they are needed.
+
+        :param timeout: The maximum time in seconds to wait for sessions
+            which are in use to be returned to the pool. Sessions which
+            are still in use after the timeout are stopped when they
+            are returned.
+
+        """
+        with self._shell_session_lock:
+            if self._shell_session_pid != os.getpid():
+                return
+            pool = self._shell_session_pool
+            self._shell_session_generation += 1
+            end_time = time.time() + timeout
+            closed = 0
+            for i in range(self._shell_sessions):
+                try:
+                    session = pool.get(True, max(0, end_time - time.time()))
+                except Queue.Empty:
+                    self._logger.warning('close_shell_sessions: %d sessions '
+                                         'still in use after %d seconds' %
+                                         (self._shell_sessions - closed,
+                                          timeout))
+                    break
+                closed += 1
+                if session:
+                    session.stop()
+            for i in range(closed):
+                pool.put(None)
+
+    def _shell_session_command(self, cmd, timeout):
+        """Executes cmd in a persistent adb shell session.
+
+        Returns an ADBSessionProcess or None if a session could not be
+        used in which case the caller should execute the command in a
+        new adb process. A session which exits before the command is
+        started is restarted and the command retried once. A session
+        whose command times out is stopped so that it is restarted on
+        its next use.
+
+        """
+        session = self._get_shell_session()
+        try:
+            for attempt in range(1, 3):
+                try:
+                    output, exitcode = session.run(cmd, timeout)
+                except EOFError, e:
+                    self._logger.debug('Attempt %d %s' % (attempt, e))
+                    returncode = session.proc.poll() if session.proc else None
+                    session.stop()
+                    if session.started:
+                        return ADBSessionProcess(session.args + [cmd],
+                                                 exitcode=returncode or 1)
+                    continue
+                if exitcode is None:
+                    session.stop()
+                    return ADBSessionProcess(session.args + [cmd],
+                                             output=output, timedout=True)
+                return ADBSessionProcess(session.args + [cmd],
+                                         output=output, exitcode=exitcode)
+            return None
+        finally:
+            self._put_shell_session(session)
+
+    def _client_shell_command(self, cmd, timeout):
+        """Executes cmd via the adb server socket.
+
+        Returns an ADBSessionProcess or None if the request failed in
+        which case the caller should execute the command in a new adb
+        process.
+
+        """
+        args = ['adb-client', '-s', str(self._device_serial), 'shell', cmd]
+        try:
+            ok, output = self._client_request(self._client.shell,
+                                              self._device_serial,
+                                              cmd + "; echo rc=$?",
+                                              timeout=timeout)
+        except ADBTimeoutError:
+            return ADBSessionProcess(args, timedout=True)
+        if not ok:
+            return None
+        exitcode = None
+        match = re.search(r'rc=([0-9]+)\s*$', output)
+        if match:
+            exitcode = int(match.group(1))
+            output = output[:match.start()]
+        return ADBSessionProcess(args, output=output, exitcode=exitcode)
+
     @property
     def test_root(self):
         """
@@ -799,13 +1484,15 @@ class ADBDevice(ADBCommand):
         ADBDevice.shell().  The caller provides a list containing
         commands, as well as a timeout period in seconds.
 
-        A subprocess is spawned to execute adb for the device with
-        stdout and stderr directed to temporary files. If the process
-        takes longer than the specified timeout, the process is
-        terminated.
+        A subprocess is spawned to execute adb for the device. Its
+        stdout and stderr are read from pipes into spooled temporary
+        files which are held in memory until they exceed
+        output_buffer_size bytes. A helper thread waits for the process
+        to exit. If the process takes longer than the specified
+        timeout, the process is killed.
 
         It is the caller's responsibilty to clean up by closing
-        the stdout and stderr temporary files.
+        the stdout and stderr spooled temporary files.
 
         """
 
@@ -926,6 +1613,24 @@ class ADBDevice(ADBCommand):
 
     # Device Shell methods
 
+    def _get_root_command(self, cmd):
+        """Returns cmd wrapped so that it is executed as root.
+
+        :raises: ADBRootError
+
+        """
+        ld_library_path='LD_LIBRARY_PATH=/vendor/lib:/system/lib'
+        cmd = '%s %s' % (ld_library_path, cmd)
+        if self._have_root_shell:
+            pass
+        elif self._have_su:
+            cmd = "su -c \"%s\"" % cmd
+        elif self._have_android_su:
+            cmd = "su 0 \"%s\"" % cmd
+        else:
+            raise ADBRootError('Can not run command %s as root!' % cmd)
+        return cmd
+
     def shell(self, cmd, env=None, cwd=None, timeout=None, root=False):
         """Executes a shell command on the device.
 
@@ -972,27 +1677,31 @@ class ADBDevice(ADBCommand):
         command sequence on the first command which returns a non-zero
         exit code.
 
-        A subprocess is spawned to execute adb shell for the device
-        with stdout and stderr directed to temporary files. If the
-        process takes longer than the specified timeout, the process
-        is terminated. The return code is extracted from the stdout
-        and is then removed from the file.
-
-        It is the caller's responsibilty to clean up by closing
-        the stdout and stderr temporary files.
+        A subprocess is spawned to execute adb shell for the device.
+        Its stdout and stderr are read from pipes into spooled temporary
+        files which are held in memory until they exceed
+        output_buffer_size bytes and are only written to disk for
+        larger output. A helper thread blocks waiting for the process
+        to exit so that shell() returns as soon as the command
+        completes rather than polling the process. If the process takes
+        longer than the specified timeout, the process is killed. The
+        return code is extracted from the stdout and is then removed
+        from the file.
+
+        If the ADBDevice was created with shell_sessions, the command
+        is instead executed in one of the device's persistent adb shell
+        sessions and the adb shell subprocess is only spawned if no
+        session could be started. If the ADBDevice was created with
+        use_socket, the command may instead be executed by talking to
+        the adb server directly over its socket.
+
+        In every case the returned ADBProcess's stdout_file and
+        stderr_file are spooled temporary files. It is the caller's
+        responsibilty to clean up by closing them.
 
         """
         if root:
-            ld_library_path='LD_LIBRARY_PATH=/vendor/lib:/system/lib'
-            cmd = '%s %s' % (ld_library_path, cmd)
-            if self._have_root_shell:
-                pass
-            elif self._have_su:
-                cmd = "su -c \"%s\"" % cmd
-            elif self._have_android_su:
-                cmd = "su 0 \"%s\"" % cmd
-            else:
-                raise ADBRootError('Can not run command %s as root!' % cmd)
+            cmd = self._get_root_command(cmd)
 
         # prepend cwd and env to command if necessary
         if cwd:
@@ -1001,6 +1710,22 @@ class ADBDevice(ADBCommand):
             envstr = '&& '.join(map(lambda x: 'export %s=%s' %
                                     (x[0], x[1]), env.iteritems()))
             cmd = envstr + "&& " + cmd
+
+        if timeout is None:
+            timeout = self._timeout
+
+        if self._shell_sessions:
+            adb_process = self._shell_session_command(cmd, timeout)
+            if adb_process:
+                return adb_process
+            self._logger.debug('shell: unable to use a shell session for %s' %
+                               cmd)
+
+        if self._client:
+            adb_process = self._client_shell_command(cmd, timeout)
+            if adb_process:
+                return adb_process
+
         cmd += "; echo rc=$?"
 
         args = [self._adb_path]
@@ -1011,20 +1736,13 @@ class ADBDevice(ADBCommand):
         if self._device_serial:
             args.extend(['-s', self._device_serial])
         args.extend(["wait-for-device", "shell", cmd])
-        adb_process = ADBProcess(args)
+        adb_process = ADBProcess(args,
+                                 output_buffer_size=self._output_buffer_size)
 
-        if timeout is None:
-            timeout = self._timeout
-
-        start_time = time.time()
-        exitcode = adb_process.proc.poll()
-        while ((time.time() - start_time) <= timeout) and exitcode == None:
-            time.sleep(self._polling_interval)
-            exitcode = adb_process.proc.poll()
-        if exitcode == None:
-            adb_process.proc.kill()
+        exitcode, timedout = adb_process.wait(timeout)
+        if timedout:
             adb_process.timedout = True
-            adb_process.exitcode = adb_process.proc.poll()
+            adb_process.exitcode = exitcode
         elif exitcode == 0:
             adb_process.exitcode = self._get_exitcode(adb_process.stdout_file)
         else:
@@ -1120,10 +1838,70 @@ class ADBDevice(ADBCommand):
 
             return output
         finally:
-            if adb_process and isinstance(adb_process.stdout_file, file):
+            if adb_process:
                 adb_process.stdout_file.close()
                 adb_process.stderr_file.close()
 
+    def shell_batch(self, cmds, stop_on_error=True, timeout=None,
+                    root=False):
+        """Executes a list of shell commands on the device in a single
+        adb shell returning the output and exit code of each command.
+
+        :param list cmds: The commands to be executed in order.
+        :param bool stop_on_error: Flag specifying if the remaining
+            commands should be skipped after the first command which
+            returns a non-zero exit code. Defaults to True.
+        :param timeout: The maximum time in
+            seconds for any spawned adb process to complete before
+            throwing an ADBTimeoutError.  This timeout is per
+            adb call. The total time spent may exceed this
+            value. If it is not specified, the value set
+            in the ADBDevice constructor is used.
+        :type timeout: integer or None
+        :param bool root: Flag specifying if the commands
+            should be executed as root.
+        :returns: list of :class:`ADBShellResult` in the order of cmds.
+            The exitcode of a command which was not executed is None.
+        :raises: * ADBTimeoutError
+                 * ADBRootError
+                 * ADBError
+
+        Each command is executed in a subshell between markers which
+        are used to split the combined output. The output of each
+        command is returned unchanged. The exit code of each command is
+        recorded in the shell variable r which is used to skip the
+        remaining commands if stop_on_error is True.
+
+        """
+        token = 'ADBBATCH-%d-%d' % (os.getpid(), int(time.time() * 1000))
+        script = ['r=0']
+        for i, cmd in enumerate(cmds):
+            if root:
+                cmd = self._get_root_command(cmd)
+            block = 'echo %s-%d-BEGIN; ( %s ); r=$?; echo %s-%d-END rc=$r' % (
+                token, i, cmd, token, i)
+            if stop_on_error:
+                block = 'if [ $r -eq 0 ]; then %s; fi' % block
+            script.append(block)
+        output = self.shell_output('; '.join(script), timeout=timeout)
+
+        results = []
+        for i, cmd in enumerate(cmds):
+            begin = re.search(r'%s-%d-BEGIN\r?\n' % (token, i), output)
+            end = None
+            if begin:
+                end = re.compile(r'%s-%d-END rc=([0-9]+)' % (token, i)).search(
+                    output, begin.end())
+            if end:
+                results.append(ADBShellResult(
+                    cmd, output[begin.end():end.start()],
+                    int(end.group(1))))
+            else:
+                results.append(ADBShellResult(cmd, '', None))
+        if self._verbose:
+            self._logger.debug('shell_batch: %s' % results)
+        return results
+
     # Informational methods
 
     def _get_logcat_buffer_args(self, buffers):
@@ -1200,6 +1978,83 @@ class ADBDevice(ADBCommand):
 
         return lines
 
+    def get_logcat_reader(self,
+                          filter_specs=["*:V"],
+                          format="time",
+                          buffers=[],
+                          max_lines=None):
+        """Returns a started ADBLogcatReader which continuously reads
+        the device's logcat.
+
+        :param list filter_specs: Optional logcat messages to
+            be included.
+        :param str format: Optional logcat format.
+        :param list buffers: Log buffers to retrieve. Valid buffers are
+            "radio", "events", and "main". Defaults to "main".
+        :param max_lines: maximum number of unread lines retained by
+            the reader. Defaults to ADBLogcatReader.MAX_LINES.
+        :type max_lines: integer or None
+        :returns: :class:`ADBLogcatReader`
+        :raises: * ADBError
+
+        It is the caller's responsibility to stop the reader.
+
+        """
+        buffers = self._get_logcat_buffer_args(buffers)
+        args = [self._adb_path]
+        if self._adb_host:
+            args.extend(['-H', self._adb_host])
+        if self._adb_port:
+            args.extend(['-P', str(self._adb_port)])
+        if self._device_serial:
+            args.extend(['-s', self._device_serial])
+        args.extend(['wait-for-device', 'logcat', '-v', format])
+        args.extend(buffers + filter_specs)
+        reader = ADBLogcatReader(args, max_lines=max_lines)
+        try:
+            reader.start()
+        except OSError, e:
+            raise ADBError('Unable to start %s: %s' % (' '.join(args), e))
+        return reader
+
+    def get_props(self, timeout=None, refresh=False):
+        """Gets all of the properties from the device via a single adb
+        shell getprop.
+
+        :param timeout: The maximum time in
+            seconds for any spawned adb process to complete before
+            throwing an ADBTimeoutError.
+            This timeout is per adb call. The total time spent
+            may exceed this value. If it is not specified, the value
+            set in the ADBDevice constructor is used.
+        :type timeout: integer or None
+        :param bool refresh: Flag specifying if the properties should
+            be read from the device even if the cached properties have
+            not expired.
+        :returns: dict of property names and values.
+        :raises: * ADBTimeoutError
+                 * ADBError
+
+        The properties are cached for props_ttl seconds as specified in
+        the ADBDevice constructor. The cache is cleared when the device
+        is rebooted.
+
+        """
+        if (refresh or self._props is None or
+            time.time() - self._props_time > self._props_ttl):
+            output = self.shell_output('getprop', timeout=timeout)
+            # Lines are of the form [name]: [value] where value may
+            # span multiple lines.
+            self._props = dict(re.findall(r'^\[([^\]]+)\]: \[(.*?)\]\r?$',
+                                          output, re.M | re.S))
+            self._props_time = time.time()
+        return dict(self._props)
+
+    def clear_props(self):
+        """Clears the cached properties."""
+        self._props = None
+        self._props_time = None
+
     def get_prop(self, prop, timeout=None):
         """Gets value of a property from the device via adb shell getprop.
 
@@ -1215,7 +2070,15 @@ class ADBDevice(ADBCommand):
         :raises: * ADBTimeoutError
                  * ADBError
 
+        Read-only ro.* properties can not change until the device is
+        rebooted and are read from the properties cached by get_props.
+        Properties which are not set have the value ''. Other
+        properties such as sys.boot_completed are always read from the
+        device.
+
         """
+        if prop.startswith('ro.'):
+            return self.get_props(timeout=timeout).get(prop, '')
         output = self.shell_output('getprop %s' % prop, timeout=timeout)
         return output
 
@@ -1234,6 +2097,12 @@ class ADBDevice(ADBCommand):
                  * ADBError
 
         """
+        if self._client:
+            ok, output = self._client_request(self._client.get_state,
+                                              self._device_serial,
+                                              timeout=timeout)
+            if ok:
+                return output.strip()
         output = self.command_output(["get-state"], timeout=timeout).strip()
         return output
 
@@ -1290,10 +2159,82 @@ class ADBDevice(ADBCommand):
         if not rv.startswith("remount succeeded"):
             raise ADBError("Unable to remount device")
 
+    def _detect_tree_commands(self, timeout=None):
+        """Detects the commands available on the device to recursively
+        chmod, copy, list and extract directory trees in a single adb
+        shell.
+
+        self._chmod_R and self._cp_R are set to command templates taking
+        mask and path or source and destination respectively,
+        self._find and self._tar to the find and tar commands and
+        self._tar_z to True if tar can extract gzip compressed files.
+        The commands are set to '' if they are not available.
+
+        """
+        if (self._chmod_R is not None and self._cp_R is not None and
+            self._tar is not None):
+            return
+        (chmod_usage, busybox_chmod_usage, cp_usage, busybox_cp_usage,
+         find, busybox_find, tar_usage, busybox_tar_usage) = (
+            self.shell_batch(['chmod 2>&1',
+                              'busybox chmod 2>&1',
+                              'cp 2>&1',
+                              'busybox cp 2>&1',
+                              'find / -maxdepth 0',
+                              'busybox find / -maxdepth 0',
+                              'tar 2>&1',
+                              'busybox tar 2>&1'],
+                             stop_on_error=False, timeout=timeout))
+        if find.exitcode == 0:
+            self._find = 'find'
+        elif busybox_find.exitcode == 0:
+            self._find = 'busybox find'
+        else:
+            self._find = ''
+        # chmod's usage message mentions -R if it is supported.
+        if '-R' in chmod_usage.output:
+            self._chmod_R = 'chmod -R %(mask)s %(path)s'
+        elif '-R' in busybox_chmod_usage.output:
+            self._chmod_R = 'busybox chmod -R %(mask)s %(path)s'
+        elif self._find:
+            self._chmod_R = '%s %%(path)s -exec chmod %%(mask)s {} \\;' % (
+                self._find)
+        else:
+            self._chmod_R = ''
+        # Likewise for cp which is missing entirely on older devices.
+        if '-R' in cp_usage.output:
+            self._cp_R = 'cp -R %(source)s %(destination)s'
+        elif '-R' in busybox_cp_usage.output:
+            self._cp_R = 'busybox cp -R %(source)s %(destination)s'
+        else:
+            self._cp_R = ''
+        # tar's usage message lists its operations such as -[cxtzhvO].
+        self._tar = ''
+        self._tar_z = False
+        for tar, usage in (('tar', tar_usage),
+                           ('busybox tar', busybox_tar_usage)):
+            for flags in re.findall(r'-\[?([A-Za-z]+)', usage.output):
+                if 'x' in flags:
+                    self._tar = tar
+                    self._tar_z = 'z' in flags
+                    break
+            if self._tar:
+                break
+        self._logger.debug('_detect_tree_commands: chmod: %s, cp: %s, '
+                           'find: %s, tar: %s, tar_z: %s' % (
+                               self._chmod_R, self._cp_R, self._find,
+                               self._tar, self._tar_z))
+        self._save_capabilities()
+
     def chmod(self, path, recursive=False, mask="777", timeout=None, root=False):
         """Recursively changes the permissions of a directory on the
         device.
 
+        A recursive chmod is performed on the device in a single adb
+        shell using chmod -R, busybox chmod -R or find if available.
+        Otherwise the directory tree is listed once and its entries are
+        changed in a single batch of shell commands.
+
         :param str path: The directory name on the device.
         :param bool recursive: Flag specifying if the command should be
             executed recursively.
@@ -1315,31 +2256,34 @@ class ADBDevice(ADBCommand):
         path = posixpath.normpath(path.strip())
         self._logger.debug('chmod: path=%s, recursive=%s, mask=%s, root=%s' %
                            (path, recursive, mask, root))
+        if recursive:
+            self._detect_tree_commands(timeout=timeout)
+            if self._chmod_R:
+                try:
+                    self.shell_output(self._chmod_R % {'mask': mask,
+                                                       'path': path},
+                                      timeout=timeout, root=root)
+                    return
+                except ADBError, e:
+                    # Fall back to walking the tree from the host which
+                    # tolerates entries which vanish during the chmod.
+                    self._logger.warning('chmod: recursive chmod of %s '
+                                         'failed: %s' % (path, e))
         self.shell_output("chmod %s %s" % (mask, path),
                           timeout=timeout, root=root)
         if recursive and self.is_dir(path, timeout=timeout, root=root):
-            files = self.list_files(path, timeout=timeout, root=root)
-            for f in files:
-                entry = path + "/" + f
-                self._logger.debug('chmod: entry=%s' % entry)
-                if self.is_dir(entry, timeout=timeout, root=root):
-                    self._logger.debug('chmod: recursion entry=%s' % entry)
-                    self.chmod(entry, recursive=recursive, mask=mask,
-                               timeout=timeout, root=root)
-                elif self.is_file(entry, timeout=timeout, root=root):
-                    try:
-                        self.shell_output("chmod %s %s" % (mask, entry),
-                                          timeout=timeout, root=root)
-                        self._logger.debug('chmod: file entry=%s' % entry)
-                    except ADBError, e:
-                        if e.message.find('No such file or directory'):
-                            # some kind of race condition is causing files
-                            # to disappear. Catch and report the error here.
-                            self._logger.warning('chmod: File %s vanished!: %s' %
-                                                 (entry, e))
-                else:
-                    self._logger.warning('chmod: entry %s does not exist' %
-                                         entry)
+            entries = self.list_files(path, timeout=timeout, root=root,
+                                      recursive=True)
+            results = self.shell_batch(
+                ['chmod %s %s' % (mask, posixpath.join(path, entry))
+                 for entry in entries],
+                stop_on_error=False, timeout=timeout, root=root)
+            for result in results:
+                if result.exitcode != 0:
+                    # some kind of race condition is causing files
+                    # to disappear. Report the error here.
+                    self._logger.warning('chmod: %s failed: %s' %
+                                         (result.cmd, result.output))
 
     def exists(self, path, timeout=None, root=False):
         """Returns True if the path exists on the device.
@@ -1360,6 +2304,12 @@ class ADBDevice(ADBCommand):
 
         """
         path = posixpath.normpath(path)
+        if self._client and not root:
+            ok, st = self._client_request(self._client.stat,
+                                          self._device_serial, path,
+                                          timeout=timeout)
+            if ok:
+                return st[0] != 0
         return self.shell_bool('ls -a %s' % path, timeout=timeout, root=root)
 
     def is_dir(self, path, timeout=None, root=False):
@@ -1408,7 +2358,7 @@ class ADBDevice(ADBCommand):
             self.exists(path, timeout=timeout, root=root) and
             not self.is_dir(path, timeout=timeout, root=root))
 
-    def list_files(self, path, timeout=None, root=False):
+    def list_files(self, path, timeout=None, root=False, recursive=False):
         """Return a list of files/directories contained in a directory
         on the device.
 
@@ -1422,18 +2372,25 @@ class ADBDevice(ADBCommand):
         :type timeout: integer or None
         :param bool root: Flag specifying if the command should
             be executed as root.
+        :param bool recursive: Flag specifying if the contents of
+            subdirectories should be listed as paths relative to path.
+            The tree is listed by a single find or ls -R on the device
+            and is only walked from the host if that fails.
         :returns: list of files/directories contained in the directory.
         :raises: * ADBTimeoutError
                  * ADBRootError
 
         """
         path = posixpath.normpath(path.strip())
+        if recursive:
+            return self._list_files_recursive(path, timeout=timeout,
+                                              root=root)
         data = []
         if self.is_dir(path, timeout=timeout, root=root):
             try:
                 data = self.shell_output("%s %s" % (self._ls, path),
                                          timeout=timeout,
-                                         root=root).split('\r\n')
+                                         root=root).splitlines()
                 self._logger.debug('list_files: data: %s' % data)
             except ADBError:
                 self._logger.error('Ignoring exception in ADBDevice.list_files\n%s' %
@@ -1443,6 +2400,60 @@ class ADBDevice(ADBCommand):
         self._logger.debug('list_files: %s' % data)
         return data
 
+    def _list_files_recursive(self, path, timeout=None, root=False):
+        if not self.is_dir(path, timeout=timeout, root=root):
+            return []
+        self._detect_tree_commands(timeout=timeout)
+        prefix = path.rstrip('/') + '/'
+        if self._find:
+            cmd = '%s %s' % (self._find, path)
+        else:
+            cmd = '%s -R %s' % (self._ls, path)
+        try:
+            lines = self.shell_output(cmd, timeout=timeout,
+                                      root=root).splitlines()
+        except ADBError:
+            self._logger.warning('list_files: %s failed\n%s' % (
+                cmd, traceback.format_exc()))
+            lines = None
+        if lines is not None:
+            data = []
+            if self._find:
+                for line in lines:
+                    if line.startswith(prefix):
+                        data.append(line[len(prefix):])
+            else:
+                # ls -R lists each directory's entries after a
+                # "directory:" header.
+                directory = ''
+                for line in lines:
+                    if not line or line in ('.', '..'):
+                        continue
+                    if line.endswith(':'):
+                        if line[:-1] == path:
+                            directory = ''
+                            continue
+                        if line.startswith(prefix):
+                            directory = line[len(prefix):-1]
+                            continue
+                    data.append(posixpath.join(directory, line))
+            self._logger.debug('list_files: %s' % data)
+            return data
+        return self._walk_files(path, timeout=timeout, root=root)
+
+    def _walk_files(self, path, timeout=None, root=False):
+        data = []
+        for entry in self.list_files(path, timeout=timeout, root=root):
+            if entry in ('.', '..'):
+                continue
+            data.append(entry)
+            entry_path = posixpath.join(path, entry)
+            if self.is_dir(entry_path, timeout=timeout, root=root):
+                data.extend([posixpath.join(entry, item) for item in
+                             self._walk_files(entry_path, timeout=timeout,
+                                              root=root)])
+        return data
+
     def mkdir(self, path, parents=False, timeout=None, root=False):
         """Create a directory on the device.
 
@@ -1471,7 +2482,9 @@ class ADBDevice(ADBCommand):
                 # non-zero exitcode if -p is not supported.
                 if self.shell_bool('mkdir -p %s' % path, timeout=timeout,
                                    root=root):
-                    self._mkdir_p = True
+                    if self._mkdir_p is None:
+                        self._mkdir_p = True
+                        self._save_capabilities()
                     return
             # mkdir -p is not supported. create the parent
             # directories individually.
@@ -1496,9 +2509,19 @@ class ADBDevice(ADBCommand):
         if not self.is_dir(path, timeout=timeout, root=root):
             raise ADBError('mkdir %s Failed' % path)
 
+    #: Minimum number of files in a directory for push to transfer it
+    #: as a tar file.
+    PUSH_TAR_MIN_FILES = 16
+
     def push(self, local, remote, timeout=None):
         """Pushes a file or directory to the device.
 
+        If push_tar was specified when the ADBDevice was created, a
+        directory containing PUSH_TAR_MIN_FILES or more files is
+        transferred as a single tar file and extracted on the device if
+        the device has tar. Otherwise, or if the extraction fails, the
+        directory is pushed file by file by adb.
+
         :param str local: The name of the local file or
             directory name.
         :param str remote: The name of the remote file or
@@ -1514,9 +2537,83 @@ class ADBDevice(ADBCommand):
                  * ADBError
 
         """
+        if self._push_tar and os.path.isdir(local):
+            try:
+                if self._push_tar_file(local, remote, timeout=timeout):
+                    return
+            except ADBError, e:
+                self._logger.warning('push: tar push of %s failed: %s' % (
+                    local, e))
+        if self._client:
+            ok, result = self._client_request(self._client.push,
+                                              self._device_serial,
+                                              os.path.realpath(local), remote,
+                                              timeout=timeout)
+            if ok:
+                return
         self.command_output(["push", os.path.realpath(local), remote],
                             timeout=timeout)
 
+    def _push_tar_file(self, local, remote, timeout=None):
+        """Pushes the contents of the directory local to the directory
+        remote as a single tar file which is extracted on the device.
+
+        :returns: boolean - False if the directory contains fewer than
+            PUSH_TAR_MIN_FILES files or the device does not have tar, in
+            which case nothing is pushed.
+        :raises: * ADBTimeoutError
+                 * ADBError
+
+        """
+        num_files = 0
+        for dirpath, dirnames, filenames in os.walk(local):
+            num_files += len(filenames)
+        if num_files < self.PUSH_TAR_MIN_FILES:
+            return False
+        self._detect_tree_commands(timeout=timeout)
+        if not self._tar:
+            return False
+
+        def reset_owner(tarinfo):
+            # Let the extracted files be owned by the user extracting
+            # them as they are with adb push.
+            tarinfo.uid = tarinfo.gid = 0
+            tarinfo.uname = tarinfo.gname = 'root'
+            return tarinfo
+
+        compress = self._push_tar_compress and self._tar_z
+        if compress:
+            suffix, mode, flags = '.tar.gz', 'w:gz', '-xzf'
+        else:
+            suffix, mode, flags = '.tar', 'w', '-xf'
+        remote = posixpath.normpath(remote)
+        remote_tar = posixpath.join(remote, '.push-%d%s' % (os.getpid(),
+                                                            suffix))
+        local_tar = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+        try:
+            tar = tarfile.open(fileobj=local_tar, mode=mode)
+            for name in sorted(os.listdir(local)):
+                tar.add(os.path.join(local, name), arcname=name,
+                        filter=reset_owner)
+            tar.close()
+            local_tar.close()
+            self.mkdir(remote, parents=True, timeout=timeout)
+            self.command_output(["push", local_tar.name, remote_tar],
+                                timeout=timeout)
+            extract, remove = self.shell_batch(
+                ['cd %s && %s %s %s' % (remote, self._tar, flags, remote_tar),
+                 'rm %s' % remote_tar],
+                stop_on_error=False, timeout=timeout)
+            if extract.exitcode:
+                raise ADBError('%s failed: %s' % (extract.cmd,
+                                                  extract.output))
+        finally:
+            local_tar.close()
+            os.unlink(local_tar.name)
+        self._logger.debug('push: pushed %d files in %s as %s' % (
+            num_files, local, remote_tar))
+        return True
+
     def pull(self, remote, local, timeout=None):
         """Pulls a file or directory from the device.
 
@@ -1535,6 +2632,13 @@ class ADBDevice(ADBCommand):
                  * ADBError
 
         """
+        if self._client:
+            ok, result = self._client_request(self._client.pull,
+                                              self._device_serial,
+                                              remote, os.path.realpath(local),
+                                              timeout=timeout)
+            if ok:
+                return
         self.command_output(["pull", remote, os.path.realpath(local)],
                             timeout=timeout)
 
@@ -1594,6 +2698,62 @@ class ADBDevice(ADBCommand):
         if self.is_dir(path, timeout=timeout, root=root):
             raise ADBError('rmdir("%s") failed to remove directory.' % path)
 
+    def supports_recursive_copy(self, timeout=None):
+        """Returns True if directory trees can be copied on the device by
+        cp(source, destination, recursive=True).
+
+        :param timeout: The maximum time in
+            seconds for any spawned adb process to complete before
+            throwing an ADBTimeoutError.
+            This timeout is per adb call. The total time spent
+            may exceed this value. If it is not specified, the value
+            set in the ADBDevice constructor is used.
+        :type timeout: integer or None
+        :raises: * ADBTimeoutError
+                 * ADBError
+
+        """
+        self._detect_tree_commands(timeout=timeout)
+        return bool(self._cp_R)
+
+    def cp(self, source, destination, recursive=False, timeout=None,
+           root=False):
+        """Copies a file or directory on the device.
+
+        :param str source: The path of the file or directory to be
+            copied.
+        :param str destination: The path of the copy. If source is a
+            directory and destination does not exist, destination is
+            created as a copy of source.
+        :param bool recursive: Flag specifying if directories are to be
+            copied recursively using cp -R or busybox cp -R. Default is
+            False.
+        :param timeout: The maximum time in
+            seconds for any spawned adb process to complete before
+            throwing an ADBTimeoutError.
+            This timeout is per adb call. The total time spent
+            may exceed this value. If it is not specified, the value
+            set in the ADBDevice constructor is used.
+        :type timeout: integer or None
+        :param bool root: Flag specifying if the command should
+            be executed as root.
+        :raises: * ADBTimeoutError
+                 * ADBRootError
+                 * ADBError
+
+        """
+        source = posixpath.normpath(source)
+        destination = posixpath.normpath(destination)
+        if not recursive:
+            self.shell_output('cp %s %s' % (source, destination),
+                              timeout=timeout, root=root)
+            return
+        if not self.supports_recursive_copy(timeout=timeout):
+            raise ADBError('cp: recursive copy is not supported')
+        self.shell_output(self._cp_R % {'source': source,
+                                        'destination': destination},
+                          timeout=timeout, root=root)
+
     # Process management methods
 
     def get_process_list(self, timeout=None):
@@ -1650,7 +2810,7 @@ class ADBDevice(ADBCommand):
             self._logger.debug('get_process_list: %s' % ret)
             return ret
         finally:
-            if adb_process and isinstance(adb_process.stdout_file, file):
+            if adb_process:
                 adb_process.stdout_file.close()
                 adb_process.stderr_file.close()
 
@@ -83,17 +83,21 @@ class ADBAndroidMixin(object):
                     failure = "Device state: %s" % state
                     success = False
                 else:
-                    if self.is_dir(ready_path, timeout=timeout):
-                        self.rmdir(ready_path, timeout=timeout)
-                    self.mkdir(ready_path, timeout=timeout)
-                    self.rmdir(ready_path, timeout=timeout)
-                    # Invoke the pm list commands to see if it is up and
-                    # running.
-                    for pm_list_cmd in pm_list_commands:
-                        data = self.shell_output("pm list %s" % pm_list_cmd,
-                                                 timeout=timeout)
-                        if pm_error_string in data:
-                            failure = data
+                    # Check that the test root is writable and invoke
+                    # the pm list commands to see if it is up and
+                    # running in a single adb shell.
+                    cmds = ['rmdir %s 2>/dev/null; mkdir %s' % (ready_path,
+                                                                ready_path),
+                            'rmdir %s' % ready_path]
+                    cmds.extend(["pm list %s" % pm_list_cmd
+                                 for pm_list_cmd in pm_list_commands])
+                    for result in self.shell_batch(cmds, timeout=timeout):
+                        if result.exitcode is None:
+                            break
+                        # A non-zero exit code fails the check as the
+                        # ADBError raised by shell_output did.
+                        if result.exitcode or pm_error_string in result.output:
+                            failure = '%s: %s' % (result.cmd, result.output)
                             success = False
                             break
             except ADBError, e:
@@ -155,6 +159,10 @@ class ADBAndroidMixin(object):
 
         """
         self.command_output(["reboot"], timeout=timeout)
+        # The reboot terminates any persistent shell sessions and may
+        # change the device's properties.
+        self.close_shell_sessions()
+        self.clear_props()
         self.command_output([], timeout=timeout)
         return self.is_device_ready(timeout=timeout)
 
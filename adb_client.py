@@ -0,0 +1,343 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import posixpath
+import socket
+import stat
+import struct
+import time
+
+
+class ADBClientError(Exception):
+    """ADBClientError is raised when the adb server or the device's adbd
+    responds to a request with FAIL or with an unexpected response.
+
+    """
+    pass
+
+
+class ADBClient(object):
+    """ADBClient talks to the adb server directly over its socket using
+    the adb wire protocol rather than spawning the adb executable.
+
+    Host requests are sent as a 4 digit hex length followed by the
+    request and are answered with OKAY or FAIL. Device services are
+    reached by first switching the connection to the device with
+    host:transport:<serial>. File transfers use the sync: service's
+    STAT, LIST, SEND and RECV requests.
+
+    ::
+
+       from adb_client import ADBClient
+
+       client = ADBClient()
+       print client.get_state('b313b945')
+       client.push('b313b945', '/tmp/profile', '/data/local/tmp/profile')
+
+    The adb server must already be running. Callers are expected to
+    fall back to the adb executable on socket.error or ADBClientError.
+
+    """
+    DEFAULT_HOST = '127.0.0.1'
+    DEFAULT_PORT = 5037
+    SYNC_DATA_MAX = 64*1024
+
+    def __init__(self, adb_host=None, adb_port=None, timeout=300):
+        """Initializes the ADBClient object.
+
+        :param adb_host: host of the adb server. Defaults to 127.0.0.1.
+        :type adb_host: str or None
+        :param adb_port: port of the adb server. Defaults to 5037.
+        :type adb_port: integer or None
+        :param integer timeout: default maximum time in seconds for a
+            request to complete.
+
+        """
+        self.adb_host = adb_host or self.DEFAULT_HOST
+        self.adb_port = int(adb_port or self.DEFAULT_PORT)
+        self.timeout = timeout
+
+    # Low level protocol methods
+
+    def _connect(self, timeout):
+        sock = socket.create_connection((self.adb_host, self.adb_port),
+                                        timeout=timeout)
+        sock.settimeout(timeout)
+        return sock
+
+    def _send_request(self, sock, request):
+        sock.sendall('%04x%s' % (len(request), request))
+
+    def _recv_exactly(self, sock, length):
+        chunks = []
+        while length > 0:
+            data = sock.recv(min(length, self.SYNC_DATA_MAX))
+            if not data:
+                raise ADBClientError('Connection closed by adb server')
+            chunks.append(data)
+            length -= len(data)
+        return ''.join(chunks)
+
+    def _recv_hex_string(self, sock):
+        return self._recv_exactly(sock, int(self._recv_exactly(sock, 4), 16))
+
+    def _recv_all(self, sock, deadline):
+        chunks = []
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise socket.timeout('timed out')
+            sock.settimeout(remaining)
+            data = sock.recv(self.SYNC_DATA_MAX)
+            if not data:
+                break
+            chunks.append(data)
+        return ''.join(chunks)
+
+    def _read_status(self, sock, request):
+        status = self._recv_exactly(sock, 4)
+        if status == 'OKAY':
+            return
+        if status == 'FAIL':
+            raise ADBClientError('%s: %s' % (request,
+                                             self._recv_hex_string(sock)))
+        raise ADBClientError('%s: unexpected response %r' % (request, status))
+
+    def _request(self, sock, request):
+        self._send_request(sock, request)
+        self._read_status(sock, request)
+
+    def _transport(self, serial, timeout):
+        """Returns a socket connected to the device's adbd."""
+        sock = self._connect(timeout)
+        try:
+            if serial:
+                self._request(sock, 'host:transport:%s' % serial)
+            else:
+                self._request(sock, 'host:transport-any')
+        except:
+            sock.close()
+            raise
+        return sock
+
+    def _sync(self, serial, timeout):
+        sock = self._transport(serial, timeout)
+        try:
+            self._request(sock, 'sync:')
+        except:
+            sock.close()
+            raise
+        return sock
+
+    def _sync_request(self, sock, sync_id, data):
+        sock.sendall(sync_id + struct.pack('<I', len(data)) + data)
+
+    def _sync_response(self, sock):
+        header = self._recv_exactly(sock, 8)
+        return header[:4], struct.unpack('<I', header[4:])[0]
+
+    def _sync_fail(self, sock, sync_id, length, path):
+        if sync_id == 'FAIL':
+            message = self._recv_exactly(sock, length)
+        else:
+            message = 'unexpected response %r' % sync_id
+        raise ADBClientError('%s: %s' % (path, message))
+
+    # Host methods
+
+    def host_command(self, request, timeout=None):
+        """Sends a host request such as host:version or host:devices-l and
+        returns the response.
+
+        :param str request: the host request.
+        :param timeout: maximum time in seconds for the request.
+        :type timeout: integer or None
+        :returns: string - the response payload.
+        :raises: * socket.error
+                 * ADBClientError
+
+        """
+        sock = self._connect(timeout or self.timeout)
+        try:
+            self._request(sock, request)
+            return self._recv_hex_string(sock)
+        finally:
+            sock.close()
+
+    def devices(self, timeout=None):
+        """Returns the output of host:devices-l which matches that of
+        adb devices -l without its header line.
+
+        """
+        return self.host_command('host:devices-l', timeout=timeout)
+
+    def get_state(self, serial, timeout=None):
+        """Returns the device's state as reported by adb get-state."""
+        if serial:
+            request = 'host-serial:%s:get-state' % serial
+        else:
+            request = 'host:get-state'
+        return self.host_command(request, timeout=timeout)
+
+    # Device methods
+
+    def shell(self, serial, cmd, timeout=None):
+        """Executes cmd via the device's shell: service and returns its
+        combined output.
+
+        :param serial: the device serial number.
+        :type serial: str or None
+        :param str cmd: the shell command.
+        :param timeout: maximum time in seconds for the command.
+        :type timeout: integer or None
+        :returns: string - output of the command.
+        :raises: * socket.timeout if the command does not complete in time.
+                 * socket.error
+                 * ADBClientError
+
+        """
+        timeout = timeout or self.timeout
+        deadline = time.time() + timeout
+        sock = self._transport(serial, timeout)
+        try:
+            self._request(sock, 'shell:%s' % cmd)
+            return self._recv_all(sock, deadline)
+        finally:
+            sock.close()
+
+    def stat(self, serial, path, timeout=None):
+        """Returns a tuple (mode, size, mtime) for path on the device. A
+        mode of 0 indicates that the path does not exist.
+
+        """
+        sock = self._sync(serial, timeout or self.timeout)
+        try:
+            return self._stat(sock, path)
+        finally:
+            sock.close()
+
+    def _stat(self, sock, path):
+        self._sync_request(sock, 'STAT', path)
+        header = self._recv_exactly(sock, 16)
+        if header[:4] != 'STAT':
+            raise ADBClientError('%s: unexpected response %r' % (path,
+                                                                 header[:4]))
+        return struct.unpack('<III', header[4:])
+
+    def list(self, serial, path, timeout=None):
+        """Returns a list of tuples (name, mode, size, mtime) for the
+        entries of the directory path on the device excluding . and ..
+
+        """
+        sock = self._sync(serial, timeout or self.timeout)
+        try:
+            return self._list(sock, path)
+        finally:
+            sock.close()
+
+    def _list(self, sock, path):
+        entries = []
+        self._sync_request(sock, 'LIST', path)
+        while True:
+            header = self._recv_exactly(sock, 20)
+            sync_id = header[:4]
+            if sync_id == 'DONE':
+                break
+            if sync_id != 'DENT':
+                raise ADBClientError('%s: unexpected response %r' % (path,
+                                                                     sync_id))
+            mode, size, mtime, namelen = struct.unpack('<IIII', header[4:])
+            name = self._recv_exactly(sock, namelen)
+            if name not in ('.', '..'):
+                entries.append((name, mode, size, mtime))
+        return entries
+
+    def push(self, serial, local, remote, timeout=None):
+        """Pushes the local file or directory to remote on the device
+        using the sync: service. Directories are pushed recursively into
+        remote as adb push does.
+
+        :raises: * socket.error
+                 * ADBClientError
+
+        """
+        sock = self._sync(serial, timeout or self.timeout)
+        try:
+            if os.path.isdir(local):
+                for dirpath, dirnames, filenames in os.walk(local):
+                    relpath = os.path.relpath(dirpath, local)
+                    remote_dir = remote
+                    if relpath != '.':
+                        remote_dir = posixpath.join(
+                            remote, *relpath.split(os.sep))
+                    for filename in filenames:
+                        self._send_file(sock, os.path.join(dirpath, filename),
+                                        posixpath.join(remote_dir, filename))
+            else:
+                mode = self._stat(sock, remote)[0]
+                if stat.S_ISDIR(mode):
+                    remote = posixpath.join(remote, os.path.basename(local))
+                self._send_file(sock, local, remote)
+        finally:
+            sock.close()
+
+    def _send_file(self, sock, local, remote):
+        st = os.stat(local)
+        self._sync_request(sock, 'SEND', '%s,%d' % (remote,
+                                                    stat.S_IMODE(st.st_mode)))
+        with open(local, 'rb') as f:
+            while True:
+                data = f.read(self.SYNC_DATA_MAX)
+                if not data:
+                    break
+                self._sync_request(sock, 'DATA', data)
+        sock.sendall('DONE' + struct.pack('<I', int(st.st_mtime)))
+        sync_id, length = self._sync_response(sock)
+        if sync_id != 'OKAY':
+            self._sync_fail(sock, sync_id, length, remote)
+
+    def pull(self, serial, remote, local, timeout=None):
+        """Pulls the remote file or directory from the device to local
+        using the sync: service. Directories are pulled recursively.
+
+        :raises: * socket.error
+                 * ADBClientError
+
+        """
+        sock = self._sync(serial, timeout or self.timeout)
+        try:
+            mode = self._stat(sock, remote)[0]
+            if mode == 0:
+                raise ADBClientError('%s: does not exist' % remote)
+            if stat.S_ISDIR(mode):
+                self._recv_dir(sock, remote, local)
+            else:
+                if os.path.isdir(local):
+                    local = os.path.join(local, posixpath.basename(remote))
+                self._recv_file(sock, remote, local)
+        finally:
+            sock.close()
+
+    def _recv_dir(self, sock, remote, local):
+        if not os.path.isdir(local):
+            os.makedirs(local)
+        for name, mode, size, mtime in self._list(sock, remote):
+            remote_path = posixpath.join(remote, name)
+            local_path = os.path.join(local, name)
+            if stat.S_ISDIR(mode):
+                self._recv_dir(sock, remote_path, local_path)
+            elif stat.S_ISREG(mode):
+                self._recv_file(sock, remote_path, local_path)
+
+    def _recv_file(self, sock, remote, local):
+        self._sync_request(sock, 'RECV', remote)
+        with open(local, 'wb') as f:
+            while True:
+                sync_id, length = self._sync_response(sock)
+                if sync_id == 'DONE':
+                    break
+                if sync_id != 'DATA':
+                    self._sync_fail(sock, sync_id, length, remote)
+                f.write(self._recv_exactly(sock, length))
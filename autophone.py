@@ -21,6 +21,8 @@ import sys
 import threading
 import traceback
 
+from multiprocessing.pool import ThreadPool
+
 from manifestparser import TestManifest
 
 import builds
@@ -148,6 +150,7 @@ class AutoPhone(object):
         self.read_devices()
 
         self.state = ProcessStates.RUNNING
+        self.close_device_shell_sessions()
         for worker in self.phone_workers.values():
             worker.start()
 
@@ -300,6 +303,7 @@ class AutoPhone(object):
                     try:
                         new_worker = self.create_worker(worker.phone)
                         new_worker.crashes = crashes
+                        self.close_device_shell_sessions()
                         new_worker.start(initial_state)
                     except Exception, e:
                         console_logger.info('Worker %s failed to restart' %
@@ -547,30 +551,14 @@ class AutoPhone(object):
                 console_logger.warning(response)
             else:
                 try:
-                    dm = ADBDevice(
-                        device=serialno,
-                        device_ready_retry_wait=self.options.device_ready_retry_wait,
-                        device_ready_retry_attempts=self.options.device_ready_retry_attempts,
-                        verbose=self.options.verbose)
-
-                    dm.power_on()
-                    device = {"device_name": phoneid,
-                              "serialno": serialno,
-                              "dm" : dm}
-                    device['osver'] = dm.get_prop('ro.build.version.release')
-                    device['hardware'] = dm.get_prop('ro.product.model')
-                    device['abi'] = dm.get_prop('ro.product.cpu.abi')
-                    try:
-                        sdk = int(dm.get_prop('ro.build.version.sdk'))
-                        device['sdk'] = 'api-9' if sdk <= 10 else 'api-11'
-                    except ValueError:
-                        device['sdk'] = 'api-9'
+                    device = self.init_device(phoneid, serialno)
                     self._devices[phoneid] = device
                     # We must reload the test manifest again to pick up the
                     # new device's test configuration.
                     console_logger.info('Adding device %s %s' % (phoneid, serialno))
                     self.read_tests()
                     self.register_cmd(device)
+                    self.close_device_shell_sessions()
                     self.phone_workers[phoneid].start()
                 except Exception, e:
                     self.purge_worker(phoneid)
@@ -759,31 +747,71 @@ ok
                 self.purge_worker(phoneid)
                 raise
 
+    def init_device(self, device_name, serialno):
+        """Creates the ADBDevice for a device, powers it on and reads its
+        properties returning the device dict used by register_cmd."""
+        dm = ADBDevice(device=serialno,
+                       device_ready_retry_wait=self.options.device_ready_retry_wait,
+                       device_ready_retry_attempts=self.options.device_ready_retry_attempts,
+                       shell_sessions=self.options.device_shell_sessions,
+                       use_socket=self.options.device_use_socket,
+                       capabilities_cache=self.options.device_capabilities_cache,
+                       props_ttl=self.options.device_props_ttl,
+                       push_tar=self.options.device_push_tar,
+                       push_tar_compress=self.options.device_push_tar_compress,
+                       verbose=self.options.verbose)
+        dm.power_on()
+        device = {"device_name": device_name,
+                  "serialno": serialno,
+                  "dm" : dm}
+        props = dm.get_props()
+        device['osver'] = props.get('ro.build.version.release', '')
+        device['hardware'] = props.get('ro.product.model', '')
+        device['abi'] = props.get('ro.product.cpu.abi', '')
+        try:
+            sdk = int(props.get('ro.build.version.sdk', ''))
+            device['sdk'] = 'api-9' if sdk <= 10 else 'api-11'
+        except ValueError:
+            device['sdk'] = 'api-9'
+        return device
+
+    def close_device_shell_sessions(self):
+        """Closes the adb shell sessions opened by the main process so
+        that they are not inherited by the worker processes."""
+        for device in self._devices.values():
+            device['dm'].close_shell_sessions()
+
     def read_devices(self):
         cfg = ConfigParser.RawConfigParser()
         cfg.read(self.options.devicescfg)
 
-        for device_name in cfg.sections():
-            # failure for a device to have a serialno option is fatal.
-            serialno = cfg.get(device_name, 'serialno')
+        # failure for a device to have a serialno option is fatal.
+        devices = [(device_name, cfg.get(device_name, 'serialno'))
+                   for device_name in cfg.sections()]
+
+        def initialize_device((device_name, serialno)):
             console_logger.info("Initializing device name=%s, serialno=%s" % (device_name, serialno))
             try:
-                dm = ADBDevice(device=serialno,
-                               device_ready_retry_wait=self.options.device_ready_retry_wait,
-                               device_ready_retry_attempts=self.options.device_ready_retry_attempts,
-                               verbose=self.options.verbose)
-                dm.power_on()
-                device = {"device_name": device_name,
-                          "serialno": serialno,
-                          "dm" : dm}
-                device['osver'] = dm.get_prop('ro.build.version.release')
-                device['hardware'] = dm.get_prop('ro.product.model')
-                device['abi'] = dm.get_prop('ro.product.cpu.abi')
-                try:
-                    sdk = int(dm.get_prop('ro.build.version.sdk'))
-                    device['sdk'] = 'api-9' if sdk <= 10 else 'api-11'
-                except ValueError:
-                    device['sdk'] = 'api-9'
+                return self.init_device(device_name, serialno), None
+            except Exception, e:
+                logger.exception('Unable to initialize device %s' % device_name)
+                return None, e
+
+        # Device initialization is dominated by adb latency so the
+        # devices are initialized concurrently. They are then registered
+        # in the order they appear in the devices configuration.
+        pool = ThreadPool(max(1, min(self.options.device_init_threads,
+                                     len(devices))))
+        try:
+            results = pool.map(initialize_device, devices)
+        finally:
+            pool.close()
+            pool.join()
+
+        for (device_name, serialno), (device, e) in zip(devices, results):
+            try:
+                if e:
+                    raise e
                 self._devices[device_name] = device
                 self.register_cmd(device)
             except Exception, e:
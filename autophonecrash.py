@@ -7,15 +7,18 @@
 # http://dxr.mozilla.org/mozilla-central/source/build/mobile/remoteautomation.py
 # http://developer.android.com/training/articles/perf-anr.html
 
+import Queue
 import glob
 import logging
 import os
 import subprocess
 import re
 import sys
-from collections import namedtuple
+import threading
+from collections import OrderedDict, namedtuple
 
 from adb import ADBError
+from utils import get_file_hash
 
 # Set the logger globally in the file, but this must be reset when
 # used in a child process.
@@ -35,6 +38,18 @@ StackInfo = namedtuple("StackInfo",
 
 
 class AutophoneCrashProcessor(object):
+    # Maximum number of minidump_stackwalk processes run at the same
+    # time by process_dump_files.
+    STACKWALK_PROCESSES = 4
+    # The output of successful runs of minidump_stackwalk is cached
+    # keyed on the hash of the dump file and the identity of the
+    # symbols and the minidump_stackwalk binary so that duplicate dumps
+    # are only processed once. The cache is shared by all of the instances in
+    # the process and holds at most MAX_STACKWALK_RESULTS results.
+    MAX_STACKWALK_RESULTS = 100
+    _stackwalk_results = OrderedDict()
+    _stackwalk_results_lock = threading.Lock()
+
     def __init__(self, adbdevice, remote_profile_dir, upload_dir, app_name):
         """Initialize an AutophoneCrashProcessor object.
 
@@ -184,7 +199,104 @@ class AutophoneCrashProcessor(object):
                 break
         return exception
 
-    def _process_dump_file(self, path, extra, symbols_path, stackwalk_binary, clean=True):
+    @staticmethod
+    def _get_identity(path):
+        """Returns a tuple identifying the current contents of the file
+        or directory path."""
+        try:
+            return (os.path.realpath(path), os.stat(path).st_mtime)
+        except OSError:
+            return (path, None)
+
+    def _get_stackwalk_keys(self, dump_files, symbols_path,
+                            stackwalk_binary):
+        """Returns a dict mapping the path of each dump file to the key
+        of its cached minidump_stackwalk result or None if the dump
+        file can not be read. Each dump file is hashed once."""
+        symbols_identity = self._get_identity(symbols_path)
+        stackwalk_identity = self._get_identity(stackwalk_binary)
+        keys = {}
+        for path, extra in dump_files:
+            try:
+                keys[path] = (get_file_hash(path), symbols_identity,
+                              stackwalk_identity)
+            except (IOError, OSError):
+                keys[path] = None
+        return keys
+
+    def _stackwalk(self, path, symbols_path, stackwalk_binary, key=None):
+        """Returns a tuple of the stdout, stderr and return code of
+        minidump_stackwalk for the dump file path, running
+        minidump_stackwalk only if the result for key is not already
+        cached. Only successful results are cached."""
+        cls = AutophoneCrashProcessor
+        if key:
+            with cls._stackwalk_results_lock:
+                result = cls._stackwalk_results.pop(key, None)
+                if result:
+                    # Move the result to the end of the cache.
+                    cls._stackwalk_results[key] = result
+                    logger.debug('AutophoneCrashProcessor._stackwalk: '
+                                 'using cached result for %s' % path)
+                    return result
+        # run minidump_stackwalk
+        p = subprocess.Popen([stackwalk_binary, path, symbols_path],
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE,
+                             close_fds=True)
+        (out, err) = p.communicate()
+        result = (out, err, p.returncode)
+        if not key or p.returncode != 0 or not out:
+            return result
+        with cls._stackwalk_results_lock:
+            cls._stackwalk_results[key] = result
+            while len(cls._stackwalk_results) > cls.MAX_STACKWALK_RESULTS:
+                cls._stackwalk_results.popitem(last=False)
+        return result
+
+    def _stackwalk_dump_files(self, keys, symbols_path, stackwalk_binary):
+        """Runs minidump_stackwalk on the dump files in parallel using
+        at most STACKWALK_PROCESSES processes and returns a dict mapping
+        the key of each dump file to its minidump_stackwalk result,
+        including failed results which are not cached. keys maps the
+        path of each dump file to its key as returned by
+        _get_stackwalk_keys. Dump files with the same contents are only
+        processed once."""
+        paths = {}
+        for path, key in keys.iteritems():
+            if key:
+                paths.setdefault(key, path)
+        results = {}
+        work = Queue.Queue()
+        for key, path in paths.iteritems():
+            work.put((path, key))
+
+        def stackwalk():
+            while True:
+                try:
+                    path, key = work.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    results[key] = self._stackwalk(path, symbols_path,
+                                                   stackwalk_binary, key=key)
+                except Exception:
+                    # The dump file will be processed again by
+                    # _process_dump_file which will report the error.
+                    logger.exception('AutophoneCrashProcessor.'
+                                     '_stackwalk_dump_files: %s' % path)
+
+        threads = [threading.Thread(target=stackwalk,
+                                    name='Stackwalk-%d' % i)
+                   for i in range(min(len(paths), self.STACKWALK_PROCESSES))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _process_dump_file(self, path, extra, symbols_path, stackwalk_binary,
+                           clean=True, key=None, result=None):
         """Process a single dump file using stackwalk_binary, and return a
         tuple containing properties of the crash dump.
 
@@ -193,6 +305,11 @@ class AutophoneCrashProcessor(object):
         :param symbols_path: Path to the directory containing symbols.
         :param stackwalk_binary: Path to the minidump_stackwalk binary.
         :param clean: If True, remove dump file after processing.
+        :param key: Key of the cached minidump_stackwalk result as
+                    returned by _get_stackwalk_keys or None.
+        :param result: Tuple of the stdout, stderr and return code of
+                       minidump_stackwalk if it has already been run
+                       on the dump file or None.
         :return: A StackInfo tuple with the fields::
                    minidump_path: Path of the dump file
                    signature: The top frame of the stack trace, or None if it
@@ -216,12 +333,10 @@ class AutophoneCrashProcessor(object):
         retcode = None
         if (symbols_path and stackwalk_binary and
             os.path.exists(stackwalk_binary)):
-            # run minidump_stackwalk
-            p = subprocess.Popen([stackwalk_binary, path, symbols_path],
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE)
-            (out, err) = p.communicate()
-            retcode = p.returncode
+            if not result:
+                result = self._stackwalk(path, symbols_path,
+                                         stackwalk_binary, key=key)
+            (out, err, retcode) = result
             if len(out) > 3:
                 # minidump_stackwalk is chatty,
                 # so ignore stderr when it succeeds.
@@ -267,43 +382,19 @@ class AutophoneCrashProcessor(object):
                          errors,
                          extra)
 
-    def get_crashes(self, symbols_path, stackwalk_binary, clean=True, root=True):
-        """Returns a list of crash summaries for any crash dumps found on the device.
-
-        Note that the crash dumps are deleted as a side effect.
+    def pull_dump_files(self, root=True):
+        """Copies the ANR traces, tombstones and crash dumps from the
+        device to the upload_dir and returns a list of tuples of the
+        paths to the dump files and their extra files in the upload_dir.
 
-        :param symbols_path: path on host to the directory
-            containing the symbols for the Firefox build being tested.
-        :param stackwalk_binary: path on host to the
-            minidump_stackwalk binary to be used to parse the dump files.
-        :param clean: If True, remove dump files after processing.
-
-        Example:
-        [
-          {
-            'reason': 'PROCESS-CRASH',
-            'signature': 'libmm-color-convertor.so + 0x1232',
-            'stackwalk_output': '...',
-            'stackwalk_errors': '...'
-          },
-        ]
+        Returns None if the crash directory does not exist on the device.
         """
         self.check_for_anr_traces()
         self.check_for_tombstones()
 
-        crashes = []
         if (not self.remote_dump_dir or
             not self.adb.is_dir(self.remote_dump_dir, root=root)):
-            # If crash reporting is enabled (MOZ_CRASHREPORTER=1), the
-            # minidumps directory is automatically created when Fennec
-            # (first) starts, so its lack of presence is a hint that
-            # something went wrong.
-            logger.warning("Automation Error: No crash directory (%s) "
-                                "found on remote device" % self.remote_dump_dir)
-            crashes.append({'reason': 'PROFILE-ERROR',
-                            'signature': "No crash directory (%s) found on remote device" %
-                            self.remote_dump_dir})
-            return crashes
+            return None
         self.adb.chmod(self.remote_dump_dir, recursive=True, root=root)
         self.adb.pull(self.remote_dump_dir, self.upload_dir)
         if self.adb.is_dir(self.remote_pending_crashreports_dir, root=root):
@@ -317,8 +408,47 @@ class AutophoneCrashProcessor(object):
             logger.warning("Found %d dump files -- limited to %d!" % (len(dump_files), max_dumps))
             del dump_files[max_dumps:]
         logger.debug('AutophoneCrashProcessor.dump_files: %s' % dump_files)
+        return dump_files
+
+    def profile_error(self):
+        # If crash reporting is enabled (MOZ_CRASHREPORTER=1), the
+        # minidumps directory is automatically created when Fennec
+        # (first) starts, so its lack of presence is a hint that
+        # something went wrong.
+        logger.warning("Automation Error: No crash directory (%s) "
+                            "found on remote device" % self.remote_dump_dir)
+        return {'reason': 'PROFILE-ERROR',
+                'signature': "No crash directory (%s) found on remote device" %
+                self.remote_dump_dir}
+
+    def process_dump_files(self, dump_files, symbols_path, stackwalk_binary,
+                           clean=True):
+        """Returns a list of crash summaries for the dump files which
+        have been copied to the host by pull_dump_files. Only uses the
+        host and can be called after the device has been released.
+
+        :param dump_files: list of tuples of the paths to the dump
+            files and their extra files.
+        :param symbols_path: path on host to the directory
+            containing the symbols for the Firefox build being tested.
+        :param stackwalk_binary: path on host to the
+            minidump_stackwalk binary to be used to parse the dump files.
+        :param clean: If True, remove dump files after processing.
+        """
+        crashes = []
+        keys = {}
+        results = {}
+        if (symbols_path and stackwalk_binary and
+            os.path.exists(stackwalk_binary)):
+            keys = self._get_stackwalk_keys(dump_files, symbols_path,
+                                            stackwalk_binary)
+            results = self._stackwalk_dump_files(keys, symbols_path,
+                                                 stackwalk_binary)
         for path, extra in dump_files:
-            info = self._process_dump_file(path, extra, symbols_path, stackwalk_binary, clean=clean)
+            key = keys.get(path)
+            info = self._process_dump_file(path, extra, symbols_path, stackwalk_binary,
+                                           clean=clean, key=key,
+                                           result=results.get(key))
             stackwalk_output = ["Crash dump filename: %s" % info.minidump_path]
             if info.stackwalk_stderr:
                 stackwalk_output.append("stderr from minidump_stackwalk:")
@@ -337,6 +467,51 @@ class AutophoneCrashProcessor(object):
                  'stackwalk_errors': '\n'.join(info.stackwalk_errors)})
         return crashes
 
+    def get_crashes(self, symbols_path, stackwalk_binary, clean=True, root=True):
+        """Returns a list of crash summaries for any crash dumps found on the device.
+
+        Note that the crash dumps are deleted as a side effect.
+
+        :param symbols_path: path on host to the directory
+            containing the symbols for the Firefox build being tested.
+        :param stackwalk_binary: path on host to the
+            minidump_stackwalk binary to be used to parse the dump files.
+        :param clean: If True, remove dump files after processing.
+
+        Example:
+        [
+          {
+            'reason': 'PROCESS-CRASH',
+            'signature': 'libmm-color-convertor.so + 0x1232',
+            'stackwalk_output': '...',
+            'stackwalk_errors': '...'
+          },
+        ]
+        """
+        dump_files = self.pull_dump_files(root=root)
+        if dump_files is None:
+            return [self.profile_error()]
+        return self.process_dump_files(dump_files, symbols_path,
+                                       stackwalk_binary, clean=clean)
+
+    def collect_errors(self, root=True):
+        """Collects the errors which require the device and returns a
+        tuple of the list of Java exception and profile errors and the
+        list of dump files to be passed to process_dump_files.
+
+        The device side of get_errors. The ANR trace, tombstones and
+        crash dumps are copied from the device to the upload_dir.
+        """
+        errors = []
+        java_exception = self.get_java_exception()
+        if java_exception:
+            errors.append(java_exception)
+        dump_files = self.pull_dump_files(root=root)
+        if dump_files is None:
+            errors.append(self.profile_error())
+            dump_files = []
+        return errors, dump_files
+
     def get_errors(self, symbols_path, stackwalk_binary, clean=True):
         """Processes ANRs, tombstones and crash dumps on the device and
         returns a list of errors.
@@ -373,9 +548,7 @@ class AutophoneCrashProcessor(object):
              'stackwalk_errors': '...'
            }
         """
-        errors = []
-        java_exception = self.get_java_exception()
-        if java_exception:
-            errors.append(java_exception)
-        errors.extend(self.get_crashes(symbols_path, stackwalk_binary, clean=clean))
+        errors, dump_files = self.collect_errors()
+        errors.extend(self.process_dump_files(dump_files, symbols_path,
+                                              stackwalk_binary, clean=clean))
         return errors
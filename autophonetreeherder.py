@@ -8,7 +8,6 @@ import json
 import logging
 import os
 import re
-import tempfile
 import time
 import urlparse
 
@@ -281,7 +280,10 @@ class AutophoneTreeherder(object):
                 'content_type': 'link',
                 'title': 'Build'})
 
-            t.end_timestamp = timestamp_now()
+            # A CompletedTest records the time the test completed
+            # since its results may be submitted later.
+            if not t.end_timestamp:
+                t.end_timestamp = timestamp_now()
             # A usercancelled job may not have a start_timestamp
             # since it may have been cancelled before it started.
             if not t.start_timestamp:
@@ -338,40 +340,40 @@ class AutophoneTreeherder(object):
                 fname = '%s-logcat.log' % log_identifier
                 lname = 'logcat'
                 key = "%s/%s" % (key_prefix, fname)
-                with tempfile.NamedTemporaryFile(suffix='logcat.txt') as f:
+                # If the device is in an error state we can't get the
+                # current logcat but we can upload any logcat output
+                # we accumulated previously. The accumulated logcat is
+                # uploaded directly from the logcat store's spool file.
+                worker_ok = self.worker.is_ok()
+                try:
+                    if worker_ok:
+                        t.logcat.get()
+                except Exception, e:
+                    logger.exception('Error reading logcat %s' % fname)
+                    t.job_details.append({
+                        'value': 'Failed to read %s: %s' % (fname, e),
+                        'content_type': 'text',
+                        'title': 'Error'})
+                try:
+                    url = self.s3_bucket.upload(
+                        t.logcat.store.path, key,
+                        compressed=t.logcat.store.compress)
+                    t.job_details.append({
+                        'url': url,
+                        'value': lname,
+                        'content_type': 'link',
+                        'title': 'artifact uploaded'})
+                except S3Error, e:
+                    logger.exception('Error uploading logcat %s' % fname)
+                    t.job_details.append({
+                        'value': 'Failed to upload %s: %s' % (fname, e),
+                        'content_type': 'text',
+                        'title': 'Error'})
+                if worker_ok:
                     try:
-                        if self.worker.is_ok():
-                            for line in t.logcat.get(full=True):
-                                f.write('%s\n' % line.encode('UTF-8',
-                                                             errors='replace'))
-                            t.logcat.reset()
-                        else:
-                            # Device is in an error state so we can't
-                            # get the full logcat but we can output
-                            # any logcat output we accumulated
-                            # previously.
-                            for line in t.logcat._accumulated_logcat:
-                                f.write('%s\n' % line.encode('UTF-8',
-                                                             errors='replace'))
+                        t.logcat.reset()
                     except Exception, e:
-                        logger.exception('Error reading logcat %s' % fname)
-                        t.job_details.append({
-                            'value': 'Failed to read %s: %s' % (fname, e),
-                            'content_type': 'text',
-                            'title': 'Error'})
-                    try:
-                        url = self.s3_bucket.upload(f.name, key)
-                        t.job_details.append({
-                            'url': url,
-                            'value': lname,
-                            'content_type': 'link',
-                            'title': 'artifact uploaded'})
-                    except S3Error, e:
-                        logger.exception('Error uploading logcat %s' % fname)
-                        t.job_details.append({
-                            'value': 'Failed to upload %s: %s' % (fname, e),
-                            'content_type': 'text',
-                            'title': 'Error'})
+                        logger.exception('Error resetting logcat %s' % fname)
                 # Upload directory containing ANRs, tombstones and other items
                 # to be uploaded.
                 if t.upload_dir:
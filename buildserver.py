@@ -3,18 +3,113 @@
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import SocketServer
+import collections
 import errno
 import json
+import logging
 import socket
 import threading
 import urlparse
 
 DEFAULT_PORT = 28008
 
+# Set the logger globally in the file, but this must be reset when
+# used in a child process.
+logger = logging.getLogger()
+
 class BuildCacheServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
 
     build_cache = None
+    # cache_lock serializes the foreground requests. Each build is also
+    # locked while it is being fetched so that a foreground request
+    # for a build which is being prefetched waits for the prefetch to
+    # complete. Prefetches do not hold the cache_lock so that they do
+    # not delay foreground requests for other builds.
     cache_lock = threading.Lock()
+    # Locks for the builds being fetched mapping the build url to a
+    # list of the lock and the number of its users.
+    build_locks = {}
+    build_locks_lock = threading.Lock()
+    # Pending prefetch requests mapping the build url to a list of the
+    # number of outstanding requests for the build, enable_unittests
+    # and the set of test package names. The requests are fetched in
+    # order by a single prefetch thread so that prefetches do not
+    # compete with each other.
+    prefetch_condition = threading.Condition()
+    prefetches = collections.OrderedDict()
+    prefetch_thread = None
+
+    def acquire_build_lock(self, build):
+        with self.build_locks_lock:
+            build_lock = self.build_locks.setdefault(build,
+                                                     [threading.Lock(), 0])
+            build_lock[1] += 1
+        build_lock[0].acquire()
+
+    def release_build_lock(self, build):
+        with self.build_locks_lock:
+            build_lock = self.build_locks[build]
+            build_lock[0].release()
+            build_lock[1] -= 1
+            if not build_lock[1]:
+                del self.build_locks[build]
+
+    def prefetch(self, build, enable_unittests=False, test_package_names=None):
+        """Queues the build to be fetched into the build cache in the
+        background. Prefetched builds are fetched through the build
+        cache's get method and are subject to the same cache expiration
+        as any other build."""
+        with self.prefetch_condition:
+            prefetch = self.prefetches.get(build)
+            if prefetch:
+                prefetch[0] += 1
+                prefetch[1] = prefetch[1] or enable_unittests
+                prefetch[2].update(test_package_names or [])
+            else:
+                self.prefetches[build] = [1, enable_unittests,
+                                          set(test_package_names or [])]
+            if not self.prefetch_thread:
+                BuildCacheServer.prefetch_thread = threading.Thread(
+                    target=self.prefetch_loop, name='BuildCachePrefetch')
+                self.prefetch_thread.daemon = True
+                self.prefetch_thread.start()
+            self.prefetch_condition.notify()
+
+    def cancel_prefetch(self, build):
+        """Cancels a prefetch request for the build. The build is
+        removed from the pending prefetches once all of the requests for
+        it have been cancelled. A prefetch which is already in progress
+        is not interrupted."""
+        with self.prefetch_condition:
+            prefetch = self.prefetches.get(build)
+            if not prefetch:
+                return False
+            prefetch[0] -= 1
+            if prefetch[0] <= 0:
+                del self.prefetches[build]
+            return True
+
+    def prefetch_loop(self):
+        while True:
+            with self.prefetch_condition:
+                while not self.prefetches:
+                    self.prefetch_condition.wait()
+                build, (count, enable_unittests, test_package_names) = \
+                    self.prefetches.popitem(last=False)
+            logger.info('BuildCacheServer: prefetching %s' % build)
+            self.acquire_build_lock(build)
+            try:
+                results = self.build_cache.get(
+                    build,
+                    enable_unittests=enable_unittests,
+                    test_package_names=test_package_names)
+                if not results['success']:
+                    logger.warning('BuildCacheServer: prefetching %s: %s' %
+                                   (build, results['error']))
+            except Exception:
+                logger.exception('BuildCacheServer: prefetching %s' % build)
+            finally:
+                self.release_build_lock(build)
 
 
 class BuildCacheHandler(SocketServer.BaseRequestHandler):
@@ -42,6 +137,11 @@ class BuildCacheHandler(SocketServer.BaseRequestHandler):
                 if line == 'quit' or line == 'exit':
                     return
                 cmds = line.split()
+                command = 'get'
+                if cmds[0] in ('prefetch', 'cancel_prefetch'):
+                    command = cmds.pop(0)
+                    if not cmds:
+                        continue
                 build = cmds[0]
                 force = False
                 enable_unittests = False
@@ -57,6 +157,24 @@ class BuildCacheHandler(SocketServer.BaseRequestHandler):
                         enable_unittests = True
                     elif cmd.lower() == 'test_packages':
                         collecting_test_packages = True
+                if command == 'prefetch':
+                    self.server.prefetch(
+                        build,
+                        enable_unittests=enable_unittests,
+                        test_package_names=test_package_names)
+                    results = {'success': True, 'error': '', 'metadata': ''}
+                    self.request.send(json.dumps(results) + '\n')
+                    continue
+                if command == 'cancel_prefetch':
+                    cancelled = self.server.cancel_prefetch(build)
+                    results = {
+                        'success': cancelled,
+                        'error': '' if cancelled else 'No pending prefetch',
+                        'metadata': ''
+                    }
+                    self.request.send(json.dumps(results) + '\n')
+                    continue
+                self.server.acquire_build_lock(build)
                 self.server.cache_lock.acquire()
                 try:
                     results = self.server.build_cache.get(
@@ -72,6 +190,7 @@ class BuildCacheHandler(SocketServer.BaseRequestHandler):
                     }
                 finally:
                     self.server.cache_lock.release()
+                    self.server.release_build_lock(build)
                 self.request.send(json.dumps(results) + '\n')
 
 
@@ -92,8 +211,6 @@ class BuildCacheClient(object):
 
     def get(self, url, force=False, enable_unittests=False,
             test_package_names=None):
-        if not self.sock:
-            self.connect()
         line = url
         force = force or not urlparse.urlparse(url).scheme.startswith('http')
         if force:
@@ -104,6 +221,26 @@ class BuildCacheClient(object):
             line += ' test_packages'
             for test_package in test_package_names:
                 line += ' ' + test_package
+        return self._request(line)
+
+    def prefetch(self, url, enable_unittests=False, test_package_names=None):
+        """Asks the server to fetch the build into the cache in the
+        background. Returns immediately."""
+        line = 'prefetch ' + url
+        if enable_unittests:
+            line += ' enable_unittests'
+        if test_package_names:
+            line += ' test_packages'
+            for test_package in test_package_names:
+                line += ' ' + test_package
+        return self._request(line)
+
+    def cancel_prefetch(self, url):
+        return self._request('cancel_prefetch ' + url)
+
+    def _request(self, line):
+        if not self.sock:
+            self.connect()
         self.sock.sendall(line + '\n')
         buf = ''
         while not '\n' in buf:
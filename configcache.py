@@ -0,0 +1,78 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import ConfigParser
+import glob
+import os
+import threading
+
+# Process wide caches of parsed test configuration files and of the
+# files in the push source directories which are shared by the
+# PhoneTest instances. Entries are keyed on the path and are reused
+# until the path's modification time changes.
+_lock = threading.Lock()
+_configs = {}
+_sources = {}
+
+
+def _get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def get_config(path, parser_class=ConfigParser.ConfigParser,
+               case_sensitive=False):
+    """Returns a parser of class parser_class which has read the
+    configuration file path. The parser is shared by all of the callers
+    requesting the same path, parser_class and case_sensitive and must
+    not be modified.
+
+    :param str path: path to the configuration file. A missing file
+        results in an empty configuration as with ConfigParser.read.
+    :param parser_class: ConfigParser.ConfigParser or
+        ConfigParser.RawConfigParser.
+    :param bool case_sensitive: Flag specifying if option names are
+        case-sensitive. Defaults to False.
+
+    """
+    key = (path, parser_class, case_sensitive)
+    mtime = _get_mtime(path)
+    with _lock:
+        entry = _configs.get(key)
+        if entry and entry[0] == mtime:
+            return entry[1]
+        cfg = parser_class()
+        if case_sensitive:
+            cfg.optionxform = str
+        cfg.read(path)
+        _configs[key] = (mtime, cfg)
+        return cfg
+
+
+def get_source_files(source):
+    """Returns the sorted list of paths matching source + '*' excluding
+    backup files ending in ~ or .bak.
+
+    :param str source: push source directory ending in /.
+
+    """
+    mtime = _get_mtime(source)
+    with _lock:
+        entry = _sources.get(source)
+        if entry and entry[0] == mtime:
+            return entry[1]
+        paths = tuple(sorted(path for path in glob.glob(source + '*')
+                             if not path.endswith('~') and
+                             not path.endswith('.bak')))
+        _sources[source] = (mtime, paths)
+        return paths
+
+
+def clear():
+    """Clears the caches."""
+    with _lock:
+        _configs.clear()
+        _sources.clear()
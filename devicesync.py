@@ -0,0 +1,144 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import logging
+import os
+import posixpath
+import tempfile
+
+from utils import get_file_hash
+
+# Set the logger globally in the file, but this must be reset when
+# used in a child process.
+logger = logging.getLogger()
+
+# Name of the file in the destination directory on the device which
+# lists the hash and path of each file installed by sync_directory.
+MANIFEST_NAME = '.autophone-manifest'
+
+
+def quote(path):
+    """Returns path quoted for the device's shell."""
+    return "'%s'" % path.replace("'", "'\\''")
+
+
+def build_manifest(pushes, dest):
+    """Returns a dict mapping the path relative to dest of each file
+    which will be installed on the device to the file's local path and
+    hash.
+
+    :param dict pushes: maps local files or directories to the paths on
+        the device to which they are pushed. The device paths must be
+        in dest.
+    :param str dest: the destination directory on the device.
+
+    """
+    manifest = {}
+    for source, push_dest in pushes.iteritems():
+        relpath = posixpath.relpath(push_dest, dest)
+        if relpath.startswith('..'):
+            raise ValueError('%s is not in %s' % (push_dest, dest))
+        if not os.path.isdir(source):
+            manifest[relpath] = (source, get_file_hash(source))
+            continue
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                parts = os.path.relpath(path, source).split(os.sep)
+                manifest[posixpath.join(relpath, *parts)] = (
+                    path, get_file_hash(path))
+    return manifest
+
+
+def format_manifest(manifest):
+    return ''.join('%s %s\n' % (manifest[relpath][1], relpath)
+                   for relpath in sorted(manifest))
+
+
+def parse_manifest(text):
+    """Returns a dict mapping relative paths to hashes."""
+    hashes = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            file_hash, relpath = line.split(' ', 1)
+            hashes[relpath] = file_hash
+    return hashes
+
+
+def sync_directory(dm, pushes, dest, timeout=None):
+    """Installs the local files and directories in pushes to the
+    directory dest on the device, only pushing the files which have
+    changed since the previous sync and removing the files which are
+    no longer present.
+
+    The hash and path of each installed file is recorded in a manifest
+    in dest which is read in a single adb call to determine which files
+    have changed. The manifest is removed before the directory is
+    modified and is only rewritten once all of the files have been
+    installed so that an interrupted sync is followed by a complete
+    installation.
+
+    :param dm: ADBDevice.
+    :param dict pushes: maps local files or directories to the paths on
+        the device to which they are pushed.
+    :param str dest: the destination directory on the device.
+    :param timeout: optional timeout for the adb calls.
+    :returns: tuple of the numbers of files pushed and removed.
+    :raises: * ADBTimeoutError
+             * ADBError
+
+    """
+    manifest = build_manifest(pushes, dest)
+    manifest_path = posixpath.join(dest, MANIFEST_NAME)
+    result = dm.shell_batch(['cat %s' % quote(manifest_path)],
+                            timeout=timeout)[0]
+    if result.exitcode == 0:
+        device_hashes = parse_manifest(result.output)
+    else:
+        device_hashes = {}
+    changed = sorted(relpath for relpath in manifest
+                     if device_hashes.get(relpath) != manifest[relpath][1])
+    removed = sorted(relpath for relpath in device_hashes
+                     if relpath not in manifest)
+    if not changed and not removed:
+        logger.debug('sync_directory: %s is up to date' % dest)
+        return 0, 0
+
+    dm.rm(manifest_path, force=True, timeout=timeout)
+    if not device_hashes:
+        # Nothing is known about the contents of dest. Install all of
+        # the pushes, which pushes whole directories in single calls.
+        dm.rm(dest, recursive=True, force=True, timeout=timeout)
+        dm.mkdir(dest, parents=True, timeout=timeout)
+        for source, push_dest in pushes.iteritems():
+            dm.push(source, push_dest, timeout=timeout)
+    else:
+        if removed:
+            dm.shell_batch(['rm %s' % quote(posixpath.join(dest, relpath))
+                            for relpath in removed],
+                           stop_on_error=False, timeout=timeout)
+        device_dirs = set(posixpath.dirname(relpath)
+                          for relpath in device_hashes)
+        for relpath in changed:
+            dirname = posixpath.dirname(relpath)
+            if dirname not in device_dirs:
+                dm.mkdir(posixpath.join(dest, dirname), parents=True,
+                         timeout=timeout)
+                device_dirs.add(dirname)
+            dm.push(manifest[relpath][0], posixpath.join(dest, relpath),
+                    timeout=timeout)
+
+    manifest_file = tempfile.NamedTemporaryFile(suffix='.manifest',
+                                                delete=False)
+    try:
+        manifest_file.write(format_manifest(manifest))
+        manifest_file.close()
+        dm.push(manifest_file.name, manifest_path, timeout=timeout)
+    finally:
+        os.unlink(manifest_file.name)
+    logger.debug('sync_directory: %s pushed %d removed %d files' % (
+        dest, len(changed), len(removed)))
+    return len(changed), len(removed)
@@ -280,10 +280,58 @@ class Jobs(object):
                     job['id']))
 
         job['tests'] = []
+        for test, guid in self._get_job_tests(conn, job['id'], worker):
+            test.job_guid = guid
+            job['tests'].append(test)
+        logger.debug('jobs.get_next_job: %s' % job)
+        self._commit_connection(conn)
+        self._close_connection(conn)
+        return job
+
+    def peek_next_job(self, lifo=False, device=None, worker=None,
+                      exclude_job_id=None):
+        """Returns the job which would be returned by the next call to
+        get_next_job, ignoring the job with id exclude_job_id, without
+        modifying the database. The job's tests item is the list of the
+        worker's tests for the job, but unlike get_next_job the tests'
+        job_guids are not set.
+
+        Used by the worker to prefetch the build for its next job
+        while the current job is running.
+        """
+        if not device:
+            device = self.default_device
+        order = 'desc' if lifo else 'asc'
+
+        conn = self._conn()
+        job_cursor = self._execute_sql(
+            conn,
+            'select id,build_url,enable_unittests,'
+            'instr(build_url,"try") as istry '
+            'from jobs where device=? and attempts<? and id!=? '
+            'order by istry desc, created %s' % order,
+            values=(device, self.MAX_ATTEMPTS, exclude_job_id or -1))
+        job_row = job_cursor.fetchone()
+        job_cursor.close()
+        if not job_row:
+            self._close_connection(conn)
+            return None
+
+        job = {'id': job_row[0],
+               'build_url': job_row[1],
+               'enable_unittests': job_row[2],
+               'tests': [test for test, guid in
+                         self._get_job_tests(conn, job_row[0], worker)]}
+        self._close_connection(conn)
+        return job
+
+    def _get_job_tests(self, conn, job_id, worker):
+        """Returns a list of tuples of the worker's tests which are to be
+        executed for the job and the corresponding test guids."""
         test_cursor = self._execute_sql(
             conn,
             'select name, config_file, chunk, repos, guid '
-            'from tests where jobid=?', values=(job['id'],))
+            'from tests where jobid=?', values=(job_id,))
 
         test_rows = [
             {
@@ -297,20 +345,20 @@ class Jobs(object):
         ]
         test_cursor.close()
 
+        tests = []
+        worker_tests = {}
+        for test in worker.tests:
+            worker_tests.setdefault((test.name, test.config_file, test.chunk),
+                                    []).append(test)
         for test_row in test_rows:
             # Generate the list of tests to be executed for this job
             test_row['repos'].sort()
-            for test in worker.tests:
-                if (test.name == test_row['name'] and
-                    test.config_file == test_row['config_file'] and
-                    test.chunk == test_row['chunk'] and
-                    test.repos == test_row['repos']):
-                    test.job_guid = test_row['guid']
-                    job['tests'].append(test)
-        logger.debug('jobs.get_next_job: %s' % job)
-        self._commit_connection(conn)
-        self._close_connection(conn)
-        return job
+            for test in worker_tests.get((test_row['name'],
+                                          test_row['config_file'],
+                                          test_row['chunk']), []):
+                if test.repos == test_row['repos']:
+                    tests.append((test, test_row['guid']))
+        return tests
 
     def cancel_test(self, test_guid, device=None):
         logger.debug('jobs.cancel_test: test %s device %s' % (
@@ -0,0 +1,180 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import re
+import time
+from collections import namedtuple
+
+# logcat -v time lines begin with a date time of the form
+# 09-17 16:45:04.370
+LOGCAT_DATE_RE = re.compile(r'\d\d-\d\d \d\d:\d\d:\d\d\.\d\d\d')
+
+# name is the name of the pattern which matched, position is the
+# number of the line in the scanned output, time is the MM-DD
+# HH:MM:SS.mmm date time of the line or None, match is the regular
+# expression match object and line is the logcat line.
+LogcatEvent = namedtuple('LogcatEvent',
+                         ['name', 'position', 'time', 'match', 'line'])
+
+
+class LogcatPattern(object):
+    def __init__(self, name, regex, substrings=None):
+        self.name = name
+        if isinstance(regex, basestring):
+            regex = re.compile(regex)
+        self.regex = regex
+        self.substrings = substrings or []
+
+    def match(self, line):
+        for substring in self.substrings:
+            if substring in line:
+                break
+        else:
+            if self.substrings:
+                return None
+        return self.regex.match(line)
+
+
+class LogcatScanner(object):
+    """LogcatScanner scans logcat output in a single pass for a set of
+    named patterns and returns a LogcatEvent for each match.
+
+    Each pattern may specify substrings of which at least one must be
+    present in a line for the pattern's regular expression to be
+    tried. If every pattern specifies substrings, lines which contain
+    none of them are rejected by a single combined search before any
+    of the patterns' regular expressions are tried.
+
+    ::
+
+       scanner = LogcatScanner(self.logcat)
+       scanner.add('throbber_start', throbber_start_regex, ['Throbber start'])
+       scanner.add('throbber_stop', throbber_stop_regex, ['Throbber stop'])
+       for event in scanner.scan():
+           if event.name == 'throbber_start':
+               ...
+
+    scan() reads the new output from the Logcat object since the
+    previous call so that each line is only scanned once. wait() and
+    iter_events() block until matching output appears rather than
+    sleeping for a fixed time between scans.
+
+    """
+    # Minimum time in seconds since the previous scan of the Logcat
+    # object's output for wait() to scan again before waiting. This
+    # prevents consecutive calls to wait() from reading the output,
+    # which may dump the device's logcat buffer, twice in a row.
+    MIN_SCAN_INTERVAL = 1
+
+    def __init__(self, logcat=None):
+        """Initializes the LogcatScanner object.
+
+        :param logcat: optional Logcat object from which scan() reads
+            new output.
+
+        """
+        self.logcat = logcat
+        self.patterns = []
+        #: number of lines scanned.
+        self.position = 0
+        #: date time of the first scanned line with a date time.
+        self.base_time = None
+        self._prefilter = None
+        self._last_scan_time = None
+
+    def add(self, name, regex, substrings=None):
+        """Adds a pattern to the scanner.
+
+        :param str name: name of the pattern used for its events.
+        :param regex: regular expression string or compiled regular
+            expression which is matched against the beginning of
+            each line.
+        :param substrings: optional list of strings at least one of
+            which must be present in a line for it to match.
+
+        """
+        self.patterns.append(LogcatPattern(name, regex, substrings))
+        if [p for p in self.patterns if not p.substrings]:
+            self._prefilter = None
+        else:
+            self._prefilter = re.compile('|'.join(
+                re.escape(s) for p in self.patterns for s in p.substrings))
+
+    def scan(self, lines=None):
+        """Scans lines returning the list of events for the patterns
+        which match. A line which matches several patterns produces an
+        event for each of them in the order the patterns were added.
+
+        :param lines: list of lines to be scanned. Defaults to the new
+            output returned by the Logcat object.
+
+        """
+        if lines is None:
+            lines = self.logcat.get()
+            self._last_scan_time = time.time()
+        events = []
+        prefilter = self._prefilter
+        for line in lines:
+            position = self.position
+            self.position += 1
+            if self.base_time is None and LOGCAT_DATE_RE.match(line):
+                self.base_time = line[:18]
+            if prefilter and not prefilter.search(line):
+                continue
+            for pattern in self.patterns:
+                match = pattern.match(line)
+                if match:
+                    if LOGCAT_DATE_RE.match(line):
+                        line_time = line[:18]
+                    else:
+                        line_time = None
+                    events.append(LogcatEvent(pattern.name, position,
+                                              line_time, match, line))
+        return events
+
+    def wait(self, timeout, names=None):
+        """Scans the new output from the Logcat object until an event
+        is found or timeout seconds have elapsed, waking as soon as new
+        output is available. The output is not scanned before waiting
+        if it was scanned within the last MIN_SCAN_INTERVAL seconds.
+
+        :param timeout: maximum time in seconds to wait.
+        :param names: optional list of pattern names. If specified, only
+            events for these patterns end the wait.
+        :returns: list of all of the events scanned.
+
+        """
+        deadline = time.time() + timeout
+        if (self._last_scan_time is None or
+            time.time() - self._last_scan_time >= self.MIN_SCAN_INTERVAL):
+            events = self.scan()
+        else:
+            events = []
+        while not [e for e in events if names is None or e.name in names]:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self.logcat.wait(remaining)
+            events.extend(self.scan())
+        return events
+
+    def iter_events(self, max_time, wait_time, names=None):
+        """Generates lists of events from the new output of the Logcat
+        object for up to max_time seconds. Each list is generated as
+        soon as an event is found or after wait_time seconds without
+        one, which allows the caller to check for other conditions such
+        as crashes. The caller stops the iteration once it has found
+        the events it requires.
+
+        :param max_time: maximum time in seconds to generate events.
+        :param wait_time: maximum time in seconds between lists.
+        :param names: optional list of pattern names passed to wait().
+
+        """
+        deadline = time.time() + max_time
+        while True:
+            remaining = max(0, deadline - time.time())
+            yield self.wait(min(wait_time, remaining), names=names)
+            if time.time() >= deadline:
+                break
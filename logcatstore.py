@@ -0,0 +1,169 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import gzip
+import os
+import tempfile
+import zlib
+from collections import deque
+
+
+class LogcatStore(object):
+    """LogcatStore accumulates logcat lines in a spool file on disk
+    keeping only the most recent lines in memory.
+
+    If compress is True, the spool file is written as a single gzip
+    member. flush() makes the lines appended so far readable without
+    completing the member. Reading path completes the member so that
+    the spool file can be uploaded as is. Lines appended after path
+    has been read are written to a new member.
+
+    ::
+
+       store = LogcatStore(compress=True)
+       store.extend(lines)
+       for line in store:
+           ...
+       upload(store.path)
+       store.close()
+
+    The spool file is created when the first lines are appended and is
+    removed by close().
+
+    """
+    TAIL_LINES = 1000
+
+    def __init__(self, compress=False, tail_lines=None, dir=None):
+        """Initializes the LogcatStore object.
+
+        :param bool compress: Flag specifying if the spool file is to be
+            gzip compressed. Defaults to False.
+        :param tail_lines: number of the most recent lines to be kept in
+            memory. Defaults to LogcatStore.TAIL_LINES.
+        :type tail_lines: integer or None
+        :param dir: directory in which to create the spool file.
+            Defaults to the system temporary directory.
+        :type dir: str or None
+
+        """
+        self.compress = compress
+        self.dir = dir
+        #: deque containing the most recent lines.
+        self.tail = deque(maxlen=tail_lines or self.TAIL_LINES)
+        self._path = None
+        self._file = None
+        self._gzip = None
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        """Returns an iterator over all of the lines in the store which
+        reads the spool file lazily."""
+        if not self._length:
+            return iter([])
+        self.flush()
+        return self._read_lines(self._path)
+
+    def _read_lines(self, path):
+        with open(path, 'rb') as f:
+            if self.compress:
+                lines = self._decompress_lines(f)
+            else:
+                lines = f
+            for line in lines:
+                yield unicode(line, 'UTF-8', errors='replace').rstrip('\n')
+
+    def _decompress_lines(self, f):
+        """Generates the lines of the gzip file f which may be followed
+        by further members and whose last member may not have been
+        completed."""
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        pending = ''
+        while True:
+            data = f.read(64*1024)
+            if not data:
+                break
+            pending += decompressor.decompress(data)
+            while decompressor.unused_data:
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                pending += decompressor.decompress(data)
+            lines = pending.split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line
+        if pending:
+            yield pending
+
+    def _open(self):
+        if self._file:
+            return
+        if self.compress:
+            suffix = '-logcat.log.gz'
+        else:
+            suffix = '-logcat.log'
+        fd, self._path = tempfile.mkstemp(suffix=suffix, dir=self.dir)
+        self._file = os.fdopen(fd, 'wb')
+
+    def extend(self, lines):
+        """Appends lines to the store."""
+        if not lines:
+            return
+        self._open()
+        if self.compress and not self._gzip:
+            self._gzip = gzip.GzipFile(filename='', mode='wb',
+                                       fileobj=self._file)
+        f = self._gzip or self._file
+        for line in lines:
+            f.write('%s\n' % line.encode('UTF-8', errors='replace'))
+            self.tail.append(line)
+            self._length += 1
+
+    def flush(self):
+        """Flushes the spool file so that it contains all of the lines
+        which have been appended."""
+        if self._gzip:
+            # A sync flush makes the compressed data written so far
+            # decodable without completing the member.
+            self._gzip.flush(zlib.Z_SYNC_FLUSH)
+        elif self._file:
+            self._file.flush()
+
+    @property
+    def path(self):
+        """Path of the flushed spool file. If compress is True, the
+        gzip member is completed. The spool file is created if
+        necessary."""
+        self._open()
+        if self.compress:
+            if not self._gzip and not self._file.tell():
+                # An empty file is not a valid gzip file.
+                self._gzip = gzip.GzipFile(filename='', mode='wb',
+                                           fileobj=self._file)
+            if self._gzip:
+                # Closing the GzipFile completes the member without
+                # closing the spool file.
+                self._gzip.close()
+                self._gzip = None
+        self._file.flush()
+        return self._path
+
+    def close(self):
+        """Closes and removes the spool file."""
+        if self._gzip:
+            self._gzip.close()
+            self._gzip = None
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self._path:
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+            self._path = None
+        self.tail.clear()
+        self._length = 0
@@ -58,14 +58,31 @@ class AutophoneOptions(object):
         # ini options
         self.build_cache_size = BuildCache.MAX_NUM_BUILDS
         self.build_cache_expires = BuildCache.EXPIRE_AFTER_DAYS
+        self.build_cache_prefetch = PhoneWorker.BUILD_CACHE_PREFETCH
         self.device_ready_retry_wait = PhoneWorker.DEVICE_READY_RETRY_WAIT
         self.device_ready_retry_attempts = PhoneWorker.DEVICE_READY_RETRY_ATTEMPTS
+        self.device_shell_sessions = PhoneWorker.DEVICE_SHELL_SESSIONS
+        self.device_use_socket = PhoneWorker.DEVICE_USE_SOCKET
+        self.device_capabilities_cache = PhoneWorker.DEVICE_CAPABILITIES_CACHE
+        self.device_props_ttl = PhoneWorker.DEVICE_PROPS_TTL
+        self.device_init_threads = PhoneWorker.DEVICE_INIT_THREADS
+        self.device_logcat_stream = PhoneWorker.DEVICE_LOGCAT_STREAM
+        self.device_logcat_compress = PhoneWorker.DEVICE_LOGCAT_COMPRESS
+        self.device_sync_local_pages = PhoneWorker.DEVICE_SYNC_LOCAL_PAGES
+        self.device_push_tar = PhoneWorker.DEVICE_PUSH_TAR
+        self.device_push_tar_compress = PhoneWorker.DEVICE_PUSH_TAR_COMPRESS
         self.device_battery_min = PhoneWorker.DEVICE_BATTERY_MIN
         self.device_battery_max = PhoneWorker.DEVICE_BATTERY_MAX
+        self.profile_cache = PhoneWorker.PROFILE_CACHE
+        self.profile_cache_size = PhoneWorker.PROFILE_CACHE_SIZE
+        self.post_test_queue_size = PhoneWorker.POST_TEST_QUEUE_SIZE
         self.phone_retry_limit = PhoneWorker.DEVICE_READY_RETRY_ATTEMPTS
         self.phone_retry_wait = PhoneWorker.DEVICE_READY_RETRY_WAIT
         self.phone_max_reboots = PhoneWorker.PHONE_MAX_REBOOTS
+        self.phone_reboot_interval = PhoneWorker.PHONE_REBOOT_INTERVAL
+        self.phone_reuse_build = PhoneWorker.PHONE_REUSE_BUILD
         self.phone_ping_interval = PhoneWorker.PHONE_PING_INTERVAL
+        self.phone_health_check_window = PhoneWorker.PHONE_HEALTH_CHECK_WINDOW
         self.phone_command_queue_timeout = PhoneWorker.PHONE_COMMAND_QUEUE_TIMEOUT
         self.phone_crash_window = Crashes.CRASH_WINDOW
         self.phone_crash_limit = Crashes.CRASH_LIMIT
@@ -122,14 +139,31 @@ class AutophoneOptions(object):
                      'maximum_heartbeat',
                      'build_cache_size',
                      'build_cache_expires',
+                     'build_cache_prefetch',
                      'device_ready_retry_wait',
                      'device_ready_retry_attempts',
+                     'device_shell_sessions',
+                     'device_use_socket',
+                     'device_capabilities_cache',
+                     'device_props_ttl',
+                     'device_init_threads',
+                     'device_logcat_stream',
+                     'device_logcat_compress',
+                     'device_sync_local_pages',
+                     'device_push_tar',
+                     'device_push_tar_compress',
                      'device_battery_min',
                      'device_battery_max',
+                     'profile_cache',
+                     'profile_cache_size',
+                     'post_test_queue_size',
                      'phone_retry_limit',
                      'phone_retry_wait',
                      'phone_max_reboots',
+                     'phone_reboot_interval',
+                     'phone_reuse_build',
                      'phone_ping_interval',
+                     'phone_health_check_window',
                      'phone_command_queue_timeout',
                      'phone_crash_window',
                      'phone_crash_limit',
@@ -4,7 +4,7 @@
 
 import ConfigParser
 import datetime
-import glob
+import json
 import logging
 import os
 import posixpath
@@ -12,16 +12,23 @@ import re
 import sys
 import shutil
 import tempfile
+import time
 
+from collections import namedtuple
 from time import sleep
 
 from mozprofile import FirefoxProfile
 
+import configcache
 import utils
 from autophonecrash import AutophoneCrashProcessor
 from adb import ADBError
+from devicesync import sync_directory
+from logcatscanner import LOGCAT_DATE_RE
+from logcatstore import LogcatStore
 from logdecorator import LogDecorator
 from phonestatus import PhoneStatus
+from profilecache import ProfileCache
 from sensitivedatafilter import SensitiveDataFilter
 
 # Set the logger globally in the file, but this must be reset when
@@ -30,11 +37,27 @@ logger = logging.getLogger()
 
 
 class Logcat(object):
+    # Maximum time in seconds to wait for a newly started logcat
+    # reader to catch up with the device's logcat buffer.
+    READER_START_TIMEOUT = 60
+    # Time in seconds between dumps of the device's logcat buffer
+    # when waiting for new output.
+    POLL_INTERVAL = 1
+
     def __init__(self, phonetest, logger):
         logger.debug('Logcat()')
         self.phonetest = phonetest
         self.logger = logger
-        self._accumulated_logcat = []
+        #: LogcatStore containing the accumulated logcat.
+        self.store = LogcatStore(
+            compress=phonetest.options.device_logcat_compress)
+        self._last_datestr = '00-00 00:00:00.000'
+        self._last_datestr_lines = set()
+        self._reader = None
+        self._reader_sequence = 0
+        # New lines dumped by wait() which are returned by the next
+        # call to get().
+        self._pending = []
 
     def get(self, full=False):
         """Return the contents of logcat as list of strings.
@@ -42,20 +65,162 @@ class Logcat(object):
         :param full: optional boolean which defaults to False. If full
                      is False, then get() will only return logcat
                      output since the last call to clear(). If
-                     full is True, then get() will return all
-                     logcat output since the test was initialized or
-                     teardown_job was last called.
+                     full is True, then get() will return an iterator
+                     over all logcat output since the test was
+                     initialized or teardown_job was last called
+                     which is read lazily from the store.
+
+        If the device_logcat_stream option is set, the output is
+        collected by a continuously running adb logcat rather than
+        by dumping the device's logcat buffer on each call.
         """
-
-        # Get the datetime from the last logcat message
-        # previously collected. Note that with the time
-        # format, logcat lines begin with a date time of the
-        # form: 09-17 16:45:04.370 which is the first 18
-        # characters of the line.
-        if self._accumulated_logcat:
-            logcat_datestr = self._accumulated_logcat[-1][:18]
+        current_logcat, self._pending = self._pending, []
+        if self.phonetest.options.device_logcat_stream:
+            current_logcat += self._get_stream()
         else:
-            logcat_datestr = '00-00 00:00:00.000'
+            current_logcat += self._get_dump()
+
+        if full:
+            return iter(self.store)
+        return current_logcat
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for new logcat output.
+
+        If the logcat is being streamed, wait() returns as soon as
+        new output has been read. Otherwise, wait() dumps the device's
+        logcat buffer every POLL_INTERVAL seconds until new output is
+        found which is then returned by the next call to get().
+
+        :returns: boolean - False if no new output arrived before the
+                  timeout.
+        """
+        if self._pending:
+            return True
+        if self._reader and self._reader.is_alive():
+            return self._reader.wait(self._reader_sequence, timeout)
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            sleep(min(remaining, self.POLL_INTERVAL))
+            if self.phonetest.options.device_logcat_stream:
+                # The reader has exited. get() restarts it.
+                return True
+            self._pending = self._get_dump()
+            if self._pending:
+                return True
+
+    def _accumulate(self, lines):
+        """Append lines to the accumulated logcat while maintaining the
+        last logcat date and the set of lines seen on that date which
+        are used to eliminate duplicates."""
+        self.store.extend(lines)
+        for line in lines:
+            datestr = line[:18]
+            if datestr != self._last_datestr:
+                self._last_datestr = datestr
+                self._last_datestr_lines = set()
+            self._last_datestr_lines.add(line)
+
+    def _get_dump(self):
+        for attempt in range(1, self.phonetest.options.phone_retry_limit+1):
+            try:
+                raw_logcat = [
+                    unicode(x, 'UTF-8', errors='replace').strip()
+                    for x in self.phonetest.dm.get_logcat(filter_specs=['*:V'])]
+                break
+            except ADBError:
+                self.logger.exception('Attempt %d get logcat' % attempt)
+                if attempt == self.phonetest.options.phone_retry_limit:
+                    raise
+                sleep(self.phonetest.options.phone_retry_wait)
+        current_logcat = self._remove_duplicates(raw_logcat)
+        self._accumulate(current_logcat)
+        return current_logcat
+
+    def _get_stream(self):
+        current_logcat = []
+        if self._reader:
+            alive = self._reader.is_alive()
+            current_logcat = self._read_stream()
+            self._accumulate(current_logcat)
+            if not alive:
+                # adb logcat exits when the device disconnects or
+                # reboots.
+                self.logger.debug('Logcat.get(): logcat reader exited')
+                self._stop_reader()
+        if not self._reader:
+            new_logcat = self._start_reader()
+            self._accumulate(new_logcat)
+            current_logcat += new_logcat
+        return current_logcat
+
+    def _read_stream(self):
+        lines, self._reader_sequence, lost = self._reader.read(
+            self._reader_sequence)
+        if lost:
+            self.logger.warning('Logcat.get(): lost %d lines' % lost)
+        return lines
+
+    def _start_reader(self):
+        """Start the logcat reader returning the lines from the device's
+        logcat buffer which have not already been accumulated."""
+        self.logger.debug('Logcat._start_reader()')
+        self._reader = self.phonetest.dm.get_logcat_reader(
+            filter_specs=['*:V'])
+        self._reader_sequence = 0
+        # adb logcat first outputs the existing contents of the
+        # device's logcat buffer which may already have been
+        # accumulated. Log a marker and treat the output up to the
+        # marker as if it were a dump of the buffer.
+        marker = 'Autophone Logcat reader %s' % datetime.datetime.now().isoformat()
+        try:
+            self.phonetest.dm.shell_output('log %s' % marker)
+        except:
+            self._stop_reader()
+            raise
+        raw_logcat = []
+        deadline = (datetime.datetime.now() +
+                    datetime.timedelta(seconds=self.READER_START_TIMEOUT))
+        while True:
+            remaining = (deadline - datetime.datetime.now()).total_seconds()
+            if not self._reader.wait(self._reader_sequence, remaining):
+                self.logger.warning('Logcat._start_reader(): '
+                                    'timed out waiting for marker')
+                break
+            lines = self._read_stream()
+            raw_logcat.extend(lines)
+            if [line for line in lines if marker in line]:
+                break
+        return self._remove_duplicates(raw_logcat)
+
+    def _stop_reader(self):
+        if self._reader:
+            self._reader.stop()
+            self._reader = None
+
+    def _parse_date(self, line, year):
+        try:
+            return datetime.datetime.strptime('%4d-%s' % (
+                year, line[:18]), '%Y-%m-%d %H:%M:%S.%f')
+        except ValueError:
+            return None
+
+    def _remove_duplicates(self, raw_logcat):
+        """Return the lines from raw_logcat which have not already been
+        accumulated.
+
+        The work done is proportional to the length of raw_logcat and
+        does not depend on the number of accumulated lines.
+        """
+
+        # The datetime from the last logcat message previously
+        # collected. Note that with the time format, logcat lines
+        # begin with a date time of the form: 09-17 16:45:04.370 which
+        # is the first 18 characters of the line.
+        logcat_datestr = self._last_datestr
 
         self.logger.debug('Logcat.get() since %s' % logcat_datestr)
 
@@ -74,30 +239,27 @@ class Logcat(object):
         # than an hour, a decision must be made on which date is
         # legitimate.
 
-        for attempt in range(1, self.phonetest.options.phone_retry_limit+1):
-            try:
-                raw_logcat = [
-                    unicode(x, 'UTF-8', errors='replace').strip()
-                    for x in self.phonetest.dm.get_logcat(filter_specs=['*:V'])]
-                break
-            except ADBError:
-                self.logger.exception('Attempt %d get logcat' % attempt)
-                if attempt == self.phonetest.options.phone_retry_limit:
-                    raise
-                sleep(self.phonetest.options.phone_retry_wait)
+        # Consecutive lines which begin with the same MM-DD HH can not
+        # be an hour or more apart, so the dates are only parsed when
+        # the hour changes.
 
         current_logcat = []
-        prev_line_date = None
-        curr_line_date = None
+        prev_line = None
+        prev_line_hour = None
         curr_year = datetime.datetime.now().year
         hour = datetime.timedelta(hours=1)
 
         for line in raw_logcat:
-            try:
-                curr_line_date = datetime.datetime.strptime('%4d-%s' % (
-                    curr_year, line[:18]), '%Y-%m-%d %H:%M:%S.%f')
-            except ValueError:
-                curr_line_date = None
+            if LOGCAT_DATE_RE.match(line):
+                curr_line_hour = line[:8]
+            else:
+                curr_line_hour = None
+            if (curr_line_hour and prev_line_hour and
+                curr_line_hour != prev_line_hour):
+                prev_line_date = self._parse_date(prev_line, curr_year)
+                curr_line_date = self._parse_date(line, curr_year)
+            else:
+                prev_line_date = curr_line_date = None
             if curr_line_date and prev_line_date:
                 delta = curr_line_date - prev_line_date
                 prev_line_datestr = prev_line_date.strftime('%m-%d %H:%M:%S.%f')
@@ -131,19 +293,12 @@ class Logcat(object):
             # logcat date.
             if line >= logcat_datestr:
                 current_logcat.append(line)
-            prev_line_date = curr_line_date
+            prev_line = line
+            prev_line_hour = curr_line_hour
 
         # In order to eliminate the possible duplicate
-        # messages, partition the messages by before, on and
+        # messages, partition the messages by on and
         # after the logcat_datestr.
-        accumulated_logcat_before = []
-        accumulated_logcat_now = []
-        for x in self._accumulated_logcat:
-            if x < logcat_datestr:
-                accumulated_logcat_before.append(x)
-            elif x[:18] == logcat_datestr:
-                accumulated_logcat_now.append(x)
-
         current_logcat_now = []
         current_logcat_after = []
         for x in current_logcat:
@@ -155,20 +310,17 @@ class Logcat(object):
         # Remove any previously received messages from
         # current_logcat_now for the logcat_datestr.
         current_logcat_now = set(current_logcat_now).difference(
-            set(accumulated_logcat_now))
+            self._last_datestr_lines)
         current_logcat_now = list(current_logcat_now)
         current_logcat_now.sort()
 
-        current_logcat = current_logcat_now + current_logcat_after
-        self._accumulated_logcat += current_logcat
-
-        if full:
-            return self._accumulated_logcat
-        return current_logcat
+        return current_logcat_now + current_logcat_after
 
     def reset(self):
         """Clears the Logcat buffers and the device's logcat buffer."""
         self.logger.debug('Logcat.reset()')
+        self._stop_reader()
+        self.store.close()
         self.__init__(self.phonetest, self.logger)
         self.phonetest.dm.clear_logcat()
 
@@ -184,9 +336,20 @@ class Logcat(object):
 
 class PhoneTest(object):
     # Use instances keyed on phoneid+':'config_file+':'+str(chunk)
-    # to lookup tests.
+    # to lookup tests. The instances are also indexed by phoneid, name
+    # and job_guid in order to avoid scanning every instance in match.
 
     instances = {}
+    _instances_by_phoneid = {}
+    _instances_by_job_guid = {}
+    # _instances_by_name is rebuilt when first needed after instances
+    # are added or removed or their chunks are changed since a test's
+    # name depends on its chunks.
+    _instances_by_name = None
+    # _build_url_compatibility caches the result of
+    # is_compatible_build_url keyed on (build_url, abi, sdk, repos).
+    _build_url_compatibility = {}
+    MAX_BUILD_URL_COMPATIBILITY = 10000
 
     @classmethod
     def lookup(cls, phoneid, config_file, chunk):
@@ -195,6 +358,53 @@ class PhoneTest(object):
             return PhoneTest.instances[key]
         return None
 
+    @classmethod
+    def is_compatible_build_url(cls, build_url, abi, sdk, repos):
+        """Returns True if a build from build_url can be tested on a
+        device with the given abi and sdk by a test defined for the
+        list of repositories repos."""
+        key = (build_url, abi, sdk, tuple(repos))
+        try:
+            return PhoneTest._build_url_compatibility[key]
+        except KeyError:
+            pass
+        # First assume the test and build are compatible.
+        compatible = True
+        # x86 devices can only test x86 builds and non-x86
+        # devices can not test x86 builds.
+        if abi == 'x86':
+            if 'x86' not in build_url:
+                compatible = False
+        else:
+            if 'x86' in build_url:
+                compatible = False
+        # If the build_url does not contain an sdk level, then
+        # assume this is an build from before the split sdk
+        # builds were first created. Otherwise the build_url
+        # must match this device's supported sdk levels.
+        if ('api-9' not in build_url and 'api-10' not in build_url and
+            'api-11' not in build_url):
+            pass
+        elif sdk not in build_url:
+            compatible = False
+
+        # The test may be defined for multiple repositories.
+        # We are interested if this particular build is
+        # supported by this test. First assume it is
+        # incompatible, and only accept it if the build_url is
+        # from one of the supported repositories.
+        if compatible and repos:
+            compatible = False
+            for repo in repos:
+                if repo in build_url:
+                    compatible = True
+                    break
+
+        if len(PhoneTest._build_url_compatibility) >= cls.MAX_BUILD_URL_COMPATIBILITY:
+            PhoneTest._build_url_compatibility.clear()
+        PhoneTest._build_url_compatibility[key] = compatible
+        return compatible
+
     @classmethod
     def match(cls, tests=None, test_name=None, phoneid=None,
               config_file=None, chunk=None, job_guid=None,
@@ -207,7 +417,20 @@ class PhoneTest(object):
                                         build_url))
         matches = []
         if not tests:
-            tests = [PhoneTest.instances[key] for key in PhoneTest.instances.keys()]
+            # Use the most selective index to find the candidate
+            # tests which are then checked against all of the
+            # criteria.
+            if phoneid and config_file and chunk:
+                test = PhoneTest.lookup(phoneid, config_file, chunk)
+                tests = [test] if test else []
+            elif job_guid:
+                tests = PhoneTest._instances_by_job_guid.get(job_guid, [])
+            elif phoneid:
+                tests = PhoneTest._instances_by_phoneid.get(phoneid, [])
+            elif test_name:
+                tests = PhoneTest._get_instances_by_name().get(test_name, [])
+            else:
+                tests = PhoneTest.instances.values()
 
         for test in tests:
             if test_name and test_name != test.name:
@@ -225,45 +448,9 @@ class PhoneTest(object):
             if job_guid and job_guid != test.job_guid:
                 continue
 
-            if build_url:
-                abi = test.phone.abi
-                sdk = test.phone.sdk
-                # First assume the test and build are compatible.
-                incompatible_job = False
-                # x86 devices can only test x86 builds and non-x86
-                # devices can not test x86 builds.
-                if abi == 'x86':
-                    if 'x86' not in build_url:
-                        incompatible_job = True
-                else:
-                    if 'x86' in build_url:
-                        incompatible_job = True
-                # If the build_url does not contain an sdk level, then
-                # assume this is an build from before the split sdk
-                # builds were first created. Otherwise the build_url
-                # must match this device's supported sdk levels.
-                if ('api-9' not in build_url and 'api-10' not in build_url and
-                    'api-11' not in build_url):
-                    pass
-                elif sdk not in build_url:
-                    incompatible_job  = True
-
-                if incompatible_job:
-                    continue
-
-                # The test may be defined for multiple repositories.
-                # We are interested if this particular build is
-                # supported by this test. First assume it is
-                # incompatible, and only accept it if the build_url is
-                # from one of the supported repositories.
-                if test.repos:
-                    incompatible_job = True
-                    for repo in test.repos:
-                        if repo in build_url:
-                            incompatible_job = False
-                            break
-                    if incompatible_job:
-                        continue
+            if build_url and not PhoneTest.is_compatible_build_url(
+                    build_url, test.phone.abi, test.phone.sdk, test.repos):
+                continue
 
             matches.append(test)
 
@@ -271,6 +458,15 @@ class PhoneTest(object):
 
         return matches
 
+    @classmethod
+    def _get_instances_by_name(cls):
+        if PhoneTest._instances_by_name is None:
+            instances_by_name = {}
+            for test in PhoneTest.instances.values():
+                instances_by_name.setdefault(test.name, []).append(test)
+            PhoneTest._instances_by_name = instances_by_name
+        return PhoneTest._instances_by_name
+
     def __init__(self, dm=None, phone=None, options=None, config_file=None, chunk=1, repos=[]):
         # Ensure that repos is a list and that it is sorted in order
         # for comparisons with the tests loaded from the jobs database
@@ -285,10 +481,11 @@ class PhoneTest(object):
         self._preferences = None
         self._environment = None
         self.config_file = config_file
-        self.cfg = ConfigParser.ConfigParser()
-        # Make the values in the config file case-sensitive
-        self.cfg.optionxform = str
-        self.cfg.read(self.config_file)
+        # The parsed config file is shared by all of the tests using
+        # it and must not be modified. Its option names are
+        # case-sensitive.
+        self.cfg = configcache.get_config(self.config_file,
+                                          case_sensitive=True)
         self.enable_unittests = False
         self.chunk = chunk
         self.chunks = 1
@@ -309,6 +506,18 @@ class PhoneTest(object):
         self.test_logfilehandler = None
         self._base_device_path = ''
         self.profile_path = '/data/local/tmp/profile'
+        # Cached profiles are kept on the device in
+        # profile_snapshots_path/<profile key> so that the profile can
+        # be restored without pushing it again.
+        self.profile_snapshots_path = '/data/local/tmp/profile-snapshots'
+        # profile_cache is shared by the worker's tests so that a
+        # profile is only created once for each combination of
+        # preferences and addons.
+        if options.profile_cache:
+            self.profile_cache = ProfileCache(options.profile_cache,
+                                              options.profile_cache_size)
+        else:
+            self.profile_cache = None
         self.repos = repos
         self.test_logfile = None
         self.unittest_logpath = None
@@ -378,9 +587,7 @@ class PhoneTest(object):
         # _pushes = {'sourcepath' : 'destpath', ...}
         self._pushes = {}
         for source in self._paths['sources']:
-            for push in glob.glob(source + '*'):
-                if push.endswith('~') or push.endswith('.bak'):
-                    continue
+            for push in configcache.get_source_files(source):
                 push_dest = posixpath.join(self._paths['dest'],
                                            os.path.basename(push))
                 self._pushes[push] = push_dest
@@ -409,11 +616,51 @@ class PhoneTest(object):
         key = '%s:%s:%s' % (phoneid, config_file, chunk)
         assert key not in PhoneTest.instances, 'Duplicate PhoneTest %s' % key
         PhoneTest.instances[key] = self
+        PhoneTest._instances_by_phoneid.setdefault(phoneid, []).append(self)
+        PhoneTest._instances_by_name = None
 
     def remove(self):
         key = '%s:%s:%s' % (self.phone.id, self.config_file, self.chunk)
-        if key in PhoneTest.instances:
+        if PhoneTest.instances.get(key) is self:
+            self._unindex_job_guid()
             del PhoneTest.instances[key]
+            PhoneTest._instances_by_phoneid[self.phone.id].remove(self)
+            if not PhoneTest._instances_by_phoneid[self.phone.id]:
+                del PhoneTest._instances_by_phoneid[self.phone.id]
+            PhoneTest._instances_by_name = None
+
+    def _unindex_job_guid(self):
+        job_guid = getattr(self, '_job_guid', None)
+        tests = PhoneTest._instances_by_job_guid.get(job_guid)
+        if tests and self in tests:
+            tests.remove(self)
+            if not tests:
+                del PhoneTest._instances_by_job_guid[job_guid]
+
+    @property
+    def job_guid(self):
+        return self._job_guid
+
+    @job_guid.setter
+    def job_guid(self, job_guid):
+        # Keep the job_guid index up to date for registered instances.
+        self._unindex_job_guid()
+        self._job_guid = job_guid
+        key = '%s:%s:%s' % (self.phone.id, self.config_file, self.chunk)
+        if job_guid and PhoneTest.instances.get(key) is self:
+            PhoneTest._instances_by_job_guid.setdefault(job_guid,
+                                                        []).append(self)
+
+    @property
+    def chunks(self):
+        return self._chunks
+
+    @chunks.setter
+    def chunks(self, chunks):
+        # A test's name depends on its chunks which are set after the
+        # instance has been added.
+        self._chunks = chunks
+        PhoneTest._instances_by_name = None
 
     @property
     def preferences(self):
@@ -696,33 +943,19 @@ class PhoneTest(object):
         if not self.crash_processor:
             return
 
-        for error in self.crash_processor.get_errors(self.build.symbols,
-                                                     self.options.minidump_stackwalk,
-                                                     clean=False):
-            if error['reason'] == 'java-exception':
-                self.test_failure(
-                    self.name, 'PROCESS-CRASH',
-                    error['signature'],
-                    PhoneTestResult.EXCEPTION)
-            elif error['reason'] == 'PROFILE-ERROR':
-                self.test_failure(
-                    self.name,
-                    error['reason'],
-                    error['signature'],
-                    PhoneTestResult.TESTFAILED)
-            elif error['reason'] == 'PROCESS-CRASH':
-                self.loggerdeco.info("PROCESS-CRASH | %s | "
-                                     "application crashed [%s]" % (self.name,
-                                                                   error['signature']))
-                self.loggerdeco.info(error['stackwalk_output'])
-                self.loggerdeco.info(error['stackwalk_errors'])
-
-                self.test_failure(self.name,
-                                  error['reason'],
-                                  'application crashed [%s]' % error['signature'],
-                                  PhoneTestResult.TESTFAILED)
-            else:
-                self.loggerdeco.warning('Unknown error reason: %s' % error['reason'])
+        errors = self.crash_processor.get_errors(self.build.symbols,
+                                                 self.options.minidump_stackwalk,
+                                                 clean=False)
+        report_errors(self, errors)
+
+    def collect_crashes(self):
+        """Collects the Java exceptions, ANR traces, tombstones and crash
+        dumps from the device without processing the dumps. Returns a
+        tuple of the list of errors and the list of dump files which
+        are processed later by CompletedTest.process_crashes."""
+        if not self.crash_processor:
+            return [], []
+        return self.crash_processor.collect_errors()
 
     def create_profile(self, custom_addons=[], custom_prefs=None, root=True):
         # Create, install and initialize the profile to be
@@ -740,7 +973,7 @@ class PhoneTest(object):
             prefs = dict(self.preferences.items() + custom_prefs.items())
         else:
             prefs = self.preferences
-        profile = FirefoxProfile(preferences=prefs, addons=addons)
+        profile = self.build_profile(prefs, addons)
         if not self.install_profile(profile):
             return False
 
@@ -760,6 +993,15 @@ class PhoneTest(object):
 
         return success
 
+    def build_profile(self, prefs, addons):
+        """Returns a profile with the preferences prefs and the addons
+        addons. If the profile cache is enabled, the profile is only
+        created if the cache does not already contain a profile with the
+        same preferences and addon contents."""
+        if not self.profile_cache:
+            return FirefoxProfile(preferences=prefs, addons=addons)
+        return self.profile_cache.get(prefs, addons)
+
     def wait_for_fennec(self, max_wait_time=60, wait_time=5,
                         kill_wait_time=20, root=True):
         # Wait for up to a max_wait_time seconds for fennec to close
@@ -793,14 +1035,18 @@ class PhoneTest(object):
         for attempt in range(1, self.options.phone_retry_limit+1):
             self.loggerdeco.debug('Attempt %d Installing local pages' % attempt)
             try:
-                self.dm.rm(self._paths['dest'], recursive=True, force=True)
-                self.dm.mkdir(self._paths['dest'], parents=True)
-                for push_source in self._pushes:
-                    push_dest = self._pushes[push_source]
-                    if os.path.isdir(push_source):
-                        self.dm.push(push_source, push_dest)
-                    else:
-                        self.dm.push(push_source, push_dest)
+                if self.options.device_sync_local_pages:
+                    pushed, removed = sync_directory(self.dm, self._pushes,
+                                                     self._paths['dest'])
+                    self.loggerdeco.debug('Synchronized local pages: '
+                                          'pushed %d, removed %d files' %
+                                          (pushed, removed))
+                else:
+                    self.dm.rm(self._paths['dest'], recursive=True,
+                               force=True)
+                    self.dm.mkdir(self._paths['dest'], parents=True)
+                    for push_source in self._pushes:
+                        self.dm.push(push_source, self._pushes[push_source])
                 success = True
                 break
             except ADBError:
@@ -822,6 +1068,17 @@ class PhoneTest(object):
                     raise
                 sleep(self.options.phone_retry_wait)
 
+    def log_full_logcat(self, message):
+        """Collects the current logcat from the device and, if debug
+        logging is enabled, logs message followed by the full logcat
+        read line by line from the store."""
+        full_logcat = self.logcat.get(full=True)
+        if self.loggerdeco.getEffectiveLevel() != logging.DEBUG:
+            return
+        self.loggerdeco.debug(message)
+        for line in full_logcat:
+            self.loggerdeco.debug(line)
+
     def setup_job(self):
         # Log the current full contents of logcat, then clear the
         # logcat buffers to help prevent the device's buffer from
@@ -830,9 +1087,8 @@ class PhoneTest(object):
         self.stop_time = self.start_time
         # Clear the Treeherder job details.
         self.job_details = []
-        self.loggerdeco.debug('phonetest.setup_job: full logcat before job:')
         try:
-            self.loggerdeco.debug('\n'.join(self.logcat.get(full=True)))
+            self.log_full_logcat('phonetest.setup_job: full logcat before job:')
         except:
             self.loggerdeco.exception('Exception getting logcat')
         try:
@@ -900,11 +1156,21 @@ class PhoneTest(object):
         self.stop_time = datetime.datetime.now()
         self.loggerdeco.info('Test %s elapsed time: %s' % (
             self.name, self.stop_time - self.start_time))
+        # If the worker has a post_test executor, only the steps which
+        # require the device are performed here. The crash dumps are
+        # processed and the results submitted to Treeherder in the
+        # background by a CompletedTest.
+        post_test = self.worker_subprocess.post_test
+        errors = []
+        dump_files = []
         try:
             if self.worker_subprocess.is_ok():
                 # Do not attempt to process crashes if the device is
                 # in an error state.
-                self.handle_crashes()
+                if post_test:
+                    errors, dump_files = self.collect_crashes()
+                else:
+                    self.handle_crashes()
         except Exception, e:
             self.loggerdeco.exception('Exception during crash processing')
             self.test_failure(
@@ -925,8 +1191,8 @@ class PhoneTest(object):
         # Log the current full contents of logcat, then reset the
         # logcat buffers to help prevent the device's buffer from
         # over flowing after the test.
-        self.loggerdeco.debug('phonetest.teardown_job full logcat after job:')
-        self.loggerdeco.debug('\n'.join(self.logcat.get(full=True)))
+        self.log_full_logcat('phonetest.teardown_job full logcat after job:')
+        completed = None
         try:
             if (self.worker_subprocess.is_disabled() and
                 self.test_result.status != PhoneTestResult.USERCANCEL):
@@ -935,12 +1201,33 @@ class PhoneTest(object):
                 self.test_failure(self.name, 'TEST_UNEXPECTED_FAIL',
                                   'The worker was disabled.',
                                   PhoneTestResult.USERCANCEL)
-            self.worker_subprocess.treeherder.submit_complete(
-                self.phone.id,
-                self.build.url,
-                self.build.tree,
-                self.build.revision_hash,
-                tests=[self])
+            if post_test:
+                if self.worker_subprocess.is_ok():
+                    try:
+                        self.logcat.get()
+                    except Exception:
+                        self.loggerdeco.exception('Exception getting logcat')
+                try:
+                    completed = post_test.create_completed_test(self, errors,
+                                                                dump_files)
+                except Exception, e:
+                    # Submit the results here instead, reporting the
+                    # errors collected from the device. The crash dumps
+                    # can not be processed.
+                    self.loggerdeco.exception('Exception creating completed '
+                                              'test')
+                    report_errors(self, errors)
+                    self.test_failure(
+                        self.name, 'TEST-UNEXPECTED-FAIL',
+                        'Exception %s during crash processing' % e,
+                        PhoneTestResult.EXCEPTION)
+            if not completed:
+                self.worker_subprocess.treeherder.submit_complete(
+                    self.phone.id,
+                    self.build.url,
+                    self.build.tree,
+                    self.build.revision_hash,
+                    tests=[self])
         except:
             self.loggerdeco.exception('Exception tearing down job')
         finally:
@@ -972,7 +1259,11 @@ class PhoneTest(object):
         self.test_logfilehandler.close()
         logger.removeHandler(self.test_logfilehandler)
         self.test_logfilehandler = None
-        os.unlink(self.test_logfile)
+        if completed:
+            completed.add_test_logfile(self.test_logfile)
+            post_test.submit(completed)
+        else:
+            os.unlink(self.test_logfile)
         self.test_logfile = None
 
     def update_status(self, phone_status=None, message=None):
@@ -981,6 +1272,47 @@ class PhoneTest(object):
                                   phone_status=phone_status,
                                   message=message)
 
+    def install_profile_snapshot(self, profile, root=True):
+        """Returns the path of the snapshot on the device of the cached
+        profile, pushing the profile to the device if it does not already
+        have a snapshot of it. Returns None if the profile is not cached
+        or if the device can not copy the snapshot.
+
+        Snapshots of profiles which are no longer in the profile cache
+        are removed from the device when a new snapshot is pushed.
+        """
+        key = getattr(profile, 'key', None)
+        if not key or not self.dm.supports_recursive_copy():
+            return None
+        snapshot_path = posixpath.join(self.profile_snapshots_path, key)
+        if self.dm.is_dir(snapshot_path, root=root):
+            self.loggerdeco.debug('Using profile snapshot %s' % snapshot_path)
+            return snapshot_path
+
+        self.loggerdeco.debug('Pushing profile snapshot %s' % snapshot_path)
+        self.dm.mkdir(self.profile_snapshots_path, parents=True, root=root)
+        for name in self.dm.list_files(self.profile_snapshots_path,
+                                       root=root):
+            if not os.path.isdir(os.path.join(self.profile_cache.cache_dir,
+                                              name)):
+                self.dm.rm(posixpath.join(self.profile_snapshots_path, name),
+                           recursive=True, force=True, root=root)
+        # Push to a temporary directory and rename it so that an
+        # incomplete snapshot is never used.
+        # The directories are created as root but the profile is pushed
+        # as the shell user so they must be writable by it.
+        temp_path = snapshot_path + '.tmp'
+        cmds = ['chmod 777 %s' % self.profile_snapshots_path,
+                'mkdir %s' % temp_path,
+                'chmod 777 %s' % temp_path]
+        for result in self.dm.shell_batch(cmds, root=root):
+            if result.exitcode:
+                raise ADBError('%s failed: %s' % (result.cmd, result.output))
+        self.dm.push(profile.profile, temp_path)
+        self.dm.shell_output('mv %s %s' % (temp_path, snapshot_path),
+                             root=root)
+        return snapshot_path
+
     def install_profile(self, profile=None, root=True):
         if not profile:
             profile = FirefoxProfile()
@@ -990,16 +1322,27 @@ class PhoneTest(object):
         for attempt in range(1, self.options.phone_retry_limit+1):
             try:
                 self.loggerdeco.debug('Attempt %d installing profile' % attempt)
+                snapshot_path = self.install_profile_snapshot(profile,
+                                                              root=root)
                 if self.dm.exists(self.profile_path, root=root):
                     # If the profile already exists, chmod it to make sure
                     # we have permission to delete it.
                     self.dm.chmod(self.profile_path, recursive=True, root=root)
                     self.dm.rm(self.profile_path, recursive=True,
                                force=True, root=root)
-                self.dm.chmod(profile_path_parent, root=root)
-                self.dm.mkdir(self.profile_path, root=root)
-                self.dm.chmod(self.profile_path, root=root)
-                self.dm.push(profile.profile, self.profile_path)
+                cmds = ['chmod 777 %s' % profile_path_parent]
+                if not snapshot_path:
+                    cmds.extend(['mkdir %s' % self.profile_path,
+                                 'chmod 777 %s' % self.profile_path])
+                for result in self.dm.shell_batch(cmds, root=root):
+                    if result.exitcode:
+                        raise ADBError('%s failed: %s' % (result.cmd,
+                                                          result.output))
+                if snapshot_path:
+                    self.dm.cp(snapshot_path, self.profile_path,
+                               recursive=True, root=root)
+                else:
+                    self.dm.push(profile.profile, self.profile_path)
                 self.dm.chmod(self.profile_path, recursive=True, root=root)
                 success = True
                 break
@@ -1100,3 +1443,239 @@ class PhoneTestResult(object):
             "test": testpath,
             "status": test_status,
             "text": text})
+
+
+def report_errors(test, errors):
+    """Records the errors returned by AutophoneCrashProcessor.get_errors
+    as failures of the PhoneTest or CompletedTest test."""
+    for error in errors:
+        if error['reason'] == 'java-exception':
+            test.test_failure(
+                test.name, 'PROCESS-CRASH',
+                error['signature'],
+                PhoneTestResult.EXCEPTION)
+        elif error['reason'] == 'PROFILE-ERROR':
+            test.test_failure(
+                test.name,
+                error['reason'],
+                error['signature'],
+                PhoneTestResult.TESTFAILED)
+        elif error['reason'] == 'PROCESS-CRASH':
+            test.loggerdeco.info("PROCESS-CRASH | %s | "
+                                 "application crashed [%s]" % (test.name,
+                                                               error['signature']))
+            test.loggerdeco.info(error['stackwalk_output'])
+            test.loggerdeco.info(error['stackwalk_errors'])
+
+            test.test_failure(test.name,
+                              error['reason'],
+                              'application crashed [%s]' % error['signature'],
+                              PhoneTestResult.TESTFAILED)
+        else:
+            test.loggerdeco.warning('Unknown error reason: %s' % error['reason'])
+
+
+CompletedPhone = namedtuple('CompletedPhone', ['id', 'platform', 'architecture'])
+LogcatFile = namedtuple('LogcatFile', ['path', 'compress'])
+
+
+class CompletedLogcat(object):
+    """Copy of a test's accumulated logcat used in place of the test's
+    Logcat by CompletedTest. The device's logcat has already been
+    collected, so get() and reset() do nothing."""
+
+    def __init__(self, path, compress):
+        self.store = LogcatFile(path, compress)
+
+    def get(self, full=False):
+        return []
+
+    def reset(self):
+        pass
+
+
+class CompletedTest(object):
+    """CompletedTest records the results of a PhoneTest once its
+    artifacts have been collected from the device so that its crash
+    dumps can be processed and its results submitted to Treeherder
+    while the PhoneTest is being reused.
+
+    A CompletedTest provides the attributes of a PhoneTest used by
+    AutophoneTreeherder.submit_complete. It is saved in its own
+    directory together with the test's upload directory and logs so
+    that it can be reloaded if the worker is restarted before the
+    results have been submitted.
+    """
+    # Attributes which are saved in the record.
+    ATTRIBUTES = ('name', 'config_file', 'chunk', 'job_guid', 'job_name',
+                  'job_symbol', 'group_name', 'group_symbol', 'buildername',
+                  'message', 'submit_timestamp', 'start_timestamp',
+                  'end_timestamp', 'job_details', 'perfherder_artifact',
+                  'build_url', 'build_id', 'tree', 'revision_hash',
+                  'app_name', 'symbols_path', 'stackwalk_binary',
+                  'errors', 'dump_files', 'crashes_processed',
+                  'unittest_logname', 'logcat_compress')
+    RECORD_NAME = 'record.json'
+
+    def __init__(self, path):
+        self.path = path
+        for attr in self.ATTRIBUTES:
+            setattr(self, attr, None)
+        self.phone = None
+        self.test_result = PhoneTestResult()
+        self.test_logfilehandler = None
+        self._loggerdeco = None
+
+    @classmethod
+    def create(cls, path, test, errors, dump_files):
+        """Creates and saves a CompletedTest in the new directory path
+        for the PhoneTest test. The test's upload directory and
+        unittest log are moved to path and its logcat is copied. The
+        test's log is added by add_test_logfile once it has been closed.
+
+        :param path: directory to be created for the CompletedTest.
+        :param test: PhoneTest which has completed.
+        :param errors: list of errors returned by collect_crashes.
+        :param dump_files: list of dump files returned by
+            collect_crashes.
+        """
+        os.makedirs(path)
+        try:
+            completed = cls(path)
+            for attr in ('name', 'config_file', 'chunk', 'job_guid', 'job_name',
+                         'job_symbol', 'group_name', 'group_symbol', 'message',
+                         'submit_timestamp', 'start_timestamp'):
+                setattr(completed, attr, getattr(test, attr))
+            completed.buildername = test.get_buildername(test.build.tree)
+            # Record the time the test completed rather than when its
+            # results are submitted.
+            completed.end_timestamp = int(time.mktime(
+                datetime.datetime.now().timetuple()))
+            completed.job_details = list(test.job_details)
+            completed.perfherder_artifact = getattr(test, 'perfherder_artifact',
+                                                    None)
+            if hasattr(test, 'phonedash_url'):
+                completed.phonedash_url = test.phonedash_url
+            completed.build_url = test.build.url
+            completed.build_id = test.build.id
+            completed.tree = test.build.tree
+            completed.revision_hash = test.build.revision_hash
+            completed.app_name = test.build.app_name
+            completed.symbols_path = test.build.symbols
+            completed.stackwalk_binary = test.options.minidump_stackwalk
+            completed.phone = CompletedPhone(test.phone.id, test.phone.platform,
+                                             test.phone.architecture)
+            completed.test_result = test.test_result
+            completed.errors = errors
+            completed.crashes_processed = False
+
+            if test.upload_dir and os.path.isdir(test.upload_dir):
+                completed.dump_files = [
+                    (os.path.relpath(dump, test.upload_dir),
+                     os.path.relpath(extra, test.upload_dir))
+                    for dump, extra in dump_files]
+                shutil.move(test.upload_dir, completed.upload_dir)
+            else:
+                completed.dump_files = []
+                os.mkdir(completed.upload_dir)
+            if test.unittest_logpath and os.path.exists(test.unittest_logpath):
+                completed.unittest_logname = os.path.basename(test.unittest_logpath)
+                shutil.move(test.unittest_logpath, completed.unittest_logpath)
+            completed.logcat_compress = test.logcat.store.compress
+            shutil.copyfile(test.logcat.store.path, completed.logcat.store.path)
+            completed.save()
+        except:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        return completed
+
+    @classmethod
+    def load(cls, path):
+        """Returns the CompletedTest saved in the directory path."""
+        with open(os.path.join(path, cls.RECORD_NAME)) as f:
+            data = json.load(f)
+        completed = cls(path)
+        for attr in cls.ATTRIBUTES:
+            setattr(completed, attr, data[attr])
+        if 'phonedash_url' in data:
+            completed.phonedash_url = data['phonedash_url']
+        completed.phone = CompletedPhone(*data['phone'])
+        for attr in ('status', 'passes', 'failures', 'todo'):
+            setattr(completed.test_result, attr, data['test_result'][attr])
+        return completed
+
+    def save(self):
+        data = dict((attr, getattr(self, attr)) for attr in self.ATTRIBUTES)
+        if hasattr(self, 'phonedash_url'):
+            data['phonedash_url'] = self.phonedash_url
+        data['phone'] = list(self.phone)
+        data['test_result'] = {'status': self.test_result.status,
+                               'passes': self.test_result.passes,
+                               'failures': self.test_result.failures,
+                               'todo': self.test_result.todo}
+        record_path = os.path.join(self.path, self.RECORD_NAME)
+        with open(record_path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.rename(record_path + '.tmp', record_path)
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    @property
+    def upload_dir(self):
+        return os.path.join(self.path, 'upload')
+
+    @property
+    def unittest_logpath(self):
+        if not self.unittest_logname:
+            return None
+        return os.path.join(self.path, self.unittest_logname)
+
+    @property
+    def test_logfile(self):
+        return os.path.join(self.path, 'autophone.log')
+
+    @property
+    def logcat(self):
+        return CompletedLogcat(os.path.join(self.path, 'logcat.log'),
+                               self.logcat_compress)
+
+    @property
+    def loggerdeco(self):
+        if not self._loggerdeco:
+            self._loggerdeco = LogDecorator(logging.getLogger('posttest'),
+                                            {'phoneid': self.phone.id,
+                                             'buildid': self.build_id,
+                                             'test': self.name},
+                                            '%(phoneid)s|%(buildid)s|%(test)s|'
+                                            '%(message)s')
+        return self._loggerdeco
+
+    def add_test_logfile(self, test_logfile):
+        """Moves the test's closed log file into the CompletedTest."""
+        shutil.move(test_logfile, self.test_logfile)
+
+    def get_buildername(self, tree):
+        return self.buildername
+
+    def test_failure(self, testpath, status, message, testresult_status):
+        self.message = message
+        self.test_result.add_failure(testpath, status, message, testresult_status)
+
+    def process_crashes(self):
+        """Processes the crash dumps and records the errors which were
+        collected from the device as failures. The CompletedTest is
+        saved afterwards so that the crashes are not reported again if
+        the worker is restarted."""
+        if self.crashes_processed:
+            return
+        crash_processor = AutophoneCrashProcessor(None, None, self.upload_dir,
+                                                  self.app_name)
+        dump_files = [(os.path.join(self.upload_dir, dump),
+                       os.path.join(self.upload_dir, extra))
+                      for dump, extra in self.dump_files]
+        errors = self.errors + crash_processor.process_dump_files(
+            dump_files, self.symbols_path, self.stackwalk_binary, clean=False)
+        report_errors(self, errors)
+        self.crashes_processed = True
+        self.save()
@@ -0,0 +1,169 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import Queue
+import logging
+import os
+import shutil
+import threading
+
+from phonetest import CompletedTest, PhoneTestResult
+from sensitivedatafilter import SensitiveDataFilter
+
+# Set the logger globally in the file, but this must be reset when
+# used in a child process.
+logger = logging.getLogger()
+
+
+class PostTestExecutor(object):
+    """PostTestExecutor processes the crash dumps of completed tests and
+    submits their results to Treeherder in a background thread so that
+    the worker can start the next test as soon as the artifacts of the
+    previous test have been collected from the device.
+
+    Completed tests are processed in the order in which they were
+    submitted. submit() blocks while maxsize completed tests are
+    waiting to be processed. Each CompletedTest is kept in its own
+    directory in spool_dir until it has been processed. Any which
+    remain from a previous run of the worker are processed before new
+    ones.
+
+    ::
+
+       post_test = PostTestExecutor(worker, spool_dir, 4)
+       post_test.start()
+       completed = post_test.create_completed_test(test, errors, dump_files)
+       post_test.submit(completed)
+       post_test.stop()
+
+    """
+    # Time in seconds to wait for the queue between heartbeats.
+    WAIT_TIMEOUT = 60
+
+    def __init__(self, worker, spool_dir, maxsize):
+        """Initializes the PostTestExecutor object.
+
+        :param worker: PhoneWorkerSubProcess whose treeherder is used to
+            submit the results.
+        :param str spool_dir: directory containing the completed tests
+            waiting to be processed.
+        :param int maxsize: maximum number of completed tests waiting to
+            be processed.
+
+        """
+        self.worker = worker
+        self.spool_dir = spool_dir
+        self.queue = Queue.Queue(maxsize)
+        self.thread = None
+        self._sequence = 0
+        # Messages logged while processing a completed test are also
+        # written to the test's log before it is uploaded.
+        self.test_logger = logging.getLogger('posttest')
+        self.test_logger.addFilter(
+            SensitiveDataFilter(worker.options.sensitive_data))
+        self.test_logger.setLevel(worker.loglevel)
+
+    def start(self):
+        """Loads the completed tests remaining in spool_dir and starts
+        the background thread."""
+        if not os.path.isdir(self.spool_dir):
+            os.makedirs(self.spool_dir)
+        names = sorted(name for name in os.listdir(self.spool_dir)
+                       if name.isdigit())
+        if names:
+            self._sequence = int(names[-1])
+        pending = []
+        for name in names:
+            path = os.path.join(self.spool_dir, name)
+            try:
+                pending.append(CompletedTest.load(path))
+            except (IOError, OSError, ValueError, KeyError, TypeError):
+                logger.exception('PostTestExecutor: removing invalid '
+                                 'completed test %s' % path)
+                shutil.rmtree(path, ignore_errors=True)
+        if pending:
+            logger.info('PostTestExecutor: %d completed tests from a '
+                        'previous run are pending' % len(pending))
+        self.thread = threading.Thread(target=self._run, args=(pending,),
+                                       name='PostTestExecutor')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Waits for the pending completed tests to be processed, then
+        stops the background thread."""
+        if not self.thread:
+            return
+        self.submit(None)
+        while self.thread.is_alive():
+            self.thread.join(self.WAIT_TIMEOUT)
+            self.worker.heartbeat()
+        self.thread = None
+
+    def create_completed_test(self, test, errors, dump_files):
+        """Returns a new CompletedTest in spool_dir for the PhoneTest
+        test. See CompletedTest.create."""
+        self._sequence += 1
+        path = os.path.join(self.spool_dir, '%010d' % self._sequence)
+        return CompletedTest.create(path, test, errors, dump_files)
+
+    def submit(self, completed):
+        """Queues the CompletedTest completed to be processed, waiting
+        if the queue is full. The worker's heartbeat is maintained
+        while waiting."""
+        while True:
+            try:
+                self.queue.put(completed, True, self.WAIT_TIMEOUT)
+                return
+            except Queue.Full:
+                logger.info('PostTestExecutor: waiting for %d completed '
+                            'tests to be processed' % self.queue.qsize())
+                self.worker.heartbeat()
+
+    def _run(self, pending):
+        for completed in pending:
+            self.process(completed)
+        while True:
+            completed = self.queue.get()
+            if completed is None:
+                return
+            self.process(completed)
+
+    def process(self, completed):
+        """Processes the crash dumps of the CompletedTest completed and
+        submits its results to Treeherder, then removes it from
+        spool_dir. An exception while processing the crash dumps is
+        recorded as a failure of the test whose results are still
+        submitted."""
+        logger.debug('PostTestExecutor.process: %s' % completed.path)
+        handler = logging.FileHandler(completed.test_logfile, mode='a')
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s|%(process)d|%(threadName)s|%(name)s|'
+            '%(levelname)s|%(message)s'))
+        self.test_logger.addHandler(handler)
+        completed.test_logfilehandler = handler
+        try:
+            try:
+                completed.process_crashes()
+            except Exception, e:
+                logger.exception('PostTestExecutor: error processing crashes '
+                                 'for %s' % completed.path)
+                completed.test_failure(
+                    completed.name, 'TEST-UNEXPECTED-FAIL',
+                    'Exception %s during crash processing' % e,
+                    PhoneTestResult.EXCEPTION)
+            self.worker.treeherder.submit_complete(
+                completed.phone.id,
+                completed.build_url,
+                completed.tree,
+                completed.revision_hash,
+                tests=[completed])
+        except Exception:
+            logger.exception('PostTestExecutor: error submitting %s' %
+                             completed.path)
+        finally:
+            completed.test_logfilehandler = None
+            self.test_logger.removeHandler(handler)
+            handler.close()
+            completed.remove()
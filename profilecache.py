@@ -0,0 +1,113 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from mozprofile import FirefoxProfile
+
+# Set the logger globally in the file, but this must be reset when
+# used in a child process.
+logger = logging.getLogger()
+
+# profile is the path to the profile directory and key is the hash of
+# the profile's preferences and addons. The profile attribute matches
+# that of mozprofile's Profile so that a CachedProfile can be used
+# wherever a profile is installed.
+CachedProfile = namedtuple('CachedProfile', ['profile', 'key'])
+
+
+class ProfileCache(object):
+    """ProfileCache maintains a host side cache of Firefox profiles
+    keyed by a hash of their preferences and the contents of their
+    addons so that a profile is only created once per configuration.
+
+    The cache directory may be shared by the worker processes. Profiles
+    are created in a temporary directory and renamed into place so
+    that a partially created profile is never used. The least recently
+    used profiles are removed when the cache holds more than
+    max_profiles profiles.
+
+    """
+    MAX_PROFILES = 16
+
+    def __init__(self, cache_dir, max_profiles=None):
+        self.cache_dir = cache_dir
+        self.max_profiles = max_profiles or self.MAX_PROFILES
+
+    @staticmethod
+    def get_key(preferences, addons):
+        """Returns the hash of the preferences and the names and
+        contents of the addons."""
+        h = hashlib.sha1()
+        h.update(json.dumps(preferences, sort_keys=True))
+        for addon in addons:
+            h.update('\0%s\0' % os.path.basename(addon))
+            with open(addon, 'rb') as f:
+                for data in iter(lambda: f.read(65536), ''):
+                    h.update(data)
+        return h.hexdigest()
+
+    def get(self, preferences, addons):
+        """Returns a CachedProfile for the preferences and addons,
+        creating the profile if it is not already cached.
+
+        :param dict preferences: profile preferences.
+        :param list addons: paths of the addons to be installed.
+        :returns: CachedProfile
+
+        """
+        key = self.get_key(preferences, addons)
+        path = os.path.join(self.cache_dir, key)
+        if os.path.isdir(path):
+            logger.debug('ProfileCache: using %s' % path)
+            # Mark the profile as recently used.
+            os.utime(path, None)
+            return CachedProfile(path, key)
+
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+        logger.debug('ProfileCache: creating %s' % path)
+        build_dir = tempfile.mkdtemp(prefix='tmp', dir=self.cache_dir)
+        try:
+            profile_dir = os.path.join(build_dir, 'profile')
+            FirefoxProfile(profile=profile_dir, preferences=preferences,
+                           addons=addons, restore=False)
+            try:
+                os.rename(profile_dir, path)
+            except OSError:
+                # Another worker created the profile first.
+                if not os.path.isdir(path):
+                    raise
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+        self.expire()
+        return CachedProfile(path, key)
+
+    def expire(self):
+        """Removes the least recently used profiles in excess of
+        max_profiles."""
+        profiles = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith('tmp') or not os.path.isdir(path):
+                continue
+            try:
+                profiles.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        profiles.sort(reverse=True)
+        for mtime, path in profiles[self.max_profiles:]:
+            logger.debug('ProfileCache: removing %s' % path)
+            shutil.rmtree(path, ignore_errors=True)
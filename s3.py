@@ -66,27 +66,39 @@ class S3Bucket(object):
             logger.exception(str(e))
             raise S3Error('%s' % e)
 
-    def upload(self, path, destination):
+    def upload(self, path, destination, compressed=False):
+        """Uploads the file path to the key destination with gzip
+        Content-Encoding. If compressed is True, path is already gzip
+        compressed and is uploaded as is."""
         try:
             key = self.bucket.get_key(destination)
             if not key:
                 logger.debug('Creating key: %s' % destination)
                 key = self.bucket.new_key(destination)
 
-            ext = os.path.splitext(path)[-1]
+            if compressed:
+                ext = os.path.splitext(os.path.splitext(path)[0])[-1]
+            else:
+                ext = os.path.splitext(path)[-1]
             if ext == '.log' or ext == '.txt':
                 key.set_metadata('Content-Type', 'text/plain')
 
-            with tempfile.NamedTemporaryFile('w+b', suffix=ext) as tf:
-                logger.debug('Compressing: %s' % path)
-                with gzip.GzipFile(path, 'wb', fileobj=tf) as gz:
-                    with open(path, 'rb') as f:
-                        gz.writelines(f)
-                tf.flush()
-                tf.seek(0)
-                key.set_metadata('Content-Encoding', 'gzip')
-                logger.debug('Setting key contents from: %s' % tf.name)
-                key.set_contents_from_file(tf)
+            if compressed:
+                with open(path, 'rb') as f:
+                    key.set_metadata('Content-Encoding', 'gzip')
+                    logger.debug('Setting key contents from: %s' % path)
+                    key.set_contents_from_file(f)
+            else:
+                with tempfile.NamedTemporaryFile('w+b', suffix=ext) as tf:
+                    logger.debug('Compressing: %s' % path)
+                    with gzip.GzipFile(path, 'wb', fileobj=tf) as gz:
+                        with open(path, 'rb') as f:
+                            gz.writelines(f)
+                    tf.flush()
+                    tf.seek(0)
+                    key.set_metadata('Content-Encoding', 'gzip')
+                    logger.debug('Setting key contents from: %s' % tf.name)
+                    key.set_contents_from_file(tf)
 
             url = key.generate_url(expires_in=0,
                                    query_auth=False)
@@ -0,0 +1,237 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import socket
+import SocketServer
+import stat
+import struct
+import subprocess
+import tempfile
+import threading
+import unittest
+
+from adb_client import ADBClient, ADBClientError
+
+SERIAL = 'ABCD1234'
+
+
+class FakeADBServerHandler(SocketServer.BaseRequestHandler):
+    """Implements enough of the adb server and adbd protocols to serve a
+    single fake device whose file system is rooted in the server's
+    temporary directory and whose shell is the host's sh.
+
+    """
+    def recv_exactly(self, length):
+        data = ''
+        while len(data) < length:
+            chunk = self.request.recv(length - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def okay(self, payload=None):
+        self.request.sendall('OKAY')
+        if payload is not None:
+            self.request.sendall('%04x%s' % (len(payload), payload))
+
+    def fail(self, message):
+        self.request.sendall('FAIL%04x%s' % (len(message), message))
+
+    def local_path(self, path):
+        return os.path.join(self.server.root, path.lstrip('/'))
+
+    def handle(self):
+        try:
+            while True:
+                request = self.recv_exactly(int(self.recv_exactly(4), 16))
+                if request == 'host:version':
+                    self.okay('0020')
+                    return
+                elif request == 'host:devices-l':
+                    self.okay('%s               device usb:1-7 '
+                              'product:fake model:Fake device:fake\n' % SERIAL)
+                    return
+                elif request.startswith('host-serial:'):
+                    serial = request.split(':')[1]
+                    if serial == SERIAL:
+                        self.okay('device')
+                    else:
+                        self.fail("device '%s' not found" % serial)
+                    return
+                elif request.startswith('host:transport:'):
+                    if request.split(':', 2)[2] != SERIAL:
+                        self.fail('device not found')
+                        return
+                    self.okay()
+                elif request.startswith('shell:'):
+                    self.okay()
+                    proc = subprocess.Popen(['sh', '-c', request[6:]],
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.STDOUT)
+                    self.request.sendall(proc.communicate()[0])
+                    return
+                elif request == 'sync:':
+                    self.okay()
+                    self.handle_sync()
+                    return
+                else:
+                    self.fail('unknown service %s' % request)
+                    return
+        except EOFError:
+            pass
+
+    def handle_sync(self):
+        while True:
+            header = self.recv_exactly(8)
+            sync_id = header[:4]
+            length = struct.unpack('<I', header[4:])[0]
+            if sync_id == 'QUIT':
+                return
+            data = self.recv_exactly(length)
+            if sync_id == 'STAT':
+                try:
+                    st = os.lstat(self.local_path(data))
+                    values = (st.st_mode, st.st_size, int(st.st_mtime))
+                except OSError:
+                    values = (0, 0, 0)
+                self.request.sendall('STAT' + struct.pack('<III', *values))
+            elif sync_id == 'LIST':
+                path = self.local_path(data)
+                for name in ['.', '..'] + os.listdir(path):
+                    st = os.lstat(os.path.join(path, name))
+                    self.request.sendall(
+                        'DENT' + struct.pack('<IIII', st.st_mode, st.st_size,
+                                             int(st.st_mtime), len(name)) +
+                        name)
+                self.request.sendall('DONE' + struct.pack('<IIII', 0, 0, 0, 0))
+            elif sync_id == 'SEND':
+                path, mode = data.rsplit(',', 1)
+                content = ''
+                while True:
+                    header = self.recv_exactly(8)
+                    length = struct.unpack('<I', header[4:])[0]
+                    if header[:4] == 'DONE':
+                        break
+                    content += self.recv_exactly(length)
+                path = self.local_path(path)
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                with open(path, 'wb') as f:
+                    f.write(content)
+                os.chmod(path, int(mode))
+                self.request.sendall('OKAY' + struct.pack('<I', 0))
+            elif sync_id == 'RECV':
+                path = self.local_path(data)
+                if not os.path.isfile(path):
+                    message = 'No such file or directory'
+                    self.request.sendall('FAIL' + struct.pack('<I', len(message)) +
+                                         message)
+                    continue
+                with open(path, 'rb') as f:
+                    content = f.read()
+                self.request.sendall('DATA' + struct.pack('<I', len(content)) +
+                                     content)
+                self.request.sendall('DONE' + struct.pack('<I', 0))
+
+
+class FakeADBServer(SocketServer.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, root):
+        SocketServer.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0),
+                                                 FakeADBServerHandler)
+        self.root = root
+
+
+class ADBClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.device_root = tempfile.mkdtemp()
+        self.host_root = tempfile.mkdtemp()
+        self.server = FakeADBServer(self.device_root)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.client = ADBClient(adb_port=self.server.server_address[1],
+                                timeout=10)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.device_root)
+        shutil.rmtree(self.host_root)
+
+    def write_file(self, path, content):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def read_file(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_host_commands(self):
+        self.assertEqual(self.client.host_command('host:version'), '0020')
+        self.assertTrue(self.client.devices().startswith(SERIAL))
+        self.assertEqual(self.client.get_state(SERIAL), 'device')
+        self.assertRaises(ADBClientError, self.client.get_state, 'XXXX')
+
+    def test_shell(self):
+        self.assertEqual(self.client.shell(SERIAL, 'echo hello; echo rc=$?'),
+                         'hello\nrc=0\n')
+        self.assertRaises(ADBClientError, self.client.shell, 'XXXX', 'id')
+
+    def test_shell_timeout(self):
+        self.assertRaises(socket.timeout, self.client.shell, SERIAL, 'sleep 5',
+                          timeout=1)
+
+    def test_push_pull_file(self):
+        local = os.path.join(self.host_root, 'push.txt')
+        self.write_file(local, 'x' * (3 * ADBClient.SYNC_DATA_MAX + 7))
+        self.client.push(SERIAL, local, '/data/local/tmp/pushed.txt')
+        remote = os.path.join(self.device_root, 'data/local/tmp/pushed.txt')
+        self.assertEqual(self.read_file(remote), self.read_file(local))
+
+        mode, size, mtime = self.client.stat(SERIAL, '/data/local/tmp/pushed.txt')
+        self.assertTrue(stat.S_ISREG(mode))
+        self.assertEqual(size, os.path.getsize(local))
+        self.assertEqual(self.client.stat(SERIAL, '/missing')[0], 0)
+
+        # Pushing to a directory uses the local file's name.
+        self.client.push(SERIAL, local, '/data/local/tmp')
+        self.assertTrue(os.path.isfile(os.path.join(self.device_root,
+                                                    'data/local/tmp/push.txt')))
+
+        pulled = os.path.join(self.host_root, 'pulled.txt')
+        self.client.pull(SERIAL, '/data/local/tmp/pushed.txt', pulled)
+        self.assertEqual(self.read_file(pulled), self.read_file(local))
+        self.assertRaises(ADBClientError, self.client.pull, SERIAL,
+                          '/missing', pulled)
+
+    def test_push_pull_directory(self):
+        local = os.path.join(self.host_root, 'profile')
+        self.write_file(os.path.join(local, 'prefs.js'), 'prefs')
+        self.write_file(os.path.join(local, 'extensions', 'quitter.xpi'), 'xpi')
+        self.client.push(SERIAL, local, '/data/local/tmp/profile')
+        self.assertEqual(sorted(e[0] for e in self.client.list(
+            SERIAL, '/data/local/tmp/profile')), ['extensions', 'prefs.js'])
+
+        pulled = os.path.join(self.host_root, 'pulled')
+        self.client.pull(SERIAL, '/data/local/tmp/profile', pulled)
+        self.assertEqual(self.read_file(os.path.join(pulled, 'prefs.js')),
+                         'prefs')
+        self.assertEqual(self.read_file(os.path.join(pulled, 'extensions',
+                                                     'quitter.xpi')), 'xpi')
+
+    def test_no_server(self):
+        port = self.server.server_address[1]
+        self.tearDown()
+        self.setUp()
+        client = ADBClient(adb_port=port, timeout=1)
+        self.assertRaises(socket.error, client.get_state, SERIAL)
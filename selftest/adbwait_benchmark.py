@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Compares the per call latency of waiting for a subprocess by polling
+every 0.1 seconds, as ADBCommand.command and ADBDevice.shell used to do,
+with adb.wait_for_process.
+
+usage: python selftest/adbwait_benchmark.py [iterations] [command ...]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from adb import wait_for_process
+
+POLLING_INTERVAL = 0.1
+
+
+def poll_for_process(proc, timeout):
+    start_time = time.time()
+    exitcode = proc.poll()
+    while (time.time() - start_time) <= timeout and exitcode is None:
+        time.sleep(POLLING_INTERVAL)
+        exitcode = proc.poll()
+    if exitcode is None:
+        proc.kill()
+        return proc.poll(), True
+    return exitcode, False
+
+
+def benchmark(wait, args, iterations):
+    latencies = []
+    for i in range(iterations):
+        start_time = time.time()
+        proc = subprocess.Popen(args)
+        wait(proc, 60)
+        latencies.append(time.time() - start_time)
+    latencies.sort()
+    return (sum(latencies) / iterations, latencies[iterations / 2],
+            latencies[-1])
+
+
+def main(args):
+    iterations = int(args[0]) if args else 100
+    command = args[1:] or ['true']
+    print 'command: %s, iterations: %d' % (' '.join(command), iterations)
+    for name, wait in (('polling', poll_for_process),
+                       ('wait_for_process', wait_for_process)):
+        mean, median, worst = benchmark(wait, command, iterations)
+        print '%-16s mean: %7.2f ms median: %7.2f ms max: %7.2f ms' % (
+            name, mean * 1000, median * 1000, worst * 1000)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
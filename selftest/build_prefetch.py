@@ -0,0 +1,148 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+
+import buildserver
+from jobs import Jobs
+
+
+class MockBuildCache(object):
+    """Records the builds fetched by the BuildCacheServer. Fetches of
+    the builds in blocked, or of every build if blocked is None, block
+    until release is set."""
+
+    def __init__(self):
+        self.fetched = []
+        self.blocked = None
+        self.release = threading.Event()
+        self.fetching = threading.Event()
+
+    def get(self, buildurl, force=False, enable_unittests=False,
+            test_package_names=None):
+        self.fetching.set()
+        if self.blocked is None or buildurl in self.blocked:
+            self.release.wait(10)
+        self.fetched.append((buildurl, enable_unittests,
+                             sorted(test_package_names or [])))
+        return {'success': True, 'error': '', 'metadata': buildurl}
+
+
+class MockTest(object):
+
+    def __init__(self, name, config_file='config.ini', chunk=1, repos=None):
+        self.name = name
+        self.config_file = config_file
+        self.chunk = chunk
+        self.repos = repos or ['mozilla-central']
+        self.job_guid = None
+
+    def generate_guid(self):
+        self.job_guid = str(uuid.uuid4())
+
+
+class MockWorker(object):
+
+    def __init__(self, tests):
+        self.tests = tests
+
+
+class BuildPrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.build_cache = MockBuildCache()
+        self.server = buildserver.BuildCacheServer(
+            ('127.0.0.1', 0), buildserver.BuildCacheHandler)
+        # The prefetch thread is shared by the servers so the build
+        # cache is set on the class.
+        buildserver.BuildCacheServer.build_cache = self.build_cache
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.client = buildserver.BuildCacheClient(
+            port=self.server.server_address[1])
+
+    def tearDown(self):
+        self.build_cache.release.set()
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        buildserver.BuildCacheServer.build_cache = None
+
+    def test_prefetch(self):
+        url = 'http://example.com/build1/fennec.apk'
+        response = self.client.prefetch(url, enable_unittests=True,
+                                        test_package_names=['mochitest'])
+        self.assertTrue(response['success'])
+        self.assertTrue(self.build_cache.fetching.wait(10))
+        # The prefetch in progress can not be cancelled, but a pending
+        # prefetch can be.
+        pending_url = 'http://example.com/build2/fennec.apk'
+        self.client.prefetch(pending_url)
+        self.assertFalse(self.client.cancel_prefetch(url)['success'])
+        self.assertTrue(self.client.cancel_prefetch(pending_url)['success'])
+        self.build_cache.release.set()
+        response = self.client.get(url)
+        self.assertEqual(response['metadata'], url)
+        self.assertEqual(self.build_cache.fetched,
+                         [(url, True, ['mochitest']),
+                          (url, False, [])])
+
+    def test_get_during_prefetch(self):
+        url = 'http://example.com/build1/fennec.apk'
+        other_url = 'http://example.com/build2/fennec.apk'
+        self.build_cache.blocked = [url]
+        self.client.prefetch(url)
+        self.assertTrue(self.build_cache.fetching.wait(10))
+        # A foreground request for another build is not blocked by the
+        # prefetch in progress.
+        start_time = time.time()
+        response = self.client.get(other_url)
+        self.assertTrue(time.time() - start_time < 5)
+        self.assertEqual(response['metadata'], other_url)
+        self.assertEqual(self.build_cache.fetched, [(other_url, False, [])])
+        self.build_cache.release.set()
+
+
+class PeekNextJobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.temp_dir = tempfile.mkdtemp()
+        os.chdir(self.temp_dir)
+        self.jobs = Jobs(None, default_device='device')
+        self.tests = [MockTest('s1s2'), MockTest('webappstartup')]
+        self.worker = MockWorker(self.tests)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.temp_dir)
+
+    def test_peek_next_job(self):
+        self.jobs.new_job('build1', tests=[MockTest('s1s2')])
+        self.jobs.new_job('build2', tests=[MockTest('webappstartup')])
+        job = self.jobs.get_next_job(worker=self.worker)
+        self.assertEqual(job['build_url'], 'build1')
+        next_job = self.jobs.peek_next_job(worker=self.worker,
+                                           exclude_job_id=job['id'])
+        self.assertEqual(next_job['build_url'], 'build2')
+        self.assertEqual(next_job['tests'], [self.tests[1]])
+        # Peeking does not count as an attempt.
+        self.jobs.job_completed(job['id'])
+        job = self.jobs.get_next_job(worker=self.worker)
+        self.assertEqual(job['build_url'], 'build2')
+        self.assertEqual(job['attempts'], 1)
+        self.assertEqual(self.jobs.peek_next_job(worker=self.worker,
+                                                 exclude_job_id=job['id']),
+                         None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import ConfigParser
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import configcache
+
+
+class ConfigCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        configcache.clear()
+        self.temp_dir = tempfile.mkdtemp()
+        self.config_file = os.path.join(self.temp_dir, 'test.ini')
+        self.write(self.config_file, '[paths]\nSources = files/base/\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        configcache.clear()
+
+    def write(self, path, content, age=0):
+        with open(path, 'w') as f:
+            f.write(content)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+
+    def test_get_config(self):
+        cfg = configcache.get_config(self.config_file, case_sensitive=True)
+        self.assertEqual(cfg.get('paths', 'Sources'), 'files/base/')
+        self.assertTrue(cfg is configcache.get_config(self.config_file,
+                                                      case_sensitive=True))
+        raw_cfg = configcache.get_config(self.config_file,
+                                         ConfigParser.RawConfigParser)
+        self.assertTrue(raw_cfg is not cfg)
+        self.assertEqual(raw_cfg.options('paths'), ['sources'])
+        # The file is parsed again when it is modified.
+        self.write(self.config_file, '[paths]\nSources = files/s1s2/\n',
+                   age=-10)
+        cfg = configcache.get_config(self.config_file, case_sensitive=True)
+        self.assertEqual(cfg.get('paths', 'Sources'), 'files/s1s2/')
+
+    def test_missing_config(self):
+        cfg = configcache.get_config(os.path.join(self.temp_dir, 'missing'))
+        self.assertEqual(cfg.sections(), [])
+
+    def test_get_source_files(self):
+        source = os.path.join(self.temp_dir, 'files') + '/'
+        os.mkdir(source)
+        for name in ('b.html', 'a.html', 'a.html~', 'c.html.bak'):
+            self.write(os.path.join(source, name), name)
+        os.utime(source, (time.time() - 10, time.time() - 10))
+        self.assertEqual(configcache.get_source_files(source),
+                         (source + 'a.html', source + 'b.html'))
+        self.write(os.path.join(source, 'c.html'), 'c.html')
+        self.assertEqual(configcache.get_source_files(source),
+                         (source + 'a.html', source + 'b.html',
+                          source + 'c.html'))
+
+
+if __name__ == '__main__':
+    unittest.main()
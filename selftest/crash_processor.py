@@ -0,0 +1,140 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+import autophonecrash
+from autophonecrash import AutophoneCrashProcessor
+
+# Fake minidump_stackwalk which records its invocations and reports a
+# crash in the function named in the dump file.
+STACKWALK = """#!/bin/sh
+echo "$1" >> "%(invocations)s"
+sleep 0.5
+if [ "$(cat "$1")" = fail ]; then
+  echo "Unable to read symbols" >&2
+  exit 1
+fi
+echo "Crash reason:  SIGSEGV"
+echo "Thread 0 (crashed)"
+echo " 0  libxul.so!$(cat "$1") [file.cpp : 1 + 0x0]"
+"""
+
+
+class CrashProcessorTest(unittest.TestCase):
+
+    def setUp(self):
+        AutophoneCrashProcessor._stackwalk_results.clear()
+        self.temp_dir = tempfile.mkdtemp()
+        self.upload_dir = os.path.join(self.temp_dir, 'upload')
+        self.symbols_path = os.path.join(self.temp_dir, 'symbols')
+        os.mkdir(self.upload_dir)
+        os.mkdir(self.symbols_path)
+        self.invocations = os.path.join(self.temp_dir, 'invocations')
+        self.stackwalk = os.path.join(self.temp_dir, 'minidump_stackwalk')
+        with open(self.stackwalk, 'w') as f:
+            f.write(STACKWALK % {'invocations': self.invocations})
+        os.chmod(self.stackwalk, stat.S_IRWXU)
+        self.crash_processor = AutophoneCrashProcessor(None, None,
+                                                       self.upload_dir,
+                                                       'org.mozilla.fennec')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        AutophoneCrashProcessor._stackwalk_results.clear()
+
+    def write_dumps(self, functions):
+        dump_files = []
+        for i, function in enumerate(functions):
+            path = os.path.join(self.upload_dir, '%d.dmp' % i)
+            with open(path, 'w') as f:
+                f.write(function)
+            dump_files.append((path, os.path.splitext(path)[0] + '.extra'))
+        return dump_files
+
+    def get_invocations(self):
+        if not os.path.exists(self.invocations):
+            return 0
+        with open(self.invocations) as f:
+            return len(f.readlines())
+
+    def process(self, dump_files):
+        return self.crash_processor.process_dump_files(
+            dump_files, self.symbols_path, self.stackwalk, clean=False)
+
+    def test_process_dump_files(self):
+        dump_files = self.write_dumps(['foo', 'bar', 'foo', 'baz'])
+        start = time.time()
+        crashes = self.process(dump_files)
+        # The three distinct dumps are processed in parallel.
+        self.assertTrue(time.time() - start < 1.4)
+        self.assertEqual(self.get_invocations(), 3)
+        self.assertEqual([crash['signature'] for crash in crashes],
+                         ['@ foo', '@ bar', '@ foo', '@ baz'])
+        self.assertEqual(crashes[1], {
+            'reason': 'PROCESS-CRASH',
+            'signature': '@ bar',
+            'stackwalk_output': '\n'.join([
+                'Crash dump filename: %s' % dump_files[1][0],
+                'Crash reason:  SIGSEGV',
+                'Thread 0 (crashed)',
+                ' 0  libxul.so!bar [file.cpp : 1 + 0x0]\n']),
+            'stackwalk_errors': ''})
+
+        # Dumps which have already been processed are not processed
+        # again unless the symbols have changed.
+        self.assertEqual(self.process(dump_files), crashes)
+        self.assertEqual(self.get_invocations(), 3)
+        os.utime(self.symbols_path, (time.time() + 10, time.time() + 10))
+        self.assertEqual(self.process(dump_files[:1]), crashes[:1])
+        self.assertEqual(self.get_invocations(), 4)
+
+    def test_hash_once(self):
+        hashed = []
+
+        def get_file_hash(path):
+            hashed.append(path)
+            return get_file_hash_orig(path)
+        get_file_hash_orig = autophonecrash.get_file_hash
+        autophonecrash.get_file_hash = get_file_hash
+        try:
+            dump_files = self.write_dumps(['foo', 'bar', 'foo'])
+            self.process(dump_files)
+        finally:
+            autophonecrash.get_file_hash = get_file_hash_orig
+        self.assertEqual(sorted(hashed),
+                         sorted(path for path, extra in dump_files))
+
+    def test_failure_not_cached(self):
+        dump_files = self.write_dumps(['fail', 'foo', 'fail'])
+        crashes = self.process(dump_files)
+        self.assertEqual(crashes[0]['signature'], 'unknown top frame')
+        self.assertTrue('minidump_stackwalk exited with return code 1' in
+                        crashes[0]['stackwalk_output'])
+        self.assertEqual(crashes[2]['stackwalk_errors'],
+                         crashes[0]['stackwalk_errors'])
+        # Each distinct dump is processed once per call. The failed
+        # result is not cached so it is processed again by the next call
+        # while the successful result is reused.
+        self.assertEqual(self.get_invocations(), 2)
+        self.process(dump_files)
+        self.assertEqual(self.get_invocations(), 3)
+
+    def test_no_stackwalk(self):
+        dump_files = self.write_dumps(['foo'])
+        crashes = self.crash_processor.process_dump_files(
+            dump_files, self.symbols_path, None, clean=True)
+        self.assertEqual(crashes[0]['signature'], 'unknown top frame')
+        self.assertEqual(crashes[0]['stackwalk_errors'],
+                         "MINIDUMP_STACKWALK not set, can't process dump.")
+        self.assertFalse(os.path.exists(dump_files[0][0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from adb import ADBShellResult
+from devicesync import MANIFEST_NAME, sync_directory
+
+
+class MockDevice(object):
+    """Implements the ADBDevice methods used by sync_directory on the
+    local file system and records the pushes."""
+
+    def __init__(self):
+        self.pushes = []
+
+    def shell_batch(self, cmds, stop_on_error=True, timeout=None):
+        results = []
+        for cmd in cmds:
+            proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT)
+            output = proc.communicate()[0]
+            results.append(ADBShellResult(cmd, output, proc.returncode))
+        return results
+
+    def rm(self, path, recursive=False, force=False, timeout=None):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.unlink(path)
+
+    def mkdir(self, path, parents=False, timeout=None):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def push(self, local, remote, timeout=None):
+        self.pushes.append(local)
+        if os.path.isdir(local):
+            subprocess.check_call(['cp', '-R', '%s/.' % local, remote])
+        else:
+            shutil.copy(local, remote)
+
+
+class DeviceSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.device = tempfile.mkdtemp()
+        self.dest = os.path.join(self.device, 'dest')
+        self.dm = MockDevice()
+        self.write('base/index.html', 'index')
+        self.write('base/dir/page 1.html', 'page 1')
+        self.write('base/dir/page2.html', 'page 2')
+        self.write('blank.html', 'blank')
+        self.pushes = dict((os.path.join(self.source, name),
+                            os.path.join(self.dest, name))
+                           for name in ('base', 'blank.html'))
+
+    def tearDown(self):
+        shutil.rmtree(self.source)
+        shutil.rmtree(self.device)
+
+    def write(self, name, content):
+        path = os.path.join(self.source, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def get_device_files(self):
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.dest):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                with open(path) as f:
+                    files[os.path.relpath(path, self.dest)] = f.read()
+        return files
+
+    def test_sync(self):
+        self.assertEqual(sync_directory(self.dm, self.pushes, self.dest),
+                         (4, 0))
+        files = self.get_device_files()
+        self.assertTrue(files.pop(MANIFEST_NAME))
+        self.assertEqual(files, {'base/index.html': 'index',
+                                 'base/dir/page 1.html': 'page 1',
+                                 'base/dir/page2.html': 'page 2',
+                                 'blank.html': 'blank'})
+
+        # A second sync does not modify the device.
+        self.dm.pushes = []
+        self.assertEqual(sync_directory(self.dm, self.pushes, self.dest),
+                         (0, 0))
+        self.assertEqual(self.dm.pushes, [])
+
+        # Only changed files are pushed and removed files are deleted.
+        self.write('base/dir/page2.html', 'page 2 changed')
+        self.write('base/new/page3.html', 'page 3')
+        os.unlink(os.path.join(self.source, 'base/dir/page 1.html'))
+        self.assertEqual(sync_directory(self.dm, self.pushes, self.dest),
+                         (2, 1))
+        self.assertEqual(len(self.dm.pushes), 3)
+        files = self.get_device_files()
+        del files[MANIFEST_NAME]
+        self.assertEqual(files, {'base/index.html': 'index',
+                                 'base/dir/page2.html': 'page 2 changed',
+                                 'base/new/page3.html': 'page 3',
+                                 'blank.html': 'blank'})
+
+    def test_interrupted_sync(self):
+        sync_directory(self.dm, self.pushes, self.dest)
+        # Without a manifest the directory is reinstalled.
+        os.unlink(os.path.join(self.dest, MANIFEST_NAME))
+        self.write(os.path.join(self.dest, 'stale.html'), 'stale')
+        self.assertEqual(sync_directory(self.dm, self.pushes, self.dest),
+                         (4, 0))
+        self.assertFalse(os.path.exists(os.path.join(self.dest,
+                                                     'stale.html')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Compares the cost of eliminating duplicate logcat lines using the
+original Logcat.get algorithm, which partitioned the entire accumulated
+logcat and parsed the date of every line on each call, with the
+incremental Logcat._remove_duplicates.
+
+A synthetic logcat of total_lines lines is accumulated by repeatedly
+dumping a device buffer which holds the last buffer_lines lines and
+which gains new_lines lines between calls.
+
+usage: python selftest/logcat_benchmark.py [total_lines [buffer_lines [new_lines]]]
+"""
+
+import datetime
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from phonetest import Logcat
+
+
+def original_remove_duplicates(raw_logcat, accumulated_logcat):
+    if accumulated_logcat:
+        logcat_datestr = accumulated_logcat[-1][:18]
+    else:
+        logcat_datestr = '00-00 00:00:00.000'
+
+    current_logcat = []
+    prev_line_date = None
+    curr_line_date = None
+    curr_year = datetime.datetime.now().year
+    hour = datetime.timedelta(hours=1)
+
+    for line in raw_logcat:
+        try:
+            curr_line_date = datetime.datetime.strptime('%4d-%s' % (
+                curr_year, line[:18]), '%Y-%m-%d %H:%M:%S.%f')
+        except ValueError:
+            curr_line_date = None
+        if curr_line_date and prev_line_date:
+            delta = curr_line_date - prev_line_date
+            prev_line_datestr = prev_line_date.strftime('%m-%d %H:%M:%S.%f')
+            if delta <= -hour:
+                current_logcat = [x for x in current_logcat
+                                  if not x < prev_line_datestr]
+            elif delta >= hour:
+                current_logcat = [x for x in current_logcat
+                                  if not x > prev_line_datestr]
+        if line >= logcat_datestr:
+            current_logcat.append(line)
+        prev_line_date = curr_line_date
+
+    accumulated_logcat_now = []
+    for x in accumulated_logcat:
+        if x[:18] == logcat_datestr:
+            accumulated_logcat_now.append(x)
+
+    current_logcat_now = []
+    current_logcat_after = []
+    for x in current_logcat:
+        if x[:18] == logcat_datestr:
+            current_logcat_now.append(x)
+        elif x > logcat_datestr:
+            current_logcat_after.append(x)
+
+    current_logcat_now = list(set(current_logcat_now).difference(
+        set(accumulated_logcat_now)))
+    current_logcat_now.sort()
+    return current_logcat_now + current_logcat_after
+
+
+def synthetic_logcat(total_lines):
+    start = datetime.datetime(datetime.datetime.now().year, 12, 31, 22)
+    lines = []
+    for i in range(total_lines):
+        # Several lines share each millisecond so that duplicates on
+        # the last accumulated date must be eliminated.
+        date = start + datetime.timedelta(milliseconds=i / 3)
+        lines.append(u'%s I/GeckoDump( 1234): line %d' % (
+            date.strftime('%m-%d %H:%M:%S.%f')[:18], i))
+        if i % 50000 == 0:
+            # Samsung Vold lines with a bogus date.
+            lines.append(u'11-30 00:00:00.000 D/Vold    (   99): bogus %d' % i)
+        if i % 10000 == 0:
+            lines.append(u'--------- beginning of /dev/log/main')
+    return lines
+
+
+def benchmark(remove_duplicates, lines, buffer_lines, new_lines):
+    accumulated = []
+    latencies = []
+    end = 0
+    while end < len(lines):
+        end = min(end + new_lines, len(lines))
+        raw_logcat = lines[max(0, end - buffer_lines):end]
+        start_time = time.time()
+        accumulated += remove_duplicates(raw_logcat, accumulated)
+        latencies.append(time.time() - start_time)
+    return accumulated, latencies
+
+
+def main(args):
+    total_lines = int(args[0]) if len(args) > 0 else 500000
+    buffer_lines = int(args[1]) if len(args) > 1 else 20000
+    new_lines = int(args[2]) if len(args) > 2 else 5000
+    lines = synthetic_logcat(total_lines)
+    print 'lines: %d, buffer lines: %d, new lines per call: %d' % (
+        len(lines), buffer_lines, new_lines)
+
+    class Options(object):
+        device_logcat_compress = False
+
+    class Test(object):
+        options = Options()
+
+    logcat = Logcat(Test(), logging.getLogger())
+
+    def incremental_remove_duplicates(raw_logcat, accumulated_logcat):
+        current_logcat = logcat._remove_duplicates(raw_logcat)
+        logcat._accumulate(current_logcat)
+        return current_logcat
+
+    results = []
+    for name, remove_duplicates in (
+            ('original', original_remove_duplicates),
+            ('incremental', incremental_remove_duplicates)):
+        accumulated, latencies = benchmark(remove_duplicates, lines,
+                                           buffer_lines, new_lines)
+        results.append(accumulated)
+        print '%-12s calls: %4d total: %8.2f s first: %7.2f ms last: %7.2f ms' % (
+            name, len(latencies), sum(latencies), latencies[0] * 1000,
+            latencies[-1] * 1000)
+    logcat.store.close()
+    if results[0] != results[1]:
+        print 'ERROR: accumulated logcats differ'
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
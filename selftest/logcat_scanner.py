@@ -0,0 +1,196 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import threading
+import time
+import unittest
+
+from logcatscanner import LogcatScanner
+from phonetest import Logcat
+
+LOGCAT_PREFIX = '(\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})'
+THROBBER_PREFIX = '..GeckoToolbarDisplayLayout.*zerdatime (\d+) - Throbber'
+
+LINES = [
+    '--------- beginning of /dev/log/main',
+    '09-17 16:45:04.370 I/ActivityManager(  512): Start proc org.mozilla.fennec for activity org.mozilla.fennec/.App: pid=2284',
+    '09-17 16:45:05.100 I/GeckoToolbarDisplayLayout( 2284): zerdatime 1234 - Throbber start',
+    '09-17 16:45:06.200 D/dalvikvm( 2284): GC_CONCURRENT freed 1K',
+    '09-17 16:45:07.300 I/GeckoToolbarDisplayLayout( 2284): zerdatime 1235 - Throbber stop',
+]
+
+
+class FakeLogcat(object):
+    def __init__(self, lines):
+        self.lines = lines
+        self.condition = threading.Condition()
+
+    def get(self):
+        with self.condition:
+            lines, self.lines = self.lines, []
+        return lines
+
+    def wait(self, timeout):
+        with self.condition:
+            if not self.lines:
+                self.condition.wait(timeout)
+            return bool(self.lines)
+
+    def append(self, line):
+        with self.condition:
+            self.lines.append(line)
+            self.condition.notify_all()
+
+
+class FakeDumpLogcat(FakeLogcat):
+    """Counts the dumps of the logcat buffer and sleeps for up to
+    interval seconds when waiting."""
+    def __init__(self, lines, interval):
+        FakeLogcat.__init__(self, lines)
+        self.interval = interval
+        self.gets = 0
+
+    def get(self):
+        self.gets += 1
+        return FakeLogcat.get(self)
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        return True
+
+
+class MockOptions(object):
+    device_logcat_compress = False
+    device_logcat_stream = False
+    phone_retry_limit = 1
+    phone_retry_wait = 0
+
+
+class MockDevice(object):
+    """Returns the device's logcat buffer from get_logcat."""
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.dumps = 0
+
+    def get_logcat(self, filter_specs=[]):
+        self.dumps += 1
+        return list(self.lines)
+
+
+class MockPhoneTest(object):
+    def __init__(self, lines):
+        self.options = MockOptions()
+        self.dm = MockDevice(lines)
+
+
+class MockLogger(object):
+    def debug(self, msg):
+        pass
+
+
+class LogcatScannerTest(unittest.TestCase):
+
+    def create_scanner(self, logcat=None):
+        scanner = LogcatScanner(logcat)
+        scanner.add('start',
+                    '%s .*([Gg]ecko|Start proc org.mozilla.fennec)' %
+                    LOGCAT_PREFIX, ['ecko', 'Start proc'])
+        scanner.add('throbber_start',
+                    '%s %s start' % (LOGCAT_PREFIX, THROBBER_PREFIX),
+                    ['Throbber start'])
+        scanner.add('throbber_stop',
+                    '%s %s stop' % (LOGCAT_PREFIX, THROBBER_PREFIX),
+                    ['Throbber stop'])
+        return scanner
+
+    def test_scan(self):
+        scanner = self.create_scanner()
+        events = scanner.scan(LINES)
+        self.assertEqual([(e.name, e.position, e.time) for e in events],
+                         [('start', 1, '09-17 16:45:04.370'),
+                          ('start', 2, '09-17 16:45:05.100'),
+                          ('throbber_start', 2, '09-17 16:45:05.100'),
+                          ('start', 4, '09-17 16:45:07.300'),
+                          ('throbber_stop', 4, '09-17 16:45:07.300')])
+        self.assertEqual(events[2].match.group(2), '1234')
+        self.assertEqual(scanner.base_time, '09-17 16:45:04.370')
+        self.assertEqual(scanner.position, len(LINES))
+
+    def test_scan_logcat(self):
+        scanner = self.create_scanner(FakeLogcat(LINES))
+        self.assertEqual(len(scanner.scan()), 5)
+        self.assertEqual(scanner.scan(), [])
+        scanner.logcat.lines = LINES[2:3]
+        events = scanner.scan()
+        self.assertEqual([(e.name, e.position) for e in events],
+                         [('start', 5), ('throbber_start', 5)])
+
+    def test_no_prefilter(self):
+        scanner = LogcatScanner()
+        scanner.add('any', LOGCAT_PREFIX)
+        scanner.add('stop', '.*Throbber stop', ['Throbber stop'])
+        self.assertEqual([e.name for e in scanner.scan(LINES)],
+                         ['any', 'any', 'any', 'any', 'stop'])
+
+    def test_wait(self):
+        scanner = self.create_scanner(FakeLogcat(LINES[:4]))
+        timer = threading.Timer(0.2, scanner.logcat.append, args=(LINES[4],))
+        timer.start()
+        start_time = time.time()
+        events = scanner.wait(30, names=['throbber_stop'])
+        timer.join()
+        self.assertTrue(time.time() - start_time < 10)
+        self.assertEqual([e.name for e in events],
+                         ['start', 'start', 'throbber_start', 'start',
+                          'throbber_stop'])
+
+    def test_iter_events_timeout(self):
+        scanner = self.create_scanner(FakeLogcat([]))
+        start_time = time.time()
+        event_lists = list(scanner.iter_events(0.5, 0.2))
+        self.assertTrue(len(event_lists) >= 3)
+        self.assertEqual([e for events in event_lists for e in events], [])
+        self.assertTrue(time.time() - start_time >= 0.5)
+
+    def test_iter_events_dumps(self):
+        scanner = self.create_scanner(FakeDumpLogcat([], 0.1))
+        event_lists = list(scanner.iter_events(1, 0.1))
+        # The logcat buffer is dumped once per interval rather than
+        # both at the end of one wait and at the start of the next.
+        self.assertTrue(len(event_lists) >= 9)
+        self.assertTrue(scanner.logcat.gets <= len(event_lists) + 2)
+        self.assertTrue(scanner.logcat.gets <= 12)
+
+
+class LogcatWaitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logcat = Logcat(MockPhoneTest(LINES[1:3]), MockLogger())
+        self.logcat.POLL_INTERVAL = 0.1
+
+    def tearDown(self):
+        self.logcat.store.close()
+
+    def test_wait_dump(self):
+        self.assertEqual(self.logcat.get(), LINES[1:3])
+        dm = self.logcat.phonetest.dm
+        timer = threading.Timer(0.3, dm.lines.extend, args=(LINES[3:],))
+        timer.start()
+        start_time = time.time()
+        self.assertTrue(self.logcat.wait(30))
+        timer.join()
+        # wait() returns once a dump finds the new output rather than
+        # after sleeping for the whole timeout.
+        self.assertTrue(time.time() - start_time < 10)
+        # The output found by wait() is returned by the next get().
+        self.assertEqual(self.logcat.get(), LINES[3:])
+        self.assertEqual(list(self.logcat.get(full=True)), LINES[1:])
+
+    def test_wait_dump_timeout(self):
+        self.logcat.get()
+        start_time = time.time()
+        self.assertFalse(self.logcat.wait(0.5))
+        self.assertTrue(time.time() - start_time >= 0.5)
+        self.assertTrue(self.logcat.phonetest.dm.dumps > 2)
+        self.assertEqual(self.logcat.get(), [])
@@ -0,0 +1,64 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import gzip
+import os
+import unittest
+import zlib
+
+from logcatstore import LogcatStore
+
+LINES = [u'09-17 16:45:04.370 I/GeckoDump( 1234): line %d \u00e9' % i
+         for i in range(10)]
+
+
+class LogcatStoreTest(unittest.TestCase):
+
+    def check_store(self, compress):
+        store = LogcatStore(compress=compress, tail_lines=3)
+        self.assertEqual(list(store), [])
+        store.extend(LINES[:4])
+        self.assertEqual(list(store), LINES[:4])
+        # Lines appended after the store has been read are read too.
+        store.extend(LINES[4:])
+        self.assertEqual(len(store), len(LINES))
+        self.assertEqual(list(store.tail), LINES[-3:])
+        self.assertEqual(list(store), LINES)
+        path = store.path
+        with open(path, 'rb') as f:
+            data = f.read()
+        if compress:
+            # The spool file is a single complete gzip member.
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data = decompressor.decompress(data)
+            self.assertEqual(decompressor.unused_data, '')
+            self.assertEqual(decompressor.flush(), '')
+        self.assertEqual(data, ''.join('%s\n' % line.encode('UTF-8')
+                                       for line in LINES))
+        # Lines appended after the path has been read are written to a
+        # new gzip member.
+        store.extend(LINES[:1])
+        self.assertEqual(list(store), LINES + LINES[:1])
+        if compress:
+            f = gzip.GzipFile(store.path, 'rb')
+        else:
+            f = open(store.path, 'rb')
+        self.assertEqual(f.read().splitlines()[-1], LINES[0].encode('UTF-8'))
+        f.close()
+        store.close()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(len(store), 0)
+
+    def test_store(self):
+        self.check_store(False)
+
+    def test_compressed_store(self):
+        self.check_store(True)
+
+    def test_empty_compressed_path(self):
+        store = LogcatStore(compress=True)
+        f = gzip.GzipFile(store.path, 'rb')
+        self.assertEqual(f.read(), '')
+        f.close()
+        store.close()
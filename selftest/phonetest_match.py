@@ -0,0 +1,49 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+from collections import namedtuple
+
+from phonetest import PhoneTest
+
+MockPhone = namedtuple('MockPhone', ['id'])
+
+
+class MockTest(PhoneTest):
+    """Registers an instance the way PhoneTest.__init__ does without
+    reading a config file."""
+
+    def __init__(self, phoneid, config_file, chunk):
+        self._add_instance(phoneid, config_file, chunk)
+        self.phone = MockPhone(phoneid)
+        self.config_file = config_file
+        self.chunk = chunk
+        self.chunks = 1
+
+
+class MatchTest(unittest.TestCase):
+
+    def tearDown(self):
+        for test in PhoneTest.instances.values():
+            test.remove()
+
+    def test_match_name_after_chunks(self):
+        test = MockTest('phone1', 'test.ini', 1)
+        test2 = MockTest('phone1', 'test.ini', 2)
+        # The name index is built before the tests' chunks are set as
+        # happens when subclasses set chunks after PhoneTest.__init__.
+        matches = PhoneTest.match(test_name='autophone-MockTest')
+        self.assertEqual(sorted(matches, key=lambda t: t.chunk),
+                         [test, test2])
+        test.chunks = 2
+        test2.chunks = 2
+        self.assertEqual(PhoneTest.match(test_name='autophone-MockTest'), [])
+        self.assertEqual(PhoneTest.match(test_name='autophone-MockTest-1'),
+                         [test])
+        self.assertEqual(PhoneTest.match(test_name='autophone-MockTest-2'),
+                         [test2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import namedtuple
+
+from logcatstore import LogcatStore
+from phonetest import CompletedTest, PhoneTestResult
+from posttest import PostTestExecutor
+
+MockBuild = namedtuple('MockBuild', ['url', 'id', 'tree', 'revision_hash',
+                                     'app_name', 'symbols'])
+MockPhone = namedtuple('MockPhone', ['id', 'platform', 'architecture'])
+MockOptions = namedtuple('MockOptions', ['minidump_stackwalk',
+                                         'sensitive_data'])
+
+
+class MockLogcat(object):
+
+    def __init__(self):
+        self.store = LogcatStore()
+
+
+class MockTest(object):
+    """Provides the PhoneTest attributes used by CompletedTest.create."""
+
+    def __init__(self, temp_dir, name):
+        self.name = name
+        self.config_file = 'configs/%s.ini' % name
+        self.chunk = 1
+        self.job_guid = 'guid-%s' % name
+        self.job_name = name
+        self.job_symbol = name
+        self.group_name = 'Autophone'
+        self.group_symbol = 'A'
+        self.message = None
+        self.submit_timestamp = 1
+        self.start_timestamp = 2
+        self.job_details = []
+        self.build = MockBuild('http://example.com/build/fennec.apk',
+                               '20160101000000', 'mozilla-central',
+                               'abc123', 'org.mozilla.fennec', None)
+        self.options = MockOptions(None, [])
+        self.phone = MockPhone('phone1', 'android-api-15', 'armv7')
+        self.test_result = PhoneTestResult()
+        self.upload_dir = tempfile.mkdtemp(dir=temp_dir)
+        with open(os.path.join(self.upload_dir, 'tombstone_00.1.txt'), 'w') as f:
+            f.write('tombstone')
+        self.unittest_logpath = None
+        self.logcat = MockLogcat()
+        self.logcat.store.extend(['logcat %s' % name])
+        self.test_logfile = os.path.join(temp_dir, '%s.log' % name)
+        with open(self.test_logfile, 'w') as f:
+            f.write('test log %s\n' % name)
+
+    def get_buildername(self, tree):
+        return '%s %s opt %s' % (self.phone.platform, tree, self.name)
+
+
+class MockTreeherder(object):
+
+    def __init__(self):
+        self.submitted = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def submit_complete(self, machine, build_url, project, revision_hash,
+                        tests=None):
+        self.release.wait(10)
+        for t in tests:
+            with open(t.logcat.store.path) as f:
+                logcat = f.read()
+            with open(t.test_logfile) as f:
+                test_log = f.read()
+            self.submitted.append((t.name, t.test_result.status, t.message,
+                                   os.listdir(t.upload_dir), logcat,
+                                   test_log))
+
+
+class MockWorker(object):
+
+    def __init__(self):
+        self.options = MockOptions(None, [])
+        self.loglevel = logging.DEBUG
+        self.treeherder = MockTreeherder()
+
+    def heartbeat(self):
+        pass
+
+
+class PostTestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.spool_dir = os.path.join(self.temp_dir, 'spool')
+        self.worker = MockWorker()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def complete(self, post_test, name, errors=None):
+        test = MockTest(self.temp_dir, name)
+        completed = post_test.create_completed_test(test, errors or [], [])
+        completed.add_test_logfile(test.test_logfile)
+        test.logcat.store.close()
+        self.assertFalse(os.path.exists(test.upload_dir))
+        return completed
+
+    def test_process_in_order(self):
+        post_test = PostTestExecutor(self.worker, self.spool_dir, 1)
+        post_test.start()
+        self.worker.treeherder.release.clear()
+        profile_error = {'reason': 'PROFILE-ERROR', 'signature': 'No crash directory'}
+        post_test.submit(self.complete(post_test, 's1s2'))
+        post_test.submit(self.complete(post_test, 'webappstartup',
+                                       errors=[profile_error]))
+        # The first completed test is being submitted and the queue is
+        # full until it has been.
+        self.assertTrue(post_test.queue.full())
+        self.worker.treeherder.release.set()
+        post_test.submit(self.complete(post_test, 'smoketest'))
+        post_test.stop()
+        submitted = self.worker.treeherder.submitted
+        self.assertEqual([s[0] for s in submitted],
+                         ['s1s2', 'webappstartup', 'smoketest'])
+        self.assertEqual(submitted[0][1:5],
+                         (PhoneTestResult.SUCCESS, None,
+                          ['tombstone_00.1.txt'], 'logcat s1s2\n'))
+        self.assertEqual(submitted[1][1:3],
+                         (PhoneTestResult.TESTFAILED, 'No crash directory'))
+        self.assertTrue(submitted[0][5].startswith('test log s1s2\n'))
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_process_crashes_exception(self):
+        post_test = PostTestExecutor(self.worker, self.spool_dir, 1)
+        post_test.start()
+        completed = self.complete(post_test, 's1s2')
+
+        def process_crashes():
+            raise IOError('No space left on device')
+        completed.process_crashes = process_crashes
+        post_test.submit(completed)
+        post_test.stop()
+        # The exception is recorded and the results are still submitted.
+        self.assertEqual(self.worker.treeherder.submitted[0][:3],
+                         ('s1s2', PhoneTestResult.EXCEPTION,
+                          'Exception No space left on device during '
+                          'crash processing'))
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_restart(self):
+        post_test = PostTestExecutor(self.worker, self.spool_dir, 4)
+        # Completed tests which were not processed before the worker
+        # stopped are processed in order when it is restarted.
+        self.complete(post_test, 's1s2')
+        self.complete(post_test, 'smoketest')
+        os.mkdir(os.path.join(self.spool_dir, '0000000003'))
+        post_test = PostTestExecutor(self.worker, self.spool_dir, 4)
+        post_test.start()
+        post_test.submit(self.complete(post_test, 'webappstartup'))
+        post_test.stop()
+        self.assertEqual([s[0] for s in self.worker.treeherder.submitted],
+                         ['s1s2', 'smoketest', 'webappstartup'])
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_load(self):
+        post_test = PostTestExecutor(self.worker, self.spool_dir, 4)
+        completed = self.complete(post_test, 's1s2')
+        completed.test_failure('s1s2', 'PROCESS-CRASH', 'crashed',
+                               PhoneTestResult.EXCEPTION)
+        completed.save()
+        loaded = CompletedTest.load(completed.path)
+        self.assertEqual(loaded.get_buildername('mozilla-central'),
+                         'android-api-15 mozilla-central opt s1s2')
+        self.assertEqual(loaded.phone, completed.phone)
+        self.assertEqual(loaded.test_result.status, PhoneTestResult.EXCEPTION)
+        self.assertEqual(loaded.test_result.failures,
+                         completed.test_result.failures)
+        self.assertEqual(loaded.end_timestamp, completed.end_timestamp)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import logging
+import os
+import posixpath
+import shutil
+import stat
+import subprocess
+import tempfile
+import time
+import unittest
+
+from adb import ADBError, ADBShellResult
+from phonetest import PhoneTest
+from profilecache import ProfileCache
+
+
+class MockDevice(object):
+    """Implements the ADBDevice methods used by install_profile_snapshot
+    on the local file system. Like adb push, push runs as the shell user
+    which can only write to directories created as root if they are
+    writable by everyone."""
+
+    def __init__(self):
+        self.pushes = []
+
+    def supports_recursive_copy(self):
+        return True
+
+    def is_dir(self, path, root=False):
+        return os.path.isdir(path)
+
+    def mkdir(self, path, parents=False, root=False):
+        if parents:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        else:
+            os.mkdir(path)
+        os.chmod(path, 0755)
+
+    def list_files(self, path, root=False):
+        return os.listdir(path)
+
+    def rm(self, path, recursive=False, force=False, root=False):
+        shutil.rmtree(path, ignore_errors=force)
+
+    def shell_batch(self, cmds, root=False):
+        results = []
+        for cmd in cmds:
+            proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT)
+            output = proc.communicate()[0]
+            results.append(ADBShellResult(cmd, output, proc.returncode))
+        return results
+
+    def shell_output(self, cmd, root=False):
+        return subprocess.check_output(cmd, shell=True)
+
+    def push(self, local, remote):
+        if not os.stat(remote).st_mode & stat.S_IWOTH:
+            raise ADBError('failed to copy %s to %s: Permission denied' %
+                           (local, remote))
+        for name in os.listdir(local):
+            shutil.copy(os.path.join(local, name), remote)
+        self.pushes.append(remote)
+
+
+class MockPhoneTest(object):
+
+    install_profile_snapshot = PhoneTest.install_profile_snapshot.im_func
+
+    def __init__(self, profile_cache, device_dir):
+        self.dm = MockDevice()
+        self.profile_cache = profile_cache
+        self.profile_snapshots_path = posixpath.join(device_dir, 'profiles')
+        self.loggerdeco = logging.getLogger()
+
+
+class ProfileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addon_dir = tempfile.mkdtemp()
+        self.addon = os.path.join(self.addon_dir, 'addon.xpi')
+        with open(self.addon, 'wb') as f:
+            f.write('addon 1')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(self.addon_dir)
+
+    def test_key(self):
+        prefs = {'a': 1, 'b': True, 'c': 'c'}
+        key = ProfileCache.get_key(prefs, [self.addon])
+        self.assertEqual(key, ProfileCache.get_key(dict(prefs),
+                                                   [self.addon]))
+        self.assertNotEqual(key, ProfileCache.get_key({'a': 1},
+                                                      [self.addon]))
+        self.assertNotEqual(key, ProfileCache.get_key(prefs, []))
+        # The key depends upon the contents of the addon.
+        with open(self.addon, 'wb') as f:
+            f.write('addon 2')
+        self.assertNotEqual(key, ProfileCache.get_key(prefs, [self.addon]))
+
+    def test_get(self):
+        cache = ProfileCache(self.cache_dir, 2)
+        profile = cache.get({'a': 1}, [])
+        self.assertTrue(os.path.isfile(os.path.join(profile.profile,
+                                                    'user.js')))
+        self.assertEqual(profile.key, ProfileCache.get_key({'a': 1}, []))
+        self.assertEqual(cache.get({'a': 1}, []), profile)
+        self.assertEqual(os.listdir(self.cache_dir), [profile.key])
+
+    def test_expire(self):
+        cache = ProfileCache(self.cache_dir, 2)
+        profiles = []
+        for i in range(3):
+            profiles.append(cache.get({'a': i}, []))
+            # Ensure the profiles have distinct modification times.
+            os.utime(profiles[-1].profile, (time.time() - 10 + i,
+                                            time.time() - 10 + i))
+        # Using the first profile makes the second the least recently used.
+        cache.get({'a': 0}, [])
+        cache.get({'a': 3}, [])
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         sorted([profiles[0].key,
+                                 ProfileCache.get_key({'a': 3}, [])]))
+
+
+
+class ProfileSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.device_dir = tempfile.mkdtemp()
+        self.profile_cache = ProfileCache(self.cache_dir, 2)
+        self.test = MockPhoneTest(self.profile_cache, self.device_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(self.device_dir)
+
+    def test_install_profile_snapshot(self):
+        profile = self.profile_cache.get({'a': 1}, [])
+        snapshot_path = self.test.install_profile_snapshot(profile)
+        self.assertEqual(snapshot_path,
+                         posixpath.join(self.device_dir, 'profiles',
+                                        profile.key))
+        # The profile was pushed to a temporary directory writable by
+        # the shell user.
+        self.assertEqual(self.test.dm.pushes, [snapshot_path + '.tmp'])
+        self.assertTrue(os.path.isfile(os.path.join(snapshot_path,
+                                                    'user.js')))
+        # The snapshot is reused.
+        self.assertEqual(self.test.install_profile_snapshot(profile),
+                         snapshot_path)
+        self.assertEqual(len(self.test.dm.pushes), 1)
+        # Snapshots of profiles which are no longer cached are removed.
+        self.profile_cache.get({'a': 2}, [])
+        self.profile_cache.get({'a': 3}, [])
+        profile = self.profile_cache.get({'a': 3}, [])
+        self.test.install_profile_snapshot(profile)
+        self.assertEqual(os.listdir(os.path.dirname(snapshot_path)),
+                         [profile.key])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from adb import ADBDevice, ADBShellResult
+from shell_session import ADB, SERIAL
+
+CMDS = ['echo one',
+        'echo two; exit 2',
+        'echo three']
+
+
+class ShellBatchTest(unittest.TestCase):
+
+    shell_sessions = 0
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.invocations = os.path.join(self.temp_dir, 'invocations')
+        self.adb = os.path.join(self.temp_dir, 'adb')
+        with open(self.adb, 'w') as f:
+            f.write(ADB % {'invocations': self.invocations})
+        os.chmod(self.adb, stat.S_IRWXU)
+        self.device = ADBDevice(device=SERIAL, adb=self.adb,
+                                shell_sessions=self.shell_sessions)
+        # Each batch is executed by a single adb process or session.
+        self.device.close_shell_sessions()
+        os.unlink(self.invocations)
+
+    def tearDown(self):
+        self.device.close_shell_sessions()
+        shutil.rmtree(self.temp_dir)
+
+    def get_invocations(self):
+        with open(self.invocations) as f:
+            return len(f.readlines())
+
+    def test_success(self):
+        results = self.device.shell_batch(['echo one', 'printf two',
+                                           'true'])
+        self.assertEqual(results,
+                         [ADBShellResult('echo one', 'one\n', 0),
+                          ADBShellResult('printf two', 'two', 0),
+                          ADBShellResult('true', '', 0)])
+        self.assertEqual(self.get_invocations(), 1)
+
+    def test_stop_on_error(self):
+        results = self.device.shell_batch(CMDS)
+        # The commands after the failing command are not executed.
+        self.assertEqual(results,
+                         [ADBShellResult(CMDS[0], 'one\n', 0),
+                          ADBShellResult(CMDS[1], 'two\n', 2),
+                          ADBShellResult(CMDS[2], '', None)])
+        self.assertEqual(self.get_invocations(), 1)
+
+    def test_continue_on_error(self):
+        results = self.device.shell_batch(CMDS, stop_on_error=False)
+        self.assertEqual(results,
+                         [ADBShellResult(CMDS[0], 'one\n', 0),
+                          ADBShellResult(CMDS[1], 'two\n', 2),
+                          ADBShellResult(CMDS[2], 'three\n', 0)])
+        self.assertEqual(self.get_invocations(), 1)
+
+    def test_shell_syntax(self):
+        # Commands may contain any shell syntax including the case
+        # terminators and trailing whitespace is kept.
+        cmds = ['case x in x) echo esac;; esac', 'printf "a\\n\\n  "']
+        for stop_on_error in (True, False):
+            results = self.device.shell_batch(cmds,
+                                              stop_on_error=stop_on_error)
+            self.assertEqual(results,
+                             [ADBShellResult(cmds[0], 'esac\n', 0),
+                              ADBShellResult(cmds[1], 'a\n\n  ', 0)])
+
+
+class ShellBatchSessionTest(ShellBatchTest):
+
+    shell_sessions = 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+from adb import ADBDevice, ADBShellSession, ADBTimeoutError
+
+SERIAL = 'ABCD1234'
+
+# Fake adb whose shell is the host's sh. Each invocation is recorded.
+ADB = """#!/bin/sh
+echo "$*" >> "%(invocations)s"
+while [ $# -gt 0 ]; do
+  case "$1" in
+    shell) shift; if [ $# -gt 0 ]; then exec sh -c "$*"; else exec sh; fi;;
+    *) shift;;
+  esac
+done
+"""
+
+
+class ShellSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.invocations = os.path.join(self.temp_dir, 'invocations')
+        self.adb = os.path.join(self.temp_dir, 'adb')
+        with open(self.adb, 'w') as f:
+            f.write(ADB % {'invocations': self.invocations})
+        os.chmod(self.adb, stat.S_IRWXU)
+        self.device = ADBDevice(device=SERIAL, adb=self.adb,
+                                shell_sessions=1)
+
+    def tearDown(self):
+        self.device.close_shell_sessions()
+        shutil.rmtree(self.temp_dir)
+
+    def get_sessions_started(self):
+        with open(self.invocations) as f:
+            return len([line for line in f.readlines()
+                        if line.rstrip('\n').endswith('wait-for-device shell')])
+
+    def test_framing(self):
+        session = ADBShellSession(['sh'])
+        try:
+            # Output which is not terminated by a newline or which
+            # contains the echoed command is returned unchanged.
+            self.assertEqual(session.run('printf abc', 10), ('abc', 0))
+            self.assertEqual(session.run('echo ADBSESSION-END rc=1', 10),
+                             ('ADBSESSION-END rc=1\n', 0))
+            self.assertEqual(session.run('echo one; echo two >&2', 10),
+                             ('one\ntwo\n', 0))
+            self.assertEqual(session.run('exit 3', 10), ('', 3))
+            self.assertEqual(session.run('false', 10), ('', 1))
+            # Commands run in a subshell so the session survives exit.
+            self.assertTrue(session.is_alive())
+        finally:
+            session.stop()
+
+    def test_exitcode(self):
+        self.assertEqual(self.device.shell_output('echo hello'), 'hello')
+        self.assertTrue(self.device.shell_bool('true'))
+        adb_process = self.device.shell('echo failed; exit 42')
+        self.assertEqual(adb_process.exitcode, 42)
+        self.assertEqual(adb_process.stdout_file.read(), 'failed\n')
+        # All of the commands were executed in one session.
+        self.assertEqual(self.get_sessions_started(), 1)
+
+    def test_respawn(self):
+        self.assertEqual(self.device.shell_output('echo one'), 'one')
+        # The session exits while a command is running.
+        adb_process = self.device.shell('kill -9 $$')
+        self.assertNotEqual(adb_process.exitcode, 0)
+        self.assertEqual(self.device.shell_output('echo two'), 'two')
+        # The session is killed between commands.
+        session = self.device._get_shell_session()
+        session.proc.kill()
+        session.proc.wait()
+        self.device._put_shell_session(session)
+        self.assertEqual(self.device.shell_output('echo three'), 'three')
+        self.assertEqual(self.get_sessions_started(), 3)
+
+    def test_timeout(self):
+        start = time.time()
+        self.assertRaises(ADBTimeoutError, self.device.shell_output,
+                          'sleep 10', timeout=1)
+        self.assertTrue(time.time() - start < 5)
+        # The timed out session is replaced by a new one.
+        self.assertEqual(self.device.shell_output('echo done'), 'done')
+        self.assertEqual(self.get_sessions_started(), 2)
+
+    def test_close_in_use(self):
+        self.assertEqual(self.device.shell_output('echo one'), 'one')
+        session = self.device._get_shell_session()
+        start = time.time()
+        self.device.close_shell_sessions(timeout=1)
+        self.assertTrue(time.time() - start < 5)
+        self.assertTrue(session.is_alive())
+        # The session which was in use when the sessions were closed is
+        # stopped when it is returned.
+        self.device._put_shell_session(session)
+        self.assertFalse(session.is_alive())
+        self.assertEqual(self.device.shell_output('echo two'), 'two')
+        self.assertEqual(self.get_sessions_started(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
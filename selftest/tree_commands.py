@@ -0,0 +1,80 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from adb import ADBDevice
+from shell_session import ADB, SERIAL
+
+FILES = ['a', 'b/c', 'b/d/e', 'f/g']
+
+
+class TreeCommandsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.invocations = os.path.join(self.temp_dir, 'invocations')
+        self.adb = os.path.join(self.temp_dir, 'adb')
+        with open(self.adb, 'w') as f:
+            f.write(ADB % {'invocations': self.invocations})
+        os.chmod(self.adb, stat.S_IRWXU)
+        self.device = ADBDevice(device=SERIAL, adb=self.adb,
+                                shell_sessions=0)
+        self.device._detect_tree_commands()
+        self.tree = os.path.join(self.temp_dir, 'tree')
+        for name in FILES:
+            path = os.path.join(self.tree, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+        self.expected = sorted(set(FILES + ['b', 'b/d', 'f']))
+        os.unlink(self.invocations)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def get_invocations(self):
+        with open(self.invocations) as f:
+            return len(f.readlines())
+
+    def test_list_files_find(self):
+        self.assertEqual(sorted(self.device.list_files(self.tree,
+                                                       recursive=True)),
+                         self.expected)
+        # is_dir and find.
+        self.assertEqual(self.get_invocations(), 2)
+
+    def test_list_files_ls(self):
+        self.device._find = ''
+        self.assertEqual(sorted(self.device.list_files(self.tree,
+                                                       recursive=True)),
+                         self.expected)
+        # is_dir and ls -R.
+        self.assertEqual(self.get_invocations(), 2)
+
+    def test_list_files_walk(self):
+        # The tree is walked from the host if it cannot be listed on
+        # the device.
+        self.device._find = 'false'
+        self.assertEqual(sorted(self.device.list_files(self.tree,
+                                                       recursive=True)),
+                         self.expected)
+
+    def test_chmod_fallback(self):
+        self.device._chmod_R = ''
+        self.device.chmod(self.tree, recursive=True, mask='700')
+        for name in self.expected:
+            mode = os.stat(os.path.join(self.tree, name)).st_mode
+            self.assertEqual(stat.S_IMODE(mode), 0700)
+        # The number of adb invocations does not depend on the number
+        # of entries in the tree.
+        self.assertTrue(self.get_invocations() <= 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,9 +5,8 @@
 import ConfigParser
 import logging
 import os
-import re
-from time import sleep
 
+from logcatscanner import LogcatScanner
 from perftest import PerfTest, PerfherderArtifact, PerfherderSuite
 from phonetest import PhoneTestResult
 from utils import median, geometric_mean
@@ -254,30 +253,26 @@ class RoboTest(PerfTest):
         """
         self.loggerdeco.debug('analyzing logcat')
 
-        re_data = re.compile('.*__start_report([0-9\.]+)__end_report.*')
+        scanner = LogcatScanner(self.logcat)
+        scanner.add('report', '.*__start_report([0-9\.]+)__end_report.*',
+                    ['__start_report'])
 
-        attempt = 1
         max_time = 90  # maximum time to wait for completeness score
-        wait_time = 3  # time to wait between attempts
-        max_attempts = max_time / wait_time
+        wait_time = 3  # maximum time to wait between checks for a crash
 
         results = {"tcheck3": []}
         pageload_metric = {'summary': 0}
-        while attempt <= max_attempts and pageload_metric['summary'] == 0:
-            buf = self.logcat.get()
-            for line in buf:
-                match = re_data.match(line)
-                if match:
-                    numbers = match.group(1)
+        for events in scanner.iter_events(max_time, wait_time,
+                                          names=['report']):
+            for event in events:
+                if event.name == 'report':
+                    numbers = event.match.group(1)
                     if numbers:
                         results["tcheck3"].append(float(numbers))
 
             if self.fennec_crashed:
                 # If fennec crashed, don't bother looking for pageload metric
                 break
-            if pageload_metric['summary'] == 0:
-                sleep(wait_time)
-                attempt += 1
 
             if not results["tcheck3"]:
                 continue
@@ -286,6 +281,7 @@ class RoboTest(PerfTest):
             data = results["tcheck3"]
             pageload_metric["tcheck3"] = median(data)
             pageload_metric['summary'] = geometric_mean(data)
+            break
 
         if pageload_metric['summary'] == 0:
             self.loggerdeco.info('Unable to find pageload metric')
@@ -15,6 +15,7 @@ import traceback
 
 from logparser import LogParser
 
+import configcache
 from phonetest import PhoneTest, PhoneTestResult
 
 # Set the logger globally in the file, but this must be reset when
@@ -28,10 +29,9 @@ class UnitTest(PhoneTest):
         PhoneTest.__init__(self, dm=dm, phone=phone, options=options,
                            config_file=config_file, chunk=chunk, repos=repos)
         self.enable_unittests = True
-        self.unittest_cfg = ConfigParser.RawConfigParser()
-
         unittest_config_file = self.cfg.get('runtests', 'unittest_defaults')
-        self.unittest_cfg.read(unittest_config_file)
+        self.unittest_cfg = configcache.get_config(
+            unittest_config_file, ConfigParser.RawConfigParser)
 
         self.loggerdeco.info('config_file = %s, unittest_config_file = %s' %
                              (config_file, unittest_config_file))
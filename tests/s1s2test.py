@@ -6,11 +6,10 @@ import ConfigParser
 import datetime
 import logging
 import os
-import re
 import urlparse
 
-from time import sleep
 
+from logcatscanner import LogcatScanner
 from perftest import PerfTest
 from phonetest import PhoneTestResult
 
@@ -272,79 +271,78 @@ class S1S2Test(PerfTest):
 
         logcat_prefix = '(\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})'
         throbber_prefix = '..GeckoToolbarDisplayLayout.*zerdatime (\d+) - Throbber'
-        re_base_time = re.compile('%s' % logcat_prefix)
-        re_start_time = re.compile(
-            '%s .*([Gg]ecko|Start proc %s for activity %s/.App)' % (
-                logcat_prefix, self.build.app_name, self.build.app_name))
-        re_throbber_start_time = re.compile('%s %s start' %
-                                            (logcat_prefix, throbber_prefix))
-        re_throbber_stop_time = re.compile('%s %s stop' %
-                                           (logcat_prefix, throbber_prefix))
+        scanner = LogcatScanner(self.logcat)
+        scanner.add('start',
+                    '%s .*([Gg]ecko|Start proc %s for activity %s/.App)' % (
+                        logcat_prefix, self.build.app_name,
+                        self.build.app_name),
+                    ['ecko', 'Start proc'])
+        scanner.add('throbber_start',
+                    '%s %s start' % (logcat_prefix, throbber_prefix),
+                    ['Throbber start'])
+        scanner.add('throbber_stop',
+                    '%s %s stop' % (logcat_prefix, throbber_prefix),
+                    ['Throbber stop'])
 
         base_time = 0
         start_time = 0
         throbber_start_time = 0
         throbber_stop_time = 0
 
-        attempt = 1
         max_time = 90 # maximum time to wait for throbbers
-        wait_time = 3 # time to wait between attempts
-        max_attempts = max_time / wait_time
-
-        while (attempt <= max_attempts and (throbber_start_time == 0 or
-                                            throbber_stop_time == 0)):
-            buf = self.logcat.get()
-            for line in buf:
-                self.loggerdeco.debug('analyze_logcat: %s' % line)
-                match = re_base_time.match(line)
-                if match and not base_time:
-                    base_time = match.group(1)
-                    self.loggerdeco.info('analyze_logcat: base_time: %s' %
-                                         base_time)
+        wait_time = 3 # maximum time to wait between checks for a crash
+
+        for events in scanner.iter_events(max_time, wait_time,
+                                          names=['throbber_stop']):
+            # Only the first matching pattern is used for a line.
+            used_position = None
+            for event in events:
+                if event.position == used_position:
+                    continue
                 # We want the Start proc message or if that is not
                 # available, the first gecko related message in order
                 # to determine the start_time which will be used to
                 # convert the absolute time values into values
                 # relative to the start of fennec.
-                match = re_start_time.match(line)
-                if match and (not start_time or
-                              match.group(2).startswith('Start proc')):
-                    start_time = match.group(1)
-                    self.loggerdeco.info('analyze_logcat: start_time: %s %s' %
-                                          (start_time, match.group(2)))
-                    continue
+                if event.name == 'start':
+                    if (not start_time or
+                        event.match.group(2).startswith('Start proc')):
+                        start_time = event.match.group(1)
+                        self.loggerdeco.info('analyze_logcat: start_time: %s %s' %
+                                             (start_time, event.match.group(2)))
+                        used_position = event.position
                 # We want the first throbberstart and throbberstop
                 # after the start_time.
-                match = re_throbber_start_time.match(line)
-                if match:
+                elif event.name == 'throbber_start':
                     if throbber_start_time:
                         self.loggerdeco.warning(
                             'analyze_logcat: throbber_start_time: %s '
                             'missing throbber_stop. Resetting '
                             'throbber_start_time.' % throbber_start_time)
-                    throbber_start_time = match.group(1)
+                    throbber_start_time = event.match.group(1)
                     self.loggerdeco.info(
                         'analyze_logcat: throbber_start_time: %s' %
                         throbber_start_time)
-                    continue
-                match = re_throbber_stop_time.match(line)
-                if match and not throbber_stop_time:
-                    throbber_stop_time = match.group(1)
-                    self.loggerdeco.info(
-                        'analyze_logcat: throbber_stop_time: %s' %
-                        throbber_stop_time)
-                    continue
+                    used_position = event.position
+                elif event.name == 'throbber_stop':
+                    if not throbber_stop_time:
+                        throbber_stop_time = event.match.group(1)
+                        self.loggerdeco.info(
+                            'analyze_logcat: throbber_stop_time: %s' %
+                            throbber_stop_time)
+                        used_position = event.position
                 if start_time and throbber_start_time and throbber_stop_time:
                     break
+            if not base_time and scanner.base_time:
+                base_time = scanner.base_time
+                self.loggerdeco.info('analyze_logcat: base_time: %s' %
+                                     base_time)
             if self.fennec_crashed:
                 # If fennec crashed, don't bother looking for the Throbbers
                 self.loggerdeco.warning('analyze_logcat: fennec crashed.')
                 break
-            if (start_time == 0 or
-                throbber_start_time == 0 or
-                throbber_stop_time == 0):
-                sleep(wait_time)
-                attempt += 1
+            if throbber_start_time and throbber_stop_time:
+                break
         if throbber_start_time and throbber_stop_time == 0:
             self.loggerdeco.warning('Unable to find Throbber stop')
 
@@ -5,9 +5,8 @@
 import ConfigParser
 import logging
 import os
-import re
-from time import sleep
 
+from logcatscanner import LogcatScanner
 from perftest import PerfTest, PerfherderArtifact, PerfherderSuite
 from phonetest import PhoneTestResult
 from utils import median, geometric_mean
@@ -239,21 +238,20 @@ I/GeckoDump( 2284): __startTimestamp1433438438092__endTimestamp
         """
         self.loggerdeco.debug('analyzing logcat')
 
-        re_page_data = re.compile('.*\|[0-9];([a-zA-Z0-9\.\/\-]+);([0-9;]+).*')
-        re_end_report = re.compile('.*__end_tp_report.*')
+        scanner = LogcatScanner(self.logcat)
+        scanner.add('end_report', '.*__end_tp_report.*', ['__end_tp_report'])
+        scanner.add('page_data',
+                    '.*\|[0-9];([a-zA-Z0-9\.\/\-]+);([0-9;]+).*', ['|'])
 
-        attempt = 1
         max_time = 90  # maximum time to wait for completeness score
-        wait_time = 3  # time to wait between attempts
-        max_attempts = max_time / wait_time
+        wait_time = 3  # maximum time to wait between checks for a crash
 
         results = {}
         pageload_metric = {'summary': 0}
-        while attempt <= max_attempts and pageload_metric['summary'] == 0:
-            buf = self.logcat.get()
-            for line in buf:
-                self.loggerdeco.debug('analyze_logcat: %s' % line)
-                if re_end_report.match(line):
+        for events in scanner.iter_events(max_time, wait_time,
+                                          names=['end_report']):
+            for event in events:
+                if event.name == 'end_report':
                     # calculate score
                     data = []
                     for page in results:
@@ -262,10 +260,9 @@ I/GeckoDump( 2284): __startTimestamp1433438438092__endTimestamp
                     pageload_metric['summary'] = geometric_mean(data)
                     break
 
-                match = re_page_data.match(line)
-                if match:
-                    page_name = match.group(1)
-                    numbers = match.group(2)
+                if event.name == 'page_data':
+                    page_name = event.match.group(1)
+                    numbers = event.match.group(2)
                     if page_name and numbers:
                         page_name = page_name.split('/')[0]
                         numbers = [float(x) for x in numbers.split(';')]
@@ -274,9 +271,8 @@ I/GeckoDump( 2284): __startTimestamp1433438438092__endTimestamp
             if self.fennec_crashed:
                 # If fennec crashed, don't bother looking for pageload metric
                 break
-            if pageload_metric['summary'] == 0:
-                sleep(wait_time)
-                attempt += 1
+            if pageload_metric['summary'] != 0:
+                break
         if pageload_metric['summary'] == 0:
             self.loggerdeco.warning('Unable to find pageload metric')
 
@@ -10,9 +10,8 @@ import sys
 import tempfile
 from time import sleep
 
-from mozprofile import FirefoxProfile
-
 from adb import ADBError
+from logcatscanner import LogcatScanner
 from perftest import PerfTest
 from phonetest import PhoneTestResult
 
@@ -162,7 +161,7 @@ class WebappStartupTest(PerfTest):
             prefs = dict(self.preferences.items() + custom_prefs.items())
         else:
             prefs = self.preferences
-        profile = FirefoxProfile(preferences=prefs, addons=addons)
+        profile = self.build_profile(prefs, addons)
         if not self.install_profile(profile):
             return False
 
@@ -479,74 +478,76 @@ class WebappStartupTest(PerfTest):
         logcat_prefix = '(\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})'
         chrome_prefix = '..GeckoBrowser.*: zerdatime .* - browser chrome startup finished.'
         webapp_prefix = '..GeckoConsole.*WEBAPP STARTUP COMPLETE'
-        re_base_time = re.compile('%s' % logcat_prefix)
-        re_start_time = re.compile(
-            '%s .*([Gg]ecko|Start proc %s for activity %s)' % (
-                logcat_prefix, self.webappstartup_name, self.webappstartup_name))
-        re_chrome_time = re.compile('%s %s' %
-                                    (logcat_prefix, chrome_prefix))
-        re_startup_time = re.compile('%s %s' %
-                                     (logcat_prefix, webapp_prefix))
+        scanner = LogcatScanner(self.logcat)
+        scanner.add('start',
+                    '%s .*([Gg]ecko|Start proc %s for activity %s)' % (
+                        logcat_prefix, self.webappstartup_name,
+                        self.webappstartup_name),
+                    ['ecko', 'Start proc'])
+        scanner.add('chrome',
+                    '%s %s' % (logcat_prefix, chrome_prefix),
+                    ['browser chrome startup finished'])
+        scanner.add('startup',
+                    '%s %s' % (logcat_prefix, webapp_prefix),
+                    ['WEBAPP STARTUP COMPLETE'])
 
         base_time = 0
         start_time = 0
         chrome_time = 0
         startup_time = 0
 
-        attempt = 1
         max_time = 90 # maximum time to wait for WEBAPP STARTUP COMPLETE
-        wait_time = 3 # time to wait between attempts
-        max_attempts = max_time / wait_time
-
-        while attempt <= max_attempts and startup_time == 0:
-            buf = self.logcat.get()
-            for line in buf:
-                self.loggerdeco.debug('analyze_logcat: %s' % line)
-                match = re_base_time.match(line)
-                if match and not base_time:
-                    base_time = match.group(1)
-                    self.loggerdeco.info('analyze_logcat: base_time: %s' %
-                                         base_time)
+        wait_time = 3 # maximum time to wait between checks for a crash
+
+        for events in scanner.iter_events(max_time, wait_time,
+                                          names=['startup']):
+            # Only the first matching pattern is used for a line.
+            used_position = None
+            for event in events:
+                if event.position == used_position:
+                    continue
                 # We want the Start proc message or if that is not
                 # available, the first gecko related message in order
                 # to determine the start_time which will be used to
                 # convert the absolute time values into values
                 # relative to the start of fennec.
-                match = re_start_time.match(line)
-                if match and (not start_time or
-                              match.group(2).startswith('Start proc')):
-                    start_time = match.group(1)
-                    self.loggerdeco.info('analyze_logcat: start_time: %s %s' %
-                                         (start_time, match.group(2)))
-                    continue
+                if event.name == 'start':
+                    if (not start_time or
+                        event.match.group(2).startswith('Start proc')):
+                        start_time = event.match.group(1)
+                        self.loggerdeco.info('analyze_logcat: start_time: %s %s' %
+                                             (start_time, event.match.group(2)))
+                        used_position = event.position
                 # We want the first chrome time and WEBAPP STARTUP
                 # COMPLETE after the start_time.
-                match = re_chrome_time.match(line)
-                if match:
+                elif event.name == 'chrome':
                     if chrome_time:
                         self.loggerdeco.warning(
                             'analyze_logcat: chrome_time: %s '
                             'missing startup_time. Resetting '
                             'throbber_start_time.' % chrome_time)
-                    chrome_time = match.group(1)
+                    chrome_time = event.match.group(1)
                     self.loggerdeco.info('analyze_logcat: chrome_time: %s' %
                                          chrome_time)
-                    continue
-                match = re_startup_time.match(line)
-                if match and not startup_time:
-                    startup_time = match.group(1)
-                    self.loggerdeco.info('analyze_logcat: startup_time: %s' %
-                                         startup_time)
-                    continue
+                    used_position = event.position
+                elif event.name == 'startup':
+                    if not startup_time:
+                        startup_time = event.match.group(1)
+                        self.loggerdeco.info('analyze_logcat: startup_time: %s' %
+                                             startup_time)
+                        used_position = event.position
                 if start_time and startup_time:
                     break
+            if not base_time and scanner.base_time:
+                base_time = scanner.base_time
+                self.loggerdeco.info('analyze_logcat: base_time: %s' %
+                                     base_time)
             if self.fennec_crashed:
                 # If fennec crashed, don't bother looking for the Throbbers
                 self.loggerdeco.warning('analyze_logcat: fennec crashed.')
                 break
-            if start_time == 0 or chrome_time == 0 or startup_time == 0:
-                sleep(wait_time)
-                attempt += 1
+            if startup_time:
+                break
         if chrome_time and startup_time == 0:
             self.loggerdeco.warning('Unable to find WEBAPP STARTUP COMPLETE')
 
@@ -4,6 +4,7 @@
 
 # get_remote_content modelled on treeherder/etc/common.py
 
+import hashlib
 import httplib
 import json
 import logging
@@ -152,6 +153,15 @@ def generate_guid():
     return str(uuid.uuid4())
 
 
+def get_file_hash(path):
+    """Returns the sha1 hex digest of the contents of the file path."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(65536), ''):
+            h.update(data)
+    return h.hexdigest()
+
+
 # These computational functions are taken from Talos:filter.py
 def median(series):
     """
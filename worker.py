@@ -16,6 +16,7 @@ import sys
 import tempfile
 import time
 import traceback
+import urlparse
 
 import buildserver
 import jobs
@@ -25,6 +26,7 @@ import autophonetreeherder
 import builds
 import mailer
 import phonetest
+import posttest
 import s3
 import utils
 from adb import ADBError, ADBTimeoutError
@@ -33,6 +35,7 @@ from builds import BuildMetadata
 from logdecorator import LogDecorator
 from phonestatus import PhoneStatus
 from phonetest import PhoneTest, PhoneTestResult
+from posttest import PostTestExecutor
 from process_states import ProcessStates
 from s3 import S3Bucket
 from sensitivedatafilter import SensitiveDataFilter
@@ -92,12 +95,31 @@ class PhoneWorker(object):
 
     DEVICE_READY_RETRY_WAIT = 20
     DEVICE_READY_RETRY_ATTEMPTS = 3
+    DEVICE_SHELL_SESSIONS = 0
+    DEVICE_USE_SOCKET = False
+    DEVICE_CAPABILITIES_CACHE = 'device_capabilities'
+    DEVICE_PROPS_TTL = 60
+    DEVICE_INIT_THREADS = 8
+    DEVICE_LOGCAT_STREAM = False
+    DEVICE_LOGCAT_COMPRESS = False
+    DEVICE_SYNC_LOCAL_PAGES = False
+    DEVICE_PUSH_TAR = False
+    DEVICE_PUSH_TAR_COMPRESS = False
     DEVICE_BATTERY_MIN = 90
     DEVICE_BATTERY_MAX = 95
+    # The profile cache and the profile snapshots on the device are
+    # disabled unless profile_cache is set to a directory.
+    PROFILE_CACHE = ''
+    PROFILE_CACHE_SIZE = 16
+    BUILD_CACHE_PREFETCH = True
+    POST_TEST_QUEUE_SIZE = 4
     PHONE_RETRY_LIMIT = 2
     PHONE_RETRY_WAIT = 15
     PHONE_MAX_REBOOTS = 3
+    PHONE_REBOOT_INTERVAL = 1
+    PHONE_REUSE_BUILD = False
     PHONE_PING_INTERVAL = 15*60
+    PHONE_HEALTH_CHECK_WINDOW = 5*60
     PHONE_COMMAND_QUEUE_TIMEOUT = 10
 
     def __init__(self, dm, worker_num, tests, phone, options,
@@ -270,6 +292,27 @@ class PhoneWorkerSubProcess(object):
         self.jobs = None
         self.build = None
         self.last_ping = None
+        # last_ping_ip_address is True if the last ping also checked
+        # the device's network.
+        self.last_ping_ip_address = False
+        # installed_build records the sha1 of the apk installed by
+        # install_build and the package information reported by the
+        # device after it was installed.
+        self.installed_build = None
+        # jobs_since_reboot is None until the device is first rebooted.
+        self.jobs_since_reboot = None
+        # reboot_needed is set when a device error occurs during a
+        # test so that the device is rebooted before the next job.
+        self.reboot_needed = False
+        # current_job is the job being run by handle_job and
+        # prefetch_build_url is the build for the following job which
+        # the build cache server has been asked to prefetch.
+        self.current_job = None
+        self.prefetch_build_url = None
+        # post_test is the PostTestExecutor used to process crashes and
+        # submit results in the background. It is None if
+        # post_test_queue_size is 0.
+        self.post_test = None
         self.phone_status = None
         self.filehandler = None
         self.s3_bucket = None
@@ -348,8 +391,10 @@ class PhoneWorkerSubProcess(object):
         success = True
         try:
             d = posixpath.join(path, 'autophone_check_path')
-            self.dm.rm(d, recursive=True, force=True)
-            self.dm.mkdir(d, parents=True)
+            result = self.dm.shell_batch(['rm -rf %s' % d, 'mkdir %s' % d],
+                                         stop_on_error=False)[-1]
+            if result.exitcode:
+                raise ADBError('Unable to create %s: %s' % (d, result.output))
             with tempfile.NamedTemporaryFile() as tmp:
                 tmp.write('autophone test\n')
                 tmp.flush()
@@ -365,6 +410,8 @@ class PhoneWorkerSubProcess(object):
         self.loggerdeco.debug('PhoneWorkerSubProcess:reboot')
         self.update_status(phone_status=PhoneStatus.REBOOTING)
         self.dm.reboot()
+        self.jobs_since_reboot = 0
+        self.reboot_needed = False
         # Setting svc power stayon true after rebooting is necessary
         # since the setting does not survice reboots.
         self.dm.power_on()
@@ -516,8 +563,32 @@ class PhoneWorkerSubProcess(object):
             self.update_status(phone_status=PhoneStatus.OK)
 
         self.last_ping = datetime.datetime.now()
+        self.last_ping_ip_address = require_ip_address
         return msg
 
+    def check_health(self, test=None, require_ip_address=False):
+        """Checks the device's health using a cheap adb liveness check
+        if the device was found to be healthy by a ping within the last
+        phone_health_check_window seconds. Otherwise, or if the liveness
+        check fails, the device is checked with ping which attempts to
+        recover it if necessary.
+
+        Returns the ping message.
+        """
+        window = self.options.phone_health_check_window
+        if (window and self.is_ok() and self.last_ping and
+            (self.last_ping_ip_address or not require_ip_address) and
+            datetime.datetime.now() - self.last_ping <
+            datetime.timedelta(seconds=window)):
+            try:
+                state = self.dm.get_state(timeout=60)
+            except (ADBError, ADBTimeoutError):
+                state = 'missing'
+            if state == 'device':
+                return 'Phone OK'
+            self.loggerdeco.warning('Liveness check state: %s' % state)
+        return self.ping(test=test, require_ip_address=require_ip_address)
+
     def check_battery(self, test):
         if self.dm.get_battery_percentage() < self.options.device_battery_min:
             while self.dm.get_battery_percentage() < self.options.device_battery_max:
@@ -550,10 +621,68 @@ class PhoneWorkerSubProcess(object):
                 test.test_result.status = PhoneTestResult.USERCANCEL
         self.jobs.cancel_test(test_guid, device=self.phone.id)
 
+    def is_reboot_due(self):
+        """Returns True if the device should be rebooted before the next
+        job. The device is rebooted every phone_reboot_interval jobs,
+        or only after device errors if phone_reboot_interval is 0."""
+        if self.reboot_needed:
+            return True
+        interval = self.options.phone_reboot_interval
+        if interval <= 0:
+            return False
+        return (self.jobs_since_reboot is None or
+                self.jobs_since_reboot >= interval)
+
+    def get_package_info(self, app_name):
+        """Returns a dict of the version and install times of the
+        package app_name reported by dumpsys package or None if the
+        package is not installed."""
+        output = self.dm.shell_output('dumpsys package %s' % app_name)
+        for section in output.split('Package [')[1:]:
+            if not section.startswith(app_name + ']'):
+                continue
+            info = dict(re.findall(r'\b(versionCode|versionName|timeStamp|'
+                                   r'firstInstallTime|lastUpdateTime)='
+                                   r'(\S+(?: \d\d:\d\d:\d\d)?)', section))
+            if 'versionCode' in info:
+                return info
+        return None
+
+    def reuse_installed_build(self, apk_hash):
+        """Returns True if the build's apk is already installed on the
+        device, clearing the application's data so that the tests start
+        from a fresh installation."""
+        if (not self.options.phone_reuse_build or
+            not self.installed_build or
+            self.installed_build['apk_hash'] != apk_hash):
+            return False
+        app_name = self.build.app_name
+        try:
+            package_info = self.get_package_info(app_name)
+            if package_info != self.installed_build['package_info']:
+                self.loggerdeco.info('Installed package %s changed from %s '
+                                     'to %s' % (app_name,
+                                                self.installed_build['package_info'],
+                                                package_info))
+                return False
+            output = self.dm.shell_output('pm clear %s' % app_name)
+            if 'Success' not in output:
+                self.loggerdeco.warning('Unable to clear %s: %s' % (app_name,
+                                                                    output))
+                return False
+        except (ADBError, ADBTimeoutError):
+            self.loggerdeco.exception('Exception checking installed build')
+            return False
+        return True
+
     def install_build(self, job):
         ### Why are we retrying here? is it helpful at all?
         """Install the build for this job.
 
+        The uninstall and install are skipped if phone_reuse_build is
+        set and the build's apk is already installed. The device is
+        rebooted according to is_reboot_due.
+
         returns {success: Boolean, message: ''}
         """
         self.update_status(phone_status=PhoneStatus.INSTALLING,
@@ -562,23 +691,37 @@ class PhoneWorkerSubProcess(object):
         self.loggerdeco.info('Installing build %s.' % self.build.id)
         # Record start time for the install so can track how long this takes.
         start_time = datetime.datetime.now()
+        apk_path = os.path.join(self.build.dir, 'build.apk')
+        if self.options.phone_reuse_build:
+            apk_hash = utils.get_file_hash(apk_path)
+        else:
+            apk_hash = None
+        reuse = self.reuse_installed_build(apk_hash)
+        if reuse:
+            self.loggerdeco.info('Build %s is already installed.' %
+                                 self.build.id)
+        else:
+            self.installed_build = None
+        reboot = self.is_reboot_due()
         message = ''
         for attempt in range(1, self.options.phone_retry_limit+1):
             uninstalled = False
             if not self.is_ok():
                 break
             try:
-                # Uninstall all org.mozilla.(fennec|firefox) packages
-                # to make sure there are no previous installations of
-                # different versions of fennec which may interfere
-                # with the test.
-                mozilla_packages = [
-                    p.replace('package:', '') for p in
-                    self.dm.shell_output("pm list package org.mozilla").split()
-                    if re.match('package:.*(fennec|firefox)', p)]
-                for p in mozilla_packages:
-                    self.dm.uninstall_app(p)
-                self.reboot()
+                if not reuse:
+                    # Uninstall all org.mozilla.(fennec|firefox)
+                    # packages to make sure there are no previous
+                    # installations of different versions of fennec
+                    # which may interfere with the test.
+                    mozilla_packages = [
+                        p.replace('package:', '') for p in
+                        self.dm.shell_output("pm list package org.mozilla").split()
+                        if re.match('package:.*(fennec|firefox)', p)]
+                    for p in mozilla_packages:
+                        self.dm.uninstall_app(p)
+                if reboot:
+                    self.reboot()
                 uninstalled = True
                 break
             except ADBError, e:
@@ -604,16 +747,25 @@ class PhoneWorkerSubProcess(object):
             self.loggerdeco.warning('Failed to uninstall fennec.')
             return {'success': False, 'message': message}
 
+        if self.jobs_since_reboot is not None:
+            self.jobs_since_reboot += 1
+        if reuse:
+            return {'success': True, 'message': ''}
+
         message = ''
         for attempt in range(1, self.options.phone_retry_limit+1):
             if not self.is_ok():
                 break
             try:
-                self.dm.install_app(os.path.join(self.build.dir,
-                                                'build.apk'))
+                self.dm.install_app(apk_path)
                 stop_time = datetime.datetime.now()
                 self.loggerdeco.info('Install build %s elapsed time: %s' % (
                     (job['build_url'], stop_time - start_time)))
+                if self.options.phone_reuse_build:
+                    self.installed_build = {
+                        'apk_hash': apk_hash,
+                        'package_info': self.get_package_info(
+                            self.build.app_name)}
                 return {'success': True, 'message': ''}
             except ADBError, e:
                 message = 'Exception installing fennec attempt %d!\n\n%s' % (
@@ -705,6 +857,7 @@ class PhoneWorkerSubProcess(object):
                             'TEST-UNEXPECTED-FAIL',
                             message,
                             PhoneTestResult.EXCEPTION)
+                        self.reboot_needed = True
                         self.ping(test=t)
             except:
                 self.loggerdeco.exception('device error during '
@@ -713,6 +866,7 @@ class PhoneWorkerSubProcess(object):
                            t.name, traceback.format_exc()))
                 t.test_failure(t.name, 'TEST-UNEXPECTED-FAIL',
                                message, PhoneTestResult.EXCEPTION)
+                self.reboot_needed = True
                 self.ping(test=t)
 
             if (t.test_result.status != PhoneTestResult.USERCANCEL and
@@ -761,6 +915,9 @@ class PhoneWorkerSubProcess(object):
                                                job['revision_hash'],
                                                tests=[t])
 
+        if self.options.phone_reuse_build and self.installed_build:
+            # Leave the build installed for the next job.
+            return True
         try:
             if self.is_ok():
                 self.dm.uninstall_app(self.build.app_name)
@@ -783,6 +940,8 @@ class PhoneWorkerSubProcess(object):
         client = buildserver.BuildCacheClient(port=self.options.build_cache_port)
         self.update_status(phone_status=PhoneStatus.FETCHING,
                            message='%s %s' % (job['tree'], job['build_id']))
+        if job['build_url'] == self.prefetch_build_url:
+            self.prefetch_build_url = None
         test_package_names = set()
         for t in job['tests']:
             test_package_names.update(t.get_test_package_names())
@@ -798,18 +957,23 @@ class PhoneWorkerSubProcess(object):
         self.build = BuildMetadata().from_json(cache_response['metadata'])
         self.loggerdeco.info('Starting job %s.' % job['build_url'])
         starttime = datetime.datetime.now()
-        if self.run_tests(job):
-            self.loggerdeco.info('Job completed.')
-            self.jobs.job_completed(job['id'])
-        else:
-            # Decrement the job attempts so that the remaining
-            # tests aren't dropped simply due to a device error or
-            # user command.
-            job['attempts'] -= 1
-            self.loggerdeco.debug(
-                'Shutting down... Reset job id %d attempts to %d.' %
-                (job['id'], job['attempts']))
-            self.jobs.set_job_attempts(job['id'], job['attempts'])
+        self.current_job = job
+        try:
+            self.prefetch_next_build()
+            if self.run_tests(job):
+                self.loggerdeco.info('Job completed.')
+                self.jobs.job_completed(job['id'])
+            else:
+                # Decrement the job attempts so that the remaining
+                # tests aren't dropped simply due to a device error or
+                # user command.
+                job['attempts'] -= 1
+                self.loggerdeco.debug(
+                    'Shutting down... Reset job id %d attempts to %d.' %
+                    (job['id'], job['attempts']))
+                self.jobs.set_job_attempts(job['id'], job['attempts'])
+        finally:
+            self.current_job = None
         for t in self.tests:
             if t.test_result.status == PhoneTestResult.USERCANCEL:
                 self.loggerdeco.warning(
@@ -822,6 +986,51 @@ class PhoneWorkerSubProcess(object):
         stoptime = datetime.datetime.now()
         self.loggerdeco.info('Job elapsed time: %s' % (stoptime - starttime))
 
+    def prefetch_next_build(self):
+        """Asks the build cache server to fetch the build for the job
+        following the current job in the background so that it is
+        already in the cache when the job starts.
+
+        A previously requested prefetch is cancelled if the next job
+        has changed, for example after its tests have been cancelled.
+        Local builds are not prefetched since they are always
+        refetched.
+        """
+        if not self.options.build_cache_prefetch or not self.current_job:
+            return
+        try:
+            next_job = self.jobs.peek_next_job(
+                lifo=self.options.lifo, worker=self,
+                exclude_job_id=self.current_job['id'])
+            build_url = None
+            if (next_job and next_job['tests'] and
+                next_job['build_url'] != self.current_job['build_url'] and
+                urlparse.urlparse(next_job['build_url']).scheme.startswith('http')):
+                build_url = next_job['build_url']
+            if build_url == self.prefetch_build_url:
+                return
+            client = buildserver.BuildCacheClient(port=self.options.build_cache_port)
+            try:
+                if self.prefetch_build_url:
+                    self.loggerdeco.info('Cancelling prefetch of %s.' %
+                                         self.prefetch_build_url)
+                    client.cancel_prefetch(self.prefetch_build_url)
+                    self.prefetch_build_url = None
+                if build_url:
+                    self.loggerdeco.info('Prefetching %s.' % build_url)
+                    test_package_names = set()
+                    for t in next_job['tests']:
+                        test_package_names.update(t.get_test_package_names())
+                    client.prefetch(
+                        build_url,
+                        enable_unittests=next_job['enable_unittests'],
+                        test_package_names=test_package_names)
+                    self.prefetch_build_url = build_url
+            finally:
+                client.close()
+        except Exception:
+            self.loggerdeco.exception('Exception prefetching next build')
+
     def handle_cmd(self, request, current_test=None):
         """Execute the command dispatched from the Autophone process.
 
@@ -876,6 +1085,7 @@ class PhoneWorkerSubProcess(object):
             self.loggerdeco.info('Received cancel_test request %s' % list(request))
             (test_guid,) = request[1]
             self.cancel_test(test_guid)
+            self.prefetch_next_build()
             if current_test and current_test.job_guid == test_guid:
                 command['interrupt'] = True
                 command['reason'] = 'Running Job Canceled'
@@ -900,7 +1110,8 @@ class PhoneWorkerSubProcess(object):
                 if command['interrupt']:
                     return command
             except Queue.Empty:
-                reason = self.ping(test=test, require_ip_address=require_ip_address)
+                reason = self.check_health(test=test,
+                                           require_ip_address=require_ip_address)
                 if self.is_ok():
                     return {'interrupt': False,
                             'reason': '',
@@ -927,6 +1138,8 @@ class PhoneWorkerSubProcess(object):
             try:
                 self.heartbeat()
                 if self.state == ProcessStates.SHUTTINGDOWN:
+                    if self.post_test:
+                        self.post_test.stop()
                     self.update_status(phone_status=PhoneStatus.SHUTDOWN)
                     return
                 if not request:
@@ -1019,7 +1232,7 @@ class PhoneWorkerSubProcess(object):
                                        '%(phoneid)s|%(message)s')
         # Set the loggers for the imported modules
         for module in (autophonetreeherder, builds, jobs, mailer, phonetest,
-                       s3, utils):
+                       posttest, s3, utils):
             module.logger = logger
         self.loggerdeco.info('Worker: Connecting to %s...' % self.phone.id)
         # Override mozlog.logger
@@ -1047,6 +1260,12 @@ class PhoneWorkerSubProcess(object):
                                               s3_bucket=self.s3_bucket,
                                               mailer=self.mailer,
                                               shared_lock=self.shared_lock)
+        if self.options.post_test_queue_size > 0:
+            self.post_test = PostTestExecutor(
+                self,
+                self.logfile_prefix + '-posttest',
+                self.options.post_test_queue_size)
+            self.post_test.start()
         self.update_status(phone_status=PhoneStatus.IDLE)
         self.ping()
         self.main_loop()